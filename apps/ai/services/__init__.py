@@ -2,6 +2,8 @@
 try:
     from .embedding_service import EmbeddingService
     from .vector_store import VectorStore
+    from .numpy_vector_store import NumpyVectorStore
+    from .pgvector_store import PgVectorStore
     from .rag_service import RAGService
     from .chat_orchestrator import ChatOrchestrator
     RAG_AVAILABLE = True
@@ -17,6 +19,14 @@ except ImportError as e:
         def __init__(self, *args, **kwargs):
             raise ImportError("RAG dependencies not installed. Run: pip install sentence-transformers chromadb")
     
+    class NumpyVectorStore:
+        def __init__(self, *args, **kwargs):
+            raise ImportError("RAG dependencies not installed. Run: pip install sentence-transformers chromadb")
+    
+    class PgVectorStore:
+        def __init__(self, *args, **kwargs):
+            raise ImportError("RAG dependencies not installed. Run: pip install sentence-transformers chromadb")
+    
     class RAGService:
         def __init__(self, *args, **kwargs):
             raise ImportError("RAG dependencies not installed. Run: pip install sentence-transformers chromadb")
@@ -27,6 +37,28 @@ except ImportError as e:
     
     RAG_AVAILABLE = False
 
+# Contenedor de servicios compartidos por proceso
+from .container import (
+    ServiceContainer,
+    get_container,
+    get_embedding_service,
+    get_vector_store,
+    get_vector_store_for,
+    get_search_executor,
+    get_retrieval_executor,
+    get_async_vector_store,
+    get_lexical_index,
+    get_reranker,
+    get_prompt_assembler,
+    get_answer_cache,
+    shard_collection_name,
+    get_rag_service,
+    get_gemini_model,
+    get_chat_orchestrator,
+    shutdown,
+    reset,
+)
+
 # Importar procesadores de archivos (opcionales)
 try:
     from .document_processor import DocumentProcessor
@@ -57,11 +89,31 @@ except ImportError:
 __all__ = [
     'EmbeddingService',
     'VectorStore',
+    'NumpyVectorStore',
+    'PgVectorStore',
     'RAGService',
     'ChatOrchestrator',
     'DocumentProcessor',
     'AudioProcessor',
     'FileProcessor',
+    'ServiceContainer',
+    'get_container',
+    'get_embedding_service',
+    'get_vector_store',
+    'get_vector_store_for',
+    'get_search_executor',
+    'get_retrieval_executor',
+    'get_async_vector_store',
+    'get_lexical_index',
+    'get_reranker',
+    'get_prompt_assembler',
+    'get_answer_cache',
+    'shard_collection_name',
+    'get_rag_service',
+    'get_gemini_model',
+    'get_chat_orchestrator',
+    'shutdown',
+    'reset',
     'RAG_AVAILABLE',
     'PROCESSORS_AVAILABLE',
     'AUDIO_AVAILABLE',
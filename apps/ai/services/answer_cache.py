@@ -0,0 +1,320 @@
+"""
+Caché semántica de respuestas.
+
+Buena parte de las preguntas de soporte son paráfrasis de otras ya
+respondidas. Cada respuesta generada con RAG se guarda en una colección
+vectorial propia junto al embedding de la pregunta; una pregunta nueva lo
+bastante parecida, sobre las mismas bases de conocimiento y con la misma
+versión del índice, recibe la respuesta guardada sin recuperación ni LLM.
+
+La versión del índice se guarda en la caché de Django (compartida entre
+workers) y cambia con cada indexación o borrado de una base de conocimiento,
+lo que invalida las respuestas construidas con sus chunks.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import caches
+
+from .query_cache import QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+
+class IndexVersions:
+    """
+    Versión del índice de cada base de conocimiento.
+
+    Las versiones son marcas de tiempo en lugar de contadores: si la caché se
+    vacía, las versiones nuevas no coinciden con las de entradas antiguas.
+    """
+
+    KEY_PREFIX = 'kbver'
+    ALL = 'all'
+    EPOCH = 'epoch'
+
+    def __init__(self, cache_alias: str = 'default'):
+        """
+        Args:
+            cache_alias: Alias de CACHES donde se guardan las versiones.
+        """
+        self.cache_alias = cache_alias
+
+    def _key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}:{name}"
+
+    def bump(self, knowledge_base_ids: Iterable[Optional[str]]) -> None:
+        """
+        Marca como modificadas unas bases de conocimiento (y, con ellas, el
+        índice global). Los IDs None (chunks sin base) solo afectan al global.
+
+        Args:
+            knowledge_base_ids: Bases de conocimiento modificadas.
+        """
+        now = time.time_ns()
+        names = {str(kb_id) for kb_id in knowledge_base_ids if kb_id} | {self.ALL}
+        try:
+            caches[self.cache_alias].set_many({self._key(name): now for name in names}, timeout=None)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar la versión del índice: {e}")
+
+    def bump_all(self) -> None:
+        """
+        Invalida todas las versiones (vaciado completo o base desconocida).
+        """
+        try:
+            caches[self.cache_alias].set_many(
+                {self._key(self.EPOCH): time.time_ns(), self._key(self.ALL): time.time_ns()},
+                timeout=None
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar la versión del índice: {e}")
+
+    def version(self, knowledge_base_ids: Optional[List[str]] = None) -> str:
+        """
+        Versión conjunta de unas bases de conocimiento.
+
+        Args:
+            knowledge_base_ids: Bases consultadas (None = todas).
+
+        Returns:
+            Cadena que cambia si cambia cualquiera de ellas.
+        """
+        names = [self.ALL] if knowledge_base_ids is None else sorted({str(kb) for kb in knowledge_base_ids})
+        keys = [self._key(self.EPOCH)] + [self._key(name) for name in names]
+        stored = caches[self.cache_alias].get_many(keys)
+        return '.'.join(str(stored.get(key, 0)) for key in keys)
+
+
+class SemanticAnswerCache:
+    """
+    Respuestas guardadas por similitud de la pregunta.
+    """
+
+    STATS_PREFIX = 'anscache:stats'
+    STATS = ('hits', 'misses', 'stale', 'stores', 'saved_ms')
+    # Candidatos por consulta: las entradas caducadas que aparecen entre
+    # ellos se borran aunque no sean las más parecidas
+    LOOKUP_CANDIDATES = 5
+
+    def __init__(
+        self,
+        vector_store,
+        embedding_service,
+        index_versions: IndexVersions,
+        threshold: float = 0.95,
+        ttl: int = 60 * 60 * 24,
+        cache_alias: str = 'default'
+    ):
+        """
+        Inicializa la caché.
+
+        Args:
+            vector_store: Colección dedicada a las respuestas.
+            embedding_service: Servicio para codificar las preguntas.
+            index_versions: Versiones del índice de conocimiento.
+            threshold: Similitud coseno mínima con la pregunta guardada.
+            ttl: Tiempo de vida de cada respuesta en segundos.
+            cache_alias: Alias de CACHES para los contadores compartidos.
+        """
+        self.vector_store = vector_store
+        self.embedding_service = embedding_service
+        self.index_versions = index_versions
+        self.threshold = threshold
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+
+    @staticmethod
+    def scope(knowledge_base_ids: Optional[List[str]]) -> str:
+        """
+        Identificador de las bases de conocimiento consultadas.
+        """
+        if knowledge_base_ids is None:
+            return IndexVersions.ALL
+        return ','.join(sorted({str(kb) for kb in knowledge_base_ids}))
+
+    def _entry_id(self, scope: str, query: str) -> str:
+        normalized = QueryEmbeddingCache.normalize(query)
+        return hashlib.sha1(f"{scope}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def _count(self, **increments) -> None:
+        cache = caches[self.cache_alias]
+        for name, amount in increments.items():
+            key = f"{self.STATS_PREFIX}:{name}"
+            try:
+                # add() no sobrescribe: inicializa la clave sin carreras entre workers
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, int(amount))
+            except Exception as e:
+                logger.debug(f"No se pudo actualizar la métrica {name}: {e}")
+
+    def version(self, knowledge_base_ids: Optional[List[str]] = None) -> str:
+        """
+        Versión actual del índice para unas bases de conocimiento. Se toma
+        antes de recuperar, de modo que un reindexado durante la generación
+        deja la respuesta ya caducada.
+        """
+        return self.index_versions.version(knowledge_base_ids)
+
+    def _is_stale(self, metadata: Dict, version: str) -> bool:
+        return (
+            metadata.get('index_version') != version
+            or metadata.get('created_at', 0) + self.ttl < time.time()
+        )
+
+    def lookup(self, query: str, knowledge_base_ids: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Busca una respuesta guardada para una pregunta parecida.
+
+        Args:
+            query: Pregunta del usuario.
+            knowledge_base_ids: Bases de conocimiento consultadas.
+
+        Returns:
+            Diccionario con 'answer', 'chunk_ids', 'similarity', 'saved_ms' y
+            'id', o None si no hay una respuesta válida.
+        """
+        started = time.perf_counter()
+        try:
+            embedding = self.embedding_service.encode_query(query)
+            results = self.vector_store.search(
+                query_embedding=embedding.tolist(),
+                n_results=self.LOOKUP_CANDIDATES,
+                where={'scope': self.scope(knowledge_base_ids)}
+            )
+            version = self.version(knowledge_base_ids)
+            stale_ids = []
+            fresh = []
+            for i, metadata in enumerate(results['metadatas']):
+                if self._is_stale(metadata, version):
+                    stale_ids.append(results['ids'][i])
+                else:
+                    fresh.append(i)
+            # Los candidatos vienen ordenados: el primero vigente decide
+            hit = fresh[0] if fresh and 1 - results['distances'][fresh[0]] >= self.threshold else None
+            if stale_ids:
+                self.vector_store.delete_documents(stale_ids)
+                self._count(stale=len(stale_ids))
+            if hit is None:
+                self._count(misses=1)
+                return None
+        except Exception as e:
+            logger.warning(f"Caché de respuestas no disponible: {e}")
+            return None
+
+        metadata = results['metadatas'][hit]
+        similarity = 1 - results['distances'][hit]
+        lookup_ms = (time.perf_counter() - started) * 1000
+        saved_ms = max(0.0, metadata.get('latency_ms', 0) - lookup_ms)
+        self._count(hits=1, saved_ms=saved_ms)
+        return {
+            'id': results['ids'][hit],
+            'answer': metadata['answer'],
+            'chunk_ids': json.loads(metadata.get('chunk_ids') or '[]'),
+            'similarity': similarity,
+            'saved_ms': saved_ms,
+        }
+
+    def store(
+        self,
+        query: str,
+        answer: str,
+        chunk_ids: List[str],
+        index_version: str,
+        latency_ms: float,
+        knowledge_base_ids: Optional[List[str]] = None
+    ) -> None:
+        """
+        Guarda una respuesta. La misma pregunta (normalizada) sobre las
+        mismas bases reemplaza la entrada anterior.
+
+        Args:
+            query: Pregunta del usuario.
+            answer: Respuesta generada.
+            chunk_ids: Chunks usados como contexto.
+            index_version: Versión del índice tomada antes de recuperar.
+            latency_ms: Tiempo de recuperación y generación.
+            knowledge_base_ids: Bases de conocimiento consultadas.
+        """
+        scope = self.scope(knowledge_base_ids)
+        try:
+            self.vector_store.add_documents(
+                documents=[query],
+                embeddings=self.embedding_service.encode_query(query)[None, :],
+                metadatas=[{
+                    'scope': scope,
+                    'answer': answer,
+                    'chunk_ids': json.dumps(chunk_ids),
+                    'index_version': index_version,
+                    'latency_ms': float(latency_ms),
+                    'created_at': time.time(),
+                }],
+                ids=[self._entry_id(scope, query)],
+                mode='upsert'
+            )
+            self._count(stores=1)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la respuesta en caché: {e}")
+
+    def stats(self) -> Dict:
+        """
+        Retorna las métricas agregadas de todos los workers.
+
+        Returns:
+            Diccionario con hits, misses, stale, stores, saved_ms, hit_rate
+            y entradas.
+        """
+        keys = {name: f"{self.STATS_PREFIX}:{name}" for name in self.STATS}
+        stored = caches[self.cache_alias].get_many(list(keys.values()))
+        stats = {name: stored.get(key, 0) for name, key in keys.items()}
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        stats['entries'] = self.vector_store.count()
+        return stats
+
+    def reset_stats(self) -> None:
+        """
+        Pone a cero las métricas.
+        """
+        caches[self.cache_alias].delete_many([f"{self.STATS_PREFIX}:{name}" for name in self.STATS])
+
+    def purge(self, batch_size: int = 1000) -> int:
+        """
+        Elimina las respuestas caducadas: las de versiones del índice
+        anteriores a la actual y las que superan el TTL. Las búsquedas solo
+        borran las caducadas que encuentran, así que conviene ejecutarlo
+        periódicamente (answer_cache_stats --purge).
+
+        Args:
+            batch_size: Registros leídos por lote.
+
+        Returns:
+            Número de respuestas eliminadas.
+        """
+        versions = {}
+        stale_ids = []
+        for batch in self.vector_store.iter_records(batch_size=batch_size, embeddings=False):
+            for entry_id, metadata in zip(batch['ids'], batch['metadatas']):
+                scope = metadata.get('scope', IndexVersions.ALL)
+                if scope not in versions:
+                    versions[scope] = self.version(
+                        None if scope == IndexVersions.ALL else scope.split(',')
+                    )
+                if self._is_stale(metadata, versions[scope]):
+                    stale_ids.append(entry_id)
+
+        # Se borra al final: borrar mientras se pagina desplazaría los lotes
+        for start in range(0, len(stale_ids), batch_size):
+            self.vector_store.delete_documents(stale_ids[start:start + batch_size])
+        if stale_ids:
+            self._count(stale=len(stale_ids))
+        return len(stale_ids)
+
+    def clear(self) -> None:
+        """
+        Elimina todas las respuestas guardadas.
+        """
+        self.vector_store.clear()
@@ -0,0 +1,92 @@
+"""
+API asíncrona sobre los vector stores.
+
+ChromaDB 0.4 (embebido), NumPy y pgvector son síncronos, así que las
+llamadas se ejecutan en un pool de hilos acotado y dedicado
+(VECTOR_STORE_ASYNC_WORKERS) en lugar del executor por defecto del event
+loop, que comparten las escrituras en base de datos y las llamadas al LLM.
+
+Cancelar la corrutina descarta la llamada si aún espera en la cola del pool;
+una búsqueda ya en curso termina en su hilo y su resultado se descarta.
+"""
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Dict, List, Optional
+
+from django.db import close_old_connections
+
+
+def _call_and_release(fn, *args, **kwargs):
+    """
+    Ejecuta fn y libera después la conexión a la base de datos del hilo,
+    que Django no cierra fuera del ciclo de petición.
+    """
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(executor: Optional[Executor], fn, *args, **kwargs):
+    """
+    Ejecuta una función síncrona en un pool de hilos y espera su resultado.
+
+    Args:
+        executor: Pool de hilos (None usa el executor por defecto del loop).
+        fn: Función a ejecutar.
+
+    Returns:
+        Resultado de fn.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(_call_and_release, fn, *args, **kwargs)
+    )
+
+
+class AsyncVectorStore:
+    """
+    Envoltorio asíncrono de cualquier backend de vector store.
+    """
+
+    def __init__(self, vector_store, executor: Optional[Executor] = None):
+        """
+        Args:
+            vector_store: VectorStore, NumpyVectorStore o PgVectorStore.
+            executor: Pool de hilos donde se ejecutan las llamadas.
+        """
+        self.vector_store = vector_store
+        self.executor = executor
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False
+    ) -> Dict:
+        return await run_in_pool(
+            self.executor, self.vector_store.search,
+            query_embedding=query_embedding, n_results=n_results, where=where,
+            include_embeddings=include_embeddings
+        )
+
+    async def get_documents(self, ids: List[str], include_embeddings: bool = False) -> Dict:
+        return await run_in_pool(
+            self.executor, self.vector_store.get_documents, ids, include_embeddings
+        )
+
+    async def write_documents(self, documents: List[str], embeddings, **kwargs) -> Dict:
+        return await run_in_pool(
+            self.executor, self.vector_store.write_documents, documents, embeddings, **kwargs
+        )
+
+    async def delete_documents(self, ids: List[str]) -> None:
+        await run_in_pool(self.executor, self.vector_store.delete_documents, ids)
+
+    async def delete_where(self, where: Dict) -> None:
+        await run_in_pool(self.executor, self.vector_store.delete_where, where)
+
+    async def count(self) -> int:
+        return await run_in_pool(self.executor, self.vector_store.count)
@@ -1,66 +1,225 @@
+import asyncio
+import logging
+import time
 import google.generativeai as genai
-from typing import List, Dict, Optional
-from django.conf import settings
+from typing import List, Dict, Optional, Tuple
+from .async_vector_store import run_in_pool
+from .prompt_assembler import SYSTEM_PROMPT
 from .rag_service import RAGService
 from apps.chat.models import Conversation, Message
 
+logger = logging.getLogger(__name__)
+
+RAG_PROMPT_TEMPLATE = SYSTEM_PROMPT + """
+
+Contexto relevante de la base de conocimiento:
+{context}
+
+Historial de conversación:
+{history}
+
+Usuario: {question}
+
+Instrucciones:
+- Responde de manera clara, profesional y amigable
+- Usa el contexto proporcionado cuando sea relevante
+- Si no tienes información suficiente, sé honesto al respecto
+- Mantén la coherencia con el historial de la conversación
+- Ofrece soluciones prácticas cuando sea posible
+
+Asistente:"""
+
+CONVERSATION_PROMPT_TEMPLATE = SYSTEM_PROMPT + """
+
+Historial de conversación:
+{history}
+
+Usuario: {question}
+
+Instrucciones:
+- Responde de manera clara, profesional y amigable
+- Mantén la coherencia con el historial de la conversación
+- Ofrece soluciones prácticas cuando sea posible
+
+Asistente:"""
+
 
 class ChatOrchestrator:
     """
     Orquestador principal del chat que integra RAG con LLM (Gemini).
     """
     
-    def __init__(self, rag_service: Optional[RAGService] = None):
+    def __init__(
+        self,
+        rag_service: Optional[RAGService] = None,
+        model: Optional[genai.GenerativeModel] = None,
+        prompt_assembler=None,
+        answer_cache=None
+    ):
         """
         Inicializa el orquestador de chat.
         
         Args:
-            rag_service: Servicio RAG para búsqueda de contexto.
+            rag_service: Servicio RAG para búsqueda de contexto. Por defecto
+                        usa la instancia compartida del proceso.
+            model: Modelo de Gemini. Por defecto usa la instancia compartida.
+            prompt_assembler: Ensamblador de prompts. Por defecto usa el del
+                             servicio RAG.
+            answer_cache: SemanticAnswerCache opcional para responder
+                         preguntas ya respondidas sin recuperación ni LLM.
         """
-        self.rag_service = rag_service or RAGService()
+        from .container import get_rag_service, get_gemini_model
         
-        # Configurar Gemini
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.rag_service = rag_service or get_rag_service()
+        self.model = model or get_gemini_model()
+        self.prompt_assembler = prompt_assembler or self.rag_service.prompt_assembler
+        self.answer_cache = answer_cache
     
     def process_message(
         self,
         conversation_id: str,
         user_message: str,
         use_rag: bool = True,
-        n_context_docs: int = 5
+        n_context_docs: int = 5,
+        knowledge_base_ids: Optional[List[str]] = None
     ) -> Dict:
         """
         Procesa un mensaje del usuario y genera una respuesta.
+        Con caché semántica, una pregunta equivalente a otra ya respondida
+        sobre el mismo índice se responde sin recuperación ni LLM.
+        
+        Args:
+            conversation_id: ID de la conversación.
+            user_message: Mensaje del usuario.
+            use_rag: Si debe usar RAG para contexto.
+            n_context_docs: Número de documentos de contexto a recuperar.
+            knowledge_base_ids: Bases de conocimiento a consultar (None usa todas).
+            
+        Returns:
+            Diccionario con la respuesta y metadatos.
+        """
+        conversation = self._start_turn(conversation_id, user_message)
+        
+        index_version = None
+        if use_rag and self.answer_cache is not None:
+            cached = self.answer_cache.lookup(user_message, knowledge_base_ids)
+            if cached is not None:
+                return self._finish_cached_turn(conversation, cached)
+            index_version = self.answer_cache.version(knowledge_base_ids)
+        
+        started = time.perf_counter()
+        context_docs = None
+        if use_rag:
+            context_docs = self.rag_service.retrieve_context(
+                query=user_message,
+                n_results=n_context_docs,
+                knowledge_base_ids=knowledge_base_ids
+            )
+        
+        result = self._finish_turn(conversation, user_message, context_docs)
+        if index_version is not None:
+            self._cache_answer(user_message, knowledge_base_ids, index_version, result, started)
+        return result
+    
+    async def aprocess_message(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_rag: bool = True,
+        n_context_docs: int = 5,
+        knowledge_base_ids: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        Versión asíncrona de process_message. La recuperación de contexto
+        corre en el pool de recuperación en paralelo con el guardado del
+        mensaje del usuario, y se cancela si este falla o si se cancela la
+        corrutina.
         
         Args:
             conversation_id: ID de la conversación.
             user_message: Mensaje del usuario.
             use_rag: Si debe usar RAG para contexto.
             n_context_docs: Número de documentos de contexto a recuperar.
+            knowledge_base_ids: Bases de conocimiento a consultar (None usa todas).
             
         Returns:
             Diccionario con la respuesta y metadatos.
         """
+        index_version = None
+        if use_rag and self.answer_cache is not None:
+            cached = await run_in_pool(
+                self.rag_service.executor, self.answer_cache.lookup, user_message, knowledge_base_ids
+            )
+            if cached is not None:
+                conversation = await run_in_pool(None, self._start_turn, conversation_id, user_message)
+                return await run_in_pool(None, self._finish_cached_turn, conversation, cached)
+            index_version = await run_in_pool(
+                self.rag_service.executor, self.answer_cache.version, knowledge_base_ids
+            )
+        
+        started = time.perf_counter()
+        retrieval = None
+        if use_rag:
+            retrieval = asyncio.ensure_future(self.rag_service.aretrieve_context(
+                query=user_message,
+                n_results=n_context_docs,
+                knowledge_base_ids=knowledge_base_ids
+            ))
+        
+        try:
+            conversation = await run_in_pool(None, self._start_turn, conversation_id, user_message)
+            context_docs = await retrieval if retrieval is not None else None
+        except BaseException:
+            if retrieval is not None:
+                retrieval.cancel()
+            raise
+        
+        result = await run_in_pool(None, self._finish_turn, conversation, user_message, context_docs)
+        if index_version is not None:
+            await run_in_pool(
+                self.rag_service.executor, self._cache_answer,
+                user_message, knowledge_base_ids, index_version, result, started
+            )
+        return result
+    
+    def _start_turn(self, conversation_id: str, user_message: str) -> Conversation:
+        """
+        Carga la conversación y guarda el mensaje del usuario.
+        """
         try:
             conversation = Conversation.objects.get(id=conversation_id)
         except Conversation.DoesNotExist:
             raise ValueError(f"Conversación {conversation_id} no encontrada")
         
-        # Guardar mensaje del usuario
-        user_msg = Message.objects.create(
+        Message.objects.create(
             conversation=conversation,
             role='user',
             content=user_message
         )
+        return conversation
+    
+    def _finish_turn(
+        self,
+        conversation: Conversation,
+        user_message: str,
+        context_docs: Optional[List[Dict]]
+    ) -> Dict:
+        """
+        Construye el prompt, genera la respuesta y la guarda.
         
-        # Construir prompt con o sin RAG
-        if use_rag:
-            context_docs = self.rag_service.retrieve_context(
-                query=user_message,
-                n_results=n_context_docs
-            )
-            prompt = self._build_rag_prompt(user_message, context_docs, conversation)
+        Args:
+            conversation: Conversación actual.
+            user_message: Mensaje del usuario.
+            context_docs: Documentos de contexto, o None si no se usa RAG.
+            
+        Returns:
+            Diccionario con la respuesta y metadatos.
+        """
+        # Construir prompt con o sin RAG; solo se guardan los documentos que
+        # cupieron en el presupuesto de tokens
+        if context_docs is not None:
+            assembled = self._build_rag_prompt(user_message, context_docs, conversation)
+            context_docs = assembled['context_docs']
             metadata = {
                 'context_docs': [
                     {'id': doc['id'], 'score': doc['score']}
@@ -68,11 +227,13 @@ class ChatOrchestrator:
                 ]
             }
         else:
-            prompt = self._build_conversation_prompt(user_message, conversation)
+            assembled = self._build_conversation_prompt(user_message, conversation)
             metadata = {}
+        metadata['prompt_tokens'] = assembled['prompt_tokens']
+        metadata['prompt_sections'] = assembled['sections']
         
         # Generar respuesta con Gemini
-        response = self._generate_response(prompt)
+        response = self._generate_response(assembled['prompt'])
         
         # Guardar respuesta del asistente
         assistant_msg = Message.objects.create(
@@ -83,21 +244,84 @@ class ChatOrchestrator:
             tokens_used=response.get('tokens_used', 0)
         )
         
-        return {
+        result = {
             'message_id': str(assistant_msg.id),
             'content': response['text'],
             'tokens_used': response.get('tokens_used', 0),
-            'context_used': len(context_docs) if use_rag else 0
+            'context_used': len(context_docs) if context_docs is not None else 0,
+            'context_docs': metadata.get('context_docs', [])
         }
+        if 'error' in response:
+            result['error'] = response['error']
+        return result
+    
+    def _finish_cached_turn(self, conversation: Conversation, cached: Dict) -> Dict:
+        """
+        Guarda como respuesta del asistente una respuesta de la caché
+        semántica.
+        
+        Args:
+            conversation: Conversación actual.
+            cached: Resultado de SemanticAnswerCache.lookup().
+            
+        Returns:
+            Diccionario con la respuesta y metadatos.
+        """
+        context_docs = [{'id': chunk_id} for chunk_id in cached['chunk_ids']]
+        assistant_msg = Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=cached['answer'],
+            metadata={
+                'context_docs': context_docs,
+                'answer_cache': {
+                    'id': cached['id'],
+                    'similarity': cached['similarity'],
+                    'saved_ms': cached['saved_ms'],
+                }
+            }
+        )
+        
+        return {
+            'message_id': str(assistant_msg.id),
+            'content': cached['answer'],
+            'tokens_used': 0,
+            'context_used': len(context_docs),
+            'context_docs': context_docs,
+            'cached': True
+        }
+    
+    def _cache_answer(
+        self,
+        user_message: str,
+        knowledge_base_ids: Optional[List[str]],
+        index_version: str,
+        result: Dict,
+        started: float
+    ) -> None:
+        """
+        Guarda una respuesta generada con contexto en la caché semántica.
+        No se guardan los errores ni las respuestas sin contexto.
+        """
+        if 'error' in result or not result['context_docs']:
+            return
+        self.answer_cache.store(
+            query=user_message,
+            answer=result['content'],
+            chunk_ids=[doc['id'] for doc in result['context_docs']],
+            index_version=index_version,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            knowledge_base_ids=knowledge_base_ids
+        )
     
     def _build_rag_prompt(
         self,
         user_message: str,
         context_docs: List[Dict],
         conversation: Conversation
-    ) -> str:
+    ) -> Dict:
         """
-        Construye un prompt con contexto RAG.
+        Construye un prompt con contexto RAG dentro del presupuesto de tokens.
         
         Args:
             user_message: Mensaje del usuario.
@@ -105,44 +329,22 @@ class ChatOrchestrator:
             conversation: Conversación actual.
             
         Returns:
-            Prompt formateado.
+            Resultado de PromptAssembler.assemble() (prompt, tokens y
+            documentos incluidos).
         """
-        # Obtener historial de conversación
-        history = self._get_conversation_history(conversation, max_messages=5)
-        
-        # Construir contexto
-        context_parts = []
-        for doc in context_docs:
-            context_parts.append(f"- {doc['content']} (relevancia: {doc['score']:.2f})")
-        
-        context = "\n".join(context_parts)
-        
-        prompt = f"""Eres un asistente virtual experto para un proveedor de servicios de Internet (ISP).
-
-Contexto relevante de la base de conocimiento:
-{context}
-
-Historial de conversación:
-{history}
-
-Usuario: {user_message}
-
-Instrucciones:
-- Responde de manera clara, profesional y amigable
-- Usa el contexto proporcionado cuando sea relevante
-- Si no tienes información suficiente, sé honesto al respecto
-- Mantén la coherencia con el historial de la conversación
-- Ofrece soluciones prácticas cuando sea posible
-
-Asistente:"""
-        
-        return prompt
+        return self.prompt_assembler.assemble(
+            RAG_PROMPT_TEMPLATE,
+            question=user_message,
+            context_docs=context_docs,
+            history=self._get_conversation_history(conversation, max_messages=5),
+            context_format="- {content} (relevancia: {score:.2f})"
+        )
     
     def _build_conversation_prompt(
         self,
         user_message: str,
         conversation: Conversation
-    ) -> str:
+    ) -> Dict:
         """
         Construye un prompt sin RAG, solo con historial.
         
@@ -151,31 +353,19 @@ Asistente:"""
             conversation: Conversación actual.
             
         Returns:
-            Prompt formateado.
+            Resultado de PromptAssembler.assemble().
         """
-        history = self._get_conversation_history(conversation, max_messages=10)
-        
-        prompt = f"""Eres un asistente virtual experto para un proveedor de servicios de Internet (ISP).
-
-Historial de conversación:
-{history}
-
-Usuario: {user_message}
-
-Instrucciones:
-- Responde de manera clara, profesional y amigable
-- Mantén la coherencia con el historial de la conversación
-- Ofrece soluciones prácticas cuando sea posible
-
-Asistente:"""
-        
-        return prompt
+        return self.prompt_assembler.assemble(
+            CONVERSATION_PROMPT_TEMPLATE,
+            question=user_message,
+            history=self._get_conversation_history(conversation, max_messages=10)
+        )
     
     def _get_conversation_history(
         self,
         conversation: Conversation,
         max_messages: int = 10
-    ) -> str:
+    ) -> List[Tuple[str, str]]:
         """
         Obtiene el historial de la conversación.
         
@@ -184,18 +374,13 @@ Asistente:"""
             max_messages: Número máximo de mensajes a incluir.
             
         Returns:
-            Historial formateado.
+            Pares (rol, contenido) en orden cronológico.
         """
         messages = conversation.messages.filter(
             is_active=True
         ).order_by('-created_at')[:max_messages]
         
-        history_parts = []
-        for msg in reversed(list(messages)):
-            role = "Usuario" if msg.role == "user" else "Asistente"
-            history_parts.append(f"{role}: {msg.content}")
-        
-        return "\n".join(history_parts) if history_parts else "Sin historial previo"
+        return [(msg.role, msg.content) for msg in reversed(list(messages))]
     
     def _generate_response(self, prompt: str) -> Dict:
         """
@@ -0,0 +1,508 @@
+"""
+Contenedor de servicios por proceso.
+
+Mantiene una única instancia de los servicios pesados (modelo de embeddings,
+cliente de ChromaDB, modelo de Gemini) por worker, de forma que los webhooks,
+las señales, las vistas y los comandos de gestión no vuelvan a cargarlos en
+cada petición.
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from django.conf import settings
+
+
+class ServiceContainer:
+    """
+    Registro perezoso y thread-safe de servicios compartidos.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._embedding_service = None
+        self._chroma_client = None
+        self._vector_stores: Dict[str, object] = {}
+        self._rag_service = None
+        self._chat_orchestrator = None
+        self._gemini_model = None
+        self._search_executor = None
+        self._retrieval_executor = None
+        self._lexical_index = None
+        self._reranker = None
+        self._prompt_assembler = None
+        self._answer_cache = None
+
+    def get_embedding_service(self):
+        """
+        Retorna el servicio de embeddings compartido.
+
+        Returns:
+            Instancia de EmbeddingService.
+        """
+        if self._embedding_service is None:
+            with self._lock:
+                if self._embedding_service is None:
+                    from .embedding_service import EmbeddingService
+                    from .embedding_cache import EmbeddingCache
+                    from .query_cache import QueryEmbeddingCache
+                    from .projection import EmbeddingProjection, projection_dir
+                    revision = settings.EMBEDDING_MODEL_REVISION or 'main'
+                    projection = None
+                    if settings.EMBEDDING_PROJECTION:
+                        projection = EmbeddingProjection.load(
+                            projection_dir(
+                                settings.EMBEDDING_PROJECTION_DIR,
+                                settings.EMBEDDING_MODEL_NAME,
+                                revision
+                            ) / f"{settings.EMBEDDING_PROJECTION}.npz"
+                        )
+                    cache = None
+                    if settings.EMBEDDING_CACHE_ENABLED:
+                        cache = EmbeddingCache(
+                            model_name=settings.EMBEDDING_MODEL_NAME,
+                            revision=revision,
+                            cache_alias=settings.EMBEDDING_CACHE_ALIAS,
+                            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                            timeout=settings.EMBEDDING_CACHE_TIMEOUT
+                        )
+                    query_cache = None
+                    if settings.QUERY_CACHE_ENABLED:
+                        query_cache = QueryEmbeddingCache(
+                            namespace=(
+                                f"{settings.EMBEDDING_MODEL_NAME}:{revision}:"
+                                f"{projection.version if projection else 'full'}"
+                            ),
+                            max_size=settings.QUERY_CACHE_MAX_SIZE,
+                            ttl=settings.QUERY_CACHE_TTL,
+                            shared=settings.QUERY_CACHE_SHARED,
+                            cache_alias=settings.EMBEDDING_CACHE_ALIAS
+                        )
+                    self._embedding_service = EmbeddingService(
+                        model_name=settings.EMBEDDING_MODEL_NAME,
+                        revision=settings.EMBEDDING_MODEL_REVISION,
+                        cache=cache,
+                        query_cache=query_cache,
+                        use_scheduler=settings.EMBEDDING_SCHEDULER_ENABLED,
+                        max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                        batch_window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                        num_threads=settings.EMBEDDING_TORCH_THREADS,
+                        document_slice_size=settings.EMBEDDING_DOCUMENT_SLICE_SIZE,
+                        backend=settings.EMBEDDING_BACKEND,
+                        onnx_dir=settings.EMBEDDING_ONNX_DIR,
+                        parity_threshold=settings.EMBEDDING_ONNX_PARITY_THRESHOLD,
+                        projection=projection,
+                        overflow_policy=settings.EMBEDDING_OVERFLOW_POLICY
+                    )
+        return self._embedding_service
+
+    def get_chroma_client(self):
+        """
+        Retorna el cliente persistente de ChromaDB compartido.
+
+        Returns:
+            Instancia de chromadb.PersistentClient.
+        """
+        if self._chroma_client is None:
+            with self._lock:
+                if self._chroma_client is None:
+                    import chromadb
+                    from chromadb.config import Settings
+                    self._chroma_client = chromadb.PersistentClient(
+                        path=str(settings.CHROMA_DB_PATH),
+                        settings=Settings(anonymized_telemetry=False)
+                    )
+        return self._chroma_client
+
+    def get_vector_store(self, collection_name: Optional[str] = None):
+        """
+        Retorna el vector store compartido para una colección.
+
+        Args:
+            collection_name: Nombre de la colección. Por defecto usa
+                            CHROMA_COLLECTION_NAME.
+
+        Returns:
+            Instancia de VectorStore, NumpyVectorStore o PgVectorStore
+            según VECTOR_STORE_BACKEND.
+        """
+        name = collection_name or settings.CHROMA_COLLECTION_NAME
+        store = self._vector_stores.get(name)
+        if store is None:
+            with self._lock:
+                store = self._vector_stores.get(name)
+                if store is None:
+                    backend = settings.VECTOR_STORE_BACKEND
+                    if backend == 'numpy':
+                        from .numpy_vector_store import NumpyVectorStore
+                        store = NumpyVectorStore(
+                            collection_name=name,
+                            path=settings.NUMPY_VECTOR_STORE_PATH
+                        )
+                    elif backend == 'pgvector':
+                        from .pgvector_store import PgVectorStore
+                        store = PgVectorStore(
+                            collection_name=name,
+                            ef_search=settings.PGVECTOR_EF_SEARCH or None
+                        )
+                    elif backend == 'chroma':
+                        from .vector_store import VectorStore
+                        store = VectorStore(
+                            collection_name=name,
+                            client=self.get_chroma_client(),
+                            hnsw=hnsw_params(name)
+                        )
+                    else:
+                        raise ValueError(f"VECTOR_STORE_BACKEND no soportado: {backend}")
+                    self._vector_stores[name] = store
+        return store
+
+    def get_vector_store_for(self, knowledge_base_id: Optional[str] = None):
+        """
+        Retorna el vector store que contiene una base de conocimiento: su
+        shard si VECTOR_STORE_SHARDING='knowledge_base', o la colección global.
+
+        Args:
+            knowledge_base_id: ID de la base de conocimiento.
+
+        Returns:
+            Instancia de vector store.
+        """
+        if knowledge_base_id and settings.VECTOR_STORE_SHARDING == 'knowledge_base':
+            return self.get_vector_store(shard_collection_name(knowledge_base_id))
+        return self.get_vector_store()
+
+    def get_lexical_index(self):
+        """
+        Retorna el índice léxico compartido, o None si la recuperación
+        híbrida está desactivada.
+
+        Returns:
+            Instancia de LexicalIndex o None.
+        """
+        if not settings.HYBRID_SEARCH_ENABLED:
+            return None
+        if self._lexical_index is None:
+            with self._lock:
+                if self._lexical_index is None:
+                    from .lexical_index import LexicalIndex
+                    self._lexical_index = LexicalIndex(
+                        collection_name=f"{settings.CHROMA_COLLECTION_NAME}_lexical"
+                    )
+        return self._lexical_index
+
+    def get_reranker(self):
+        """
+        Retorna el cross-encoder compartido, o None si el reranking está
+        desactivado.
+
+        Returns:
+            Instancia de CrossEncoderReranker o None.
+        """
+        if not settings.RAG_RERANK_ENABLED:
+            return None
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from .reranker import CrossEncoderReranker
+                    self._reranker = CrossEncoderReranker(
+                        model_name=settings.RAG_RERANK_MODEL,
+                        revision=settings.RAG_RERANK_MODEL_REVISION or None,
+                        max_batch_size=settings.RAG_RERANK_BATCH_SIZE,
+                        cache_alias=settings.EMBEDDING_CACHE_ALIAS,
+                        cache_timeout=settings.RAG_RERANK_CACHE_TIMEOUT
+                    )
+        return self._reranker
+
+    def get_prompt_assembler(self):
+        """
+        Retorna el ensamblador de prompts compartido por RAGService y
+        ChatOrchestrator.
+
+        Returns:
+            Instancia de PromptAssembler.
+        """
+        if self._prompt_assembler is None:
+            with self._lock:
+                if self._prompt_assembler is None:
+                    from .prompt_assembler import PromptAssembler
+                    self._prompt_assembler = PromptAssembler(
+                        embedding_service=self.get_embedding_service(),
+                        max_tokens=settings.PROMPT_MAX_TOKENS,
+                        max_context_tokens=settings.PROMPT_MAX_CONTEXT_TOKENS,
+                        max_history_tokens=settings.PROMPT_MAX_HISTORY_TOKENS
+                    )
+        return self._prompt_assembler
+
+    def get_answer_cache(self):
+        """
+        Retorna la caché semántica de respuestas, o None si está desactivada.
+
+        Returns:
+            Instancia de SemanticAnswerCache o None.
+        """
+        if not settings.ANSWER_CACHE_ENABLED:
+            return None
+        if self._answer_cache is None:
+            with self._lock:
+                if self._answer_cache is None:
+                    from .answer_cache import SemanticAnswerCache
+                    self._answer_cache = SemanticAnswerCache(
+                        vector_store=self.get_vector_store(settings.ANSWER_CACHE_COLLECTION),
+                        embedding_service=self.get_embedding_service(),
+                        index_versions=self.get_rag_service().index_versions,
+                        threshold=settings.ANSWER_CACHE_THRESHOLD,
+                        ttl=settings.ANSWER_CACHE_TTL,
+                        cache_alias=settings.EMBEDDING_CACHE_ALIAS
+                    )
+        return self._answer_cache
+
+    def get_search_executor(self) -> ThreadPoolExecutor:
+        """
+        Retorna el pool de hilos acotado para búsquedas en paralelo.
+
+        Returns:
+            Instancia de ThreadPoolExecutor.
+        """
+        if self._search_executor is None:
+            with self._lock:
+                if self._search_executor is None:
+                    self._search_executor = ThreadPoolExecutor(
+                        max_workers=settings.VECTOR_STORE_SEARCH_WORKERS,
+                        thread_name_prefix='vector-search'
+                    )
+        return self._search_executor
+
+    def get_retrieval_executor(self) -> ThreadPoolExecutor:
+        """
+        Retorna el pool de hilos acotado de la API asíncrona de recuperación.
+        Es distinto del de búsquedas porque cada recuperación reparte a su
+        vez trabajo en ese pool.
+
+        Returns:
+            Instancia de ThreadPoolExecutor.
+        """
+        if self._retrieval_executor is None:
+            with self._lock:
+                if self._retrieval_executor is None:
+                    self._retrieval_executor = ThreadPoolExecutor(
+                        max_workers=settings.VECTOR_STORE_ASYNC_WORKERS,
+                        thread_name_prefix='rag-retrieval'
+                    )
+        return self._retrieval_executor
+
+    def get_async_vector_store(self, collection_name: Optional[str] = None):
+        """
+        Retorna la API asíncrona del vector store de una colección.
+
+        Args:
+            collection_name: Nombre de la colección.
+
+        Returns:
+            Instancia de AsyncVectorStore.
+        """
+        from .async_vector_store import AsyncVectorStore
+        return AsyncVectorStore(
+            self.get_vector_store(collection_name),
+            executor=self.get_retrieval_executor()
+        )
+
+    def get_rag_service(self):
+        """
+        Retorna el servicio RAG compartido.
+
+        Returns:
+            Instancia de RAGService.
+        """
+        if self._rag_service is None:
+            with self._lock:
+                if self._rag_service is None:
+                    from .answer_cache import IndexVersions
+                    from .rag_service import RAGService
+                    self._rag_service = RAGService(
+                        embedding_service=self.get_embedding_service(),
+                        vector_store=self.get_vector_store(),
+                        shard_by_knowledge_base=(
+                            settings.VECTOR_STORE_SHARDING == 'knowledge_base'
+                        ),
+                        lexical_index=self.get_lexical_index(),
+                        hybrid_candidates=settings.HYBRID_CANDIDATES,
+                        rrf_k=settings.HYBRID_RRF_K,
+                        executor=self.get_retrieval_executor(),
+                        mmr_lambda=settings.RAG_MMR_LAMBDA,
+                        mmr_candidates=settings.RAG_MMR_CANDIDATES,
+                        mmr_max_encode=settings.RAG_MMR_MAX_ENCODE,
+                        merge_adjacent=settings.RAG_MERGE_ADJACENT_CHUNKS,
+                        reranker=self.get_reranker(),
+                        rerank_candidates=settings.RAG_RERANK_CANDIDATES,
+                        rerank_threshold=settings.RAG_RERANK_THRESHOLD,
+                        prompt_assembler=self.get_prompt_assembler(),
+                        index_versions=IndexVersions(cache_alias=settings.EMBEDDING_CACHE_ALIAS),
+                        window_size=settings.RAG_WINDOW_SIZE
+                    )
+        return self._rag_service
+
+    def get_gemini_model(self):
+        """
+        Retorna el modelo de Gemini compartido.
+
+        Returns:
+            Instancia de genai.GenerativeModel.
+        """
+        if self._gemini_model is None:
+            with self._lock:
+                if self._gemini_model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=settings.GEMINI_API_KEY)
+                    self._gemini_model = genai.GenerativeModel(
+                        settings.GEMINI_MODEL_NAME
+                    )
+        return self._gemini_model
+
+    def get_chat_orchestrator(self):
+        """
+        Retorna el orquestador de chat compartido.
+
+        Returns:
+            Instancia de ChatOrchestrator.
+        """
+        if self._chat_orchestrator is None:
+            with self._lock:
+                if self._chat_orchestrator is None:
+                    from .chat_orchestrator import ChatOrchestrator
+                    self._chat_orchestrator = ChatOrchestrator(
+                        rag_service=self.get_rag_service(),
+                        model=self.get_gemini_model(),
+                        prompt_assembler=self.get_prompt_assembler(),
+                        answer_cache=self.get_answer_cache()
+                    )
+        return self._chat_orchestrator
+
+    def shutdown(self) -> None:
+        """
+        Libera todas las instancias. La siguiente llamada a un getter las
+        vuelve a crear.
+        """
+        with self._lock:
+            if self._embedding_service is not None:
+                try:
+                    self._embedding_service.close()
+                except Exception:
+                    pass
+            if self._chroma_client is not None:
+                try:
+                    self._chroma_client.clear_system_cache()
+                except Exception:
+                    pass
+            if self._search_executor is not None:
+                self._search_executor.shutdown(wait=False)
+            if self._retrieval_executor is not None:
+                self._retrieval_executor.shutdown(wait=False)
+            self._chat_orchestrator = None
+            self._rag_service = None
+            self._vector_stores = {}
+            self._chroma_client = None
+            self._embedding_service = None
+            self._gemini_model = None
+            self._search_executor = None
+            self._retrieval_executor = None
+            self._lexical_index = None
+            self._reranker = None
+            self._prompt_assembler = None
+            self._answer_cache = None
+
+    def reset(self) -> None:
+        """
+        Alias de shutdown() pensado para aislar tests.
+        """
+        self.shutdown()
+
+
+def hnsw_params(collection_name: str) -> Dict[str, int]:
+    """
+    Parámetros HNSW de una colección: los globales CHROMA_HNSW_* con las
+    sobrescrituras de CHROMA_HNSW_COLLECTIONS.
+    """
+    params = {
+        'M': settings.CHROMA_HNSW_M,
+        'construction_ef': settings.CHROMA_HNSW_CONSTRUCTION_EF,
+        'search_ef': settings.CHROMA_HNSW_SEARCH_EF,
+    }
+    params.update(settings.CHROMA_HNSW_COLLECTIONS.get(collection_name, {}))
+    return params
+
+
+def shard_collection_name(knowledge_base_id: str) -> str:
+    """
+    Nombre de la colección de una base de conocimiento cuando hay sharding.
+    """
+    return f"{settings.CHROMA_COLLECTION_NAME}_kb_{uuid.UUID(str(knowledge_base_id)).hex}"
+
+
+_container = ServiceContainer()
+
+
+def get_container() -> ServiceContainer:
+    """Retorna el contenedor de servicios del proceso."""
+    return _container
+
+
+def get_embedding_service():
+    return _container.get_embedding_service()
+
+
+def get_vector_store(collection_name: Optional[str] = None):
+    return _container.get_vector_store(collection_name)
+
+
+def get_vector_store_for(knowledge_base_id: Optional[str] = None):
+    return _container.get_vector_store_for(knowledge_base_id)
+
+
+def get_lexical_index():
+    return _container.get_lexical_index()
+
+
+def get_reranker():
+    return _container.get_reranker()
+
+
+def get_prompt_assembler():
+    return _container.get_prompt_assembler()
+
+
+def get_answer_cache():
+    return _container.get_answer_cache()
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    return _container.get_search_executor()
+
+
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    return _container.get_retrieval_executor()
+
+
+def get_async_vector_store(collection_name: Optional[str] = None):
+    return _container.get_async_vector_store(collection_name)
+
+
+def get_rag_service():
+    return _container.get_rag_service()
+
+
+def get_gemini_model():
+    return _container.get_gemini_model()
+
+
+def get_chat_orchestrator():
+    return _container.get_chat_orchestrator()
+
+
+def shutdown() -> None:
+    _container.shutdown()
+
+
+def reset() -> None:
+    _container.reset()
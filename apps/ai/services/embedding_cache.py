@@ -0,0 +1,233 @@
+"""
+Caché persistente de embeddings direccionada por contenido.
+
+Cada vector se guarda como bytes float32 bajo una clave derivada de
+(modelo, revisión, sha256 del texto normalizado), de modo que un reindexado
+completo solo envía al modelo los chunks cuyo texto realmente cambió.
+"""
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings sobre el backend de caché de Django (Redis).
+
+    El desalojo es LRU acotado por número de entradas: con django-redis se
+    mantiene un sorted set con el último acceso de cada clave y se eliminan
+    las más antiguas al superar max_entries. Con otros backends se delega en
+    el timeout y en la política propia del backend (p. ej. MAX_ENTRIES de
+    locmem), y stats() no puede informar del número de entradas.
+    """
+
+    KEY_PREFIX = 'emb'
+
+    def __init__(
+        self,
+        model_name: str,
+        revision: str = 'main',
+        cache_alias: str = 'default',
+        max_entries: int = 200000,
+        timeout: Optional[int] = None
+    ):
+        """
+        Inicializa la caché.
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+            revision: Revisión del modelo; forma parte de la clave.
+            cache_alias: Alias de CACHES a utilizar.
+            max_entries: Número máximo de vectores a conservar.
+            timeout: Tiempo de vida en segundos (None = sin expiración).
+        """
+        self.model_name = model_name
+        self.revision = revision
+        self.cache_alias = cache_alias
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._redis_client = None
+        self._redis_checked = False
+        self._namespace = f"{self.KEY_PREFIX}:{model_name}:{revision}"
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normaliza el texto sin alterar lo que ve el tokenizer
+        (forma Unicode NFC y espacios de los extremos).
+        """
+        return unicodedata.normalize('NFC', text).strip()
+
+    def make_key(self, text: str) -> str:
+        """
+        Genera la clave de caché de un texto.
+
+        Args:
+            text: Texto original.
+
+        Returns:
+            Clave de caché.
+        """
+        digest = hashlib.sha256(self.normalize(text).encode('utf-8')).hexdigest()
+        return f"{self._namespace}:{digest}"
+
+    def get_many(self, texts: List[str], dimension: int) -> Dict[int, np.ndarray]:
+        """
+        Busca los embeddings de varios textos.
+
+        Args:
+            texts: Textos a buscar.
+            dimension: Dimensión esperada de los vectores.
+
+        Returns:
+            Diccionario {posición en texts: vector} con los aciertos.
+        """
+        keys = [self.make_key(text) for text in texts]
+        try:
+            stored = self.cache.get_many(list(set(keys)))
+        except Exception as e:
+            logger.warning(f"Caché de embeddings no disponible: {e}")
+            stored = {}
+
+        found = {}
+        for i, key in enumerate(keys):
+            raw = stored.get(key)
+            if raw is not None and len(raw) == dimension * 4:
+                found[i] = np.frombuffer(raw, dtype=np.float32)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        if found:
+            self._touch([keys[i] for i in found])
+
+        return found
+
+    def set_many(self, texts: List[str], embeddings: np.ndarray) -> None:
+        """
+        Guarda los embeddings de varios textos.
+
+        Args:
+            texts: Textos.
+            embeddings: Matriz de embeddings en el mismo orden.
+        """
+        if not texts:
+            return
+
+        data = {
+            self.make_key(text): np.asarray(emb, dtype=np.float32).tobytes()
+            for text, emb in zip(texts, embeddings)
+        }
+        try:
+            self.cache.set_many(data, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"No se pudo escribir en la caché de embeddings: {e}")
+            return
+
+        self._touch(list(data.keys()))
+        self._evict()
+
+    def stats(self) -> Dict:
+        """
+        Retorna los contadores de la caché.
+
+        Returns:
+            Diccionario con hits, misses, hit_rate y entradas.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self._size(),
+            'max_entries': self.max_entries,
+        }
+
+    def clear(self) -> None:
+        """
+        Elimina todas las entradas de este modelo y revisión. Sin django-redis
+        no hay índice de claves: las entradas caducan por timeout.
+        """
+        redis = self._redis()
+        if redis is None:
+            logger.warning(
+                f"La caché '{self.cache_alias}' no es django-redis: "
+                f"no se pueden enumerar los embeddings para borrarlos"
+            )
+            return
+        index_key = self._index_key()
+        keys = [k.decode() if isinstance(k, bytes) else k for k in redis.zrange(index_key, 0, -1)]
+        if keys:
+            self.cache.delete_many(keys)
+        redis.delete(index_key)
+
+    def _redis(self):
+        """
+        Retorna la conexión Redis cruda si el backend es django-redis. Se
+        comprueba una sola vez: con otros backends el LRU queda desactivado.
+        """
+        if not self._redis_checked:
+            try:
+                from django_redis import get_redis_connection
+                self._redis_client = get_redis_connection(self.cache_alias)
+            except Exception as e:
+                logger.info(
+                    f"Caché de embeddings sin desalojo LRU (el backend de "
+                    f"'{self.cache_alias}' no es django-redis: {e})"
+                )
+            self._redis_checked = True
+        return self._redis_client
+
+    def _index_key(self) -> str:
+        return self.cache.make_key(f"{self._namespace}:lru")
+
+    def _touch(self, keys: List[str]) -> None:
+        redis = self._redis()
+        if redis is None:
+            return
+        now = time.time()
+        try:
+            redis.zadd(self._index_key(), {key: now for key in keys})
+        except Exception as e:
+            logger.debug(f"No se pudo actualizar el índice LRU: {e}")
+
+    def _evict(self) -> None:
+        redis = self._redis()
+        if redis is None or not self.max_entries:
+            return
+        try:
+            index_key = self._index_key()
+            overflow = redis.zcard(index_key) - self.max_entries
+            if overflow <= 0:
+                return
+            evicted = redis.zpopmin(index_key, overflow)
+            keys = [k.decode() if isinstance(k, bytes) else k for k, _ in evicted]
+            if keys:
+                self.cache.delete_many(keys)
+        except Exception as e:
+            logger.debug(f"No se pudo desalojar la caché de embeddings: {e}")
+
+    def _size(self) -> Optional[int]:
+        redis = self._redis()
+        if redis is None:
+            return None
+        try:
+            return redis.zcard(self._index_key())
+        except Exception:
+            return None
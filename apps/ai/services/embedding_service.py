@@ -1,48 +1,248 @@
 from sentence_transformers import SentenceTransformer
-from typing import List, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import logging
+import threading
 import numpy as np
 
+from .embedding_cache import EmbeddingCache
+from .query_cache import QueryEmbeddingCache
+from .inference_scheduler import InferenceScheduler
+from . import similarity as sim
+from .projection import EmbeddingProjection
+
+logger = logging.getLogger(__name__)
+
 
 class EmbeddingService:
     """
     Servicio para generar embeddings de texto usando Sentence Transformers.
     """
     
-    def __init__(self, model_name: str = 'paraphrase-multilingual-MiniLM-L12-v2'):
+    BACKENDS = ('torch', 'onnx', 'onnx-int8')
+    OVERFLOW_POLICIES = ('truncate', 'split')
+    
+    def __init__(
+        self,
+        model_name: str = 'paraphrase-multilingual-MiniLM-L12-v2',
+        revision: Optional[str] = None,
+        cache: Optional[EmbeddingCache] = None,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        use_scheduler: bool = False,
+        max_batch_size: int = 32,
+        batch_window_ms: float = 5.0,
+        num_threads: int = 0,
+        document_slice_size: int = 2048,
+        backend: str = 'torch',
+        onnx_dir: Optional[str] = None,
+        parity_threshold: float = 0.98,
+        projection: Optional[EmbeddingProjection] = None,
+        overflow_policy: str = 'truncate'
+    ):
         """
         Inicializa el servicio de embeddings.
         
         Args:
             model_name: Nombre del modelo de Sentence Transformers.
                        Por defecto usa un modelo multilingüe optimizado para español.
+            revision: Revisión del modelo en el Hub (branch, tag o commit).
+            cache: Caché persistente de embeddings opcional.
+            query_cache: Caché LRU de consultas frecuentes opcional.
+            use_scheduler: Si debe enrutar la inferencia por un hilo dedicado
+                          con micro-batching y prioridades.
+            max_batch_size: Número máximo de textos por forward pass.
+            batch_window_ms: Ventana para agrupar consultas concurrentes.
+            num_threads: Hilos intra-op de torch (0 = no modificar).
+            document_slice_size: Documentos por porción en encode_documents.
+            backend: 'torch', 'onnx' u 'onnx-int8'.
+            onnx_dir: Directorio donde exportar/cargar el grafo ONNX.
+            parity_threshold: Coseno mínimo frente a torch para aceptar ONNX.
+            projection: Proyección opcional a menos dimensiones, aplicada por
+                       igual a documentos y consultas.
+            overflow_policy: Qué hacer con documentos que superan el límite de
+                            tokens del modelo: 'truncate' (se recortan y se
+                            reportan) o 'split' (se dividen en ventanas y se
+                            promedian sus embeddings).
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Backend de embeddings no soportado: {backend}")
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Política de desbordamiento no soportada: {overflow_policy}")
+        
+        self.model_name = model_name
+        self.revision = revision or 'main'
+        self.model = SentenceTransformer(model_name, revision=revision)
+        self.model_dimension = self.model.get_sentence_embedding_dimension()
+        if projection is not None and projection.source_dimension != self.model_dimension:
+            raise ValueError(
+                f"La proyección espera {projection.source_dimension} dimensiones "
+                f"y el modelo produce {self.model_dimension}"
+            )
+        self.projection = projection
+        self.dimension = projection.dimension if projection is not None else self.model_dimension
+        self.tokenizer = self.model.tokenizer
+        # Tokens de contenido que caben en una entrada (sin [CLS]/[SEP])
+        self.max_seq_length = self.model.max_seq_length
+        self.max_tokens = self.max_seq_length - self.tokenizer.num_special_tokens_to_add()
+        self.overflow_policy = overflow_policy
+        self._overflow_lock = threading.Lock()
+        self.overflow = {'inputs': 0, 'overflowed': 0, 'tokens_dropped': 0}
+        self.max_batch_size = max_batch_size
+        self.document_slice_size = document_slice_size
+        self.backend = 'torch'
+        self.onnx_encoder = None
+        if backend != 'torch':
+            self._load_onnx_backend(backend, onnx_dir, parity_threshold, num_threads)
+        self.cache = cache
+        self.query_cache = query_cache
+        self.scheduler = None
+        if use_scheduler:
+            self.scheduler = InferenceScheduler(
+                encode_fn=self._run_model,
+                max_batch_size=max_batch_size,
+                batch_window_ms=batch_window_ms,
+                num_threads=num_threads
+            )
+            self.scheduler.start()
+    
+    def _load_onnx_backend(
+        self,
+        backend: str,
+        onnx_dir: Optional[str],
+        parity_threshold: float,
+        num_threads: int
+    ) -> None:
+        """
+        Carga el backend ONNX y verifica su paridad con torch.
+        Si la exportación o la paridad fallan se mantiene torch.
+        
+        Args:
+            backend: 'onnx' u 'onnx-int8'.
+            onnx_dir: Directorio base de los grafos exportados.
+            parity_threshold: Coseno mínimo aceptado.
+            num_threads: Hilos intra-op de ONNX Runtime.
         """
-        self.model = SentenceTransformer(model_name)
-        self.dimension = self.model.get_sentence_embedding_dimension()
+        from .onnx_backend import (
+            OnnxEncoder, PARITY_SAMPLES, check_parity, onnx_export_dir
+        )
+        
+        try:
+            encoder = OnnxEncoder(
+                self.model,
+                export_dir=onnx_export_dir(onnx_dir or './onnx_models', self.model_name, self.revision),
+                quantize=backend == 'onnx-int8',
+                num_threads=num_threads
+            )
+            min_cosine = check_parity(
+                self._run_model(PARITY_SAMPLES),
+                encoder.encode(PARITY_SAMPLES),
+                parity_threshold
+            )
+        except Exception as e:
+            logger.error(f"Backend {backend} no disponible, usando torch: {e}")
+            return
+        
+        logger.info(f"Backend de embeddings {backend} activo (coseno mínimo {min_cosine:.4f})")
+        self.onnx_encoder = encoder
+        self.backend = backend
+        # Liberar los pesos de torch: ONNX Runtime solo necesita el tokenizer
+        self.model = None
     
-    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        use_cache: bool = True,
+        priority: str = InferenceScheduler.BULK,
+        normalize: bool = False,
+        project: bool = True
+    ) -> np.ndarray:
         """
         Genera embeddings para uno o más textos.
+        Si hay caché configurada, solo los textos no cacheados pasan por el modelo.
         
         Args:
             texts: Texto o lista de textos a vectorizar.
+            use_cache: Si debe consultar y poblar la caché de embeddings.
+            priority: Carril del planificador ('query' o 'bulk').
+            normalize: Si debe retornar vectores con norma L2 unitaria, de
+                      modo que la similitud coseno sea un producto punto.
+            project: Si debe aplicar la proyección configurada. Con False se
+                    obtienen los vectores en la dimensión original del modelo.
             
         Returns:
-            Array de embeddings.
+            Array de embeddings en el mismo orden que texts.
         """
+        embeddings = self._encode(texts, use_cache, priority)
+        if project and self.projection is not None:
+            embeddings = self.projection.transform(embeddings)
+        return sim.normalize_rows(embeddings) if normalize else embeddings
+    
+    def _encode(
+        self,
+        texts: Union[str, List[str]],
+        use_cache: bool,
+        priority: str
+    ) -> np.ndarray:
         if isinstance(texts, str):
             texts = [texts]
         
-        embeddings = self.model.encode(
+        if self.cache is None or not use_cache or not texts:
+            return self._encode_with_model(texts, priority)
+        
+        cached = self.cache.get_many(texts, self.model_dimension)
+        if len(cached) == len(texts):
+            return np.stack([cached[i] for i in range(len(texts))])
+        
+        miss_positions = [i for i in range(len(texts)) if i not in cached]
+        miss_texts = [texts[i] for i in miss_positions]
+        computed = self._encode_with_model(miss_texts, priority).astype(np.float32, copy=False)
+        self.cache.set_many(miss_texts, computed)
+        
+        embeddings = np.empty((len(texts), self.model_dimension), dtype=np.float32)
+        for i, emb in cached.items():
+            embeddings[i] = emb
+        embeddings[miss_positions] = computed
+        
+        return embeddings
+    
+    def _encode_with_model(self, texts: List[str], priority: str) -> np.ndarray:
+        """
+        Vectoriza textos con el modelo, a través del planificador si existe.
+        
+        Args:
+            texts: Lista de textos.
+            priority: Carril del planificador.
+            
+        Returns:
+            Array de embeddings.
+        """
+        if self.scheduler is not None and texts:
+            return self.scheduler.encode(texts, priority)
+        return self._run_model(texts)
+    
+    def _run_model(self, texts: List[str]) -> np.ndarray:
+        """
+        Ejecuta el modelo sobre una lista de textos.
+        
+        Args:
+            texts: Lista de textos.
+            
+        Returns:
+            Array de embeddings.
+        """
+        if self.onnx_encoder is not None:
+            return self.onnx_encoder.encode(texts, batch_size=self.max_batch_size)
+        return self.model.encode(
             texts,
+            batch_size=self.max_batch_size,
             convert_to_numpy=True,
             show_progress_bar=False
         )
-        
-        return embeddings
     
     def encode_query(self, query: str) -> np.ndarray:
         """
         Genera embedding para una consulta de búsqueda.
+        Las consultas repetidas (tras normalizar mayúsculas, acentos y
+        espacios) se sirven desde la caché de consultas.
         
         Args:
             query: Texto de la consulta.
@@ -50,7 +250,21 @@ class EmbeddingService:
         Returns:
             Embedding de la consulta.
         """
-        return self.encode(query)[0]
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        
+        embedding = self.encode(
+            query,
+            use_cache=False,
+            priority=InferenceScheduler.QUERY
+        )[0]
+        
+        if self.query_cache is not None:
+            self.query_cache.set(query, embedding)
+        
+        return embedding
     
     def encode_documents(self, documents: List[str]) -> np.ndarray:
         """
@@ -62,7 +276,209 @@ class EmbeddingService:
         Returns:
             Array de embeddings.
         """
-        return self.encode(documents)
+        embeddings = np.empty((len(documents), self.dimension), dtype=np.float32)
+        for start, chunk in self.iter_encode_documents(documents):
+            embeddings[start:start + len(chunk)] = chunk
+        return embeddings
+    
+    def iter_encode_documents(
+        self,
+        documents: List[str],
+        slice_size: Optional[int] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Genera embeddings por porciones consecutivas de la entrada.
+        Cada porción se tokeniza para medirla: los textos que superan el
+        límite del modelo se recortan (o dividen, según overflow_policy) antes
+        de llegar al modelo, y se ordenan por longitud en tokens para que cada
+        lote de max_batch_size agrupe textos similares y casi no tenga
+        padding; después se restaura el orden original. El modelo vuelve a
+        tokenizar los fragmentos al codificarlos (SentenceTransformer.encode
+        y el encoder ONNX solo aceptan texto); la tokenización previa es
+        barata frente a la inferencia.
+        
+        Args:
+            documents: Lista de documentos.
+            slice_size: Documentos por porción (por defecto document_slice_size).
+            
+        Yields:
+            Tuplas (posición inicial, embeddings de la porción).
+        """
+        slice_size = slice_size or self.document_slice_size
+        for start in range(0, len(documents), slice_size):
+            texts = documents[start:start + slice_size]
+            pieces, owners, lengths = self._fit_to_model(texts)
+            
+            order = np.argsort(lengths, kind='stable')
+            sorted_embeddings = self.encode([pieces[i] for i in order])
+            piece_embeddings = np.empty((len(pieces), self.dimension), dtype=np.float32)
+            piece_embeddings[order] = sorted_embeddings
+            
+            if len(pieces) == len(texts):
+                yield start, piece_embeddings
+                continue
+            
+            # Promediar las ventanas de los textos divididos
+            embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+            np.add.at(embeddings, owners, piece_embeddings)
+            embeddings /= np.bincount(owners, minlength=len(texts))[:, None]
+            yield start, embeddings
+    
+    def _fit_to_model(self, texts: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Ajusta los textos al límite de tokens del modelo. Una sola pasada del
+        tokenizer (con offsets) sirve para medir, recortar y dividir.
+        
+        Args:
+            texts: Lista de textos.
+            
+        Returns:
+            Tupla (fragmentos, índice del texto de origen de cada fragmento,
+            longitud en tokens de cada fragmento).
+        """
+        if not texts or not getattr(self.tokenizer, 'is_fast', False):
+            return list(texts), np.arange(len(texts)), self.token_lengths(texts)
+        
+        encoded = self._tokenize(texts, offsets=True)
+        pieces, owners, lengths = [], [], []
+        overflowed = 0
+        dropped = 0
+        for i, (text, offsets) in enumerate(zip(texts, encoded['offset_mapping'])):
+            n_tokens = len(offsets)
+            if n_tokens <= self.max_tokens:
+                pieces.append(text)
+                owners.append(i)
+                lengths.append(n_tokens)
+                continue
+            
+            overflowed += 1
+            if self.overflow_policy == 'split':
+                windows = self._windows(text, offsets, self.max_tokens)
+                pieces.extend(windows)
+                owners.extend([i] * len(windows))
+                lengths.extend([self.max_tokens] * len(windows))
+            else:
+                dropped += n_tokens - self.max_tokens
+                pieces.append(text[:offsets[self.max_tokens - 1][1]])
+                owners.append(i)
+                lengths.append(self.max_tokens)
+        
+        with self._overflow_lock:
+            self.overflow['inputs'] += len(texts)
+            self.overflow['overflowed'] += overflowed
+            self.overflow['tokens_dropped'] += dropped
+        if overflowed:
+            logger.warning(
+                f"{overflowed}/{len(texts)} textos superan el límite de {self.max_tokens} "
+                f"tokens del modelo ({self.overflow_policy}, {dropped} tokens descartados)"
+            )
+        
+        return pieces, np.asarray(owners, dtype=np.int64), np.asarray(lengths, dtype=np.int64)
+    
+    @staticmethod
+    def _windows(text: str, offsets: List[Tuple[int, int]], size: int, overlap: int = 0) -> List[str]:
+        """
+        Corta un texto en ventanas de como máximo size tokens.
+        """
+        step = max(1, size - overlap)
+        windows = []
+        for start in range(0, len(offsets), step):
+            window = offsets[start:start + size]
+            windows.append(text[window[0][0]:window[-1][1]])
+            if start + size >= len(offsets):
+                break
+        return windows
+    
+    def _tokenize(self, texts: List[str], offsets: bool = False) -> Dict:
+        """
+        Tokeniza sin truncar ni añadir tokens especiales.
+        """
+        return self.tokenizer(
+            list(texts),
+            add_special_tokens=False,
+            truncation=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            return_offsets_mapping=offsets,
+            verbose=False
+        )
+    
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """
+        Cuenta los tokens de cada texto (sin truncar), incluidos los tokens
+        especiales. Permite a los llamadores trocear por tokens en lugar de
+        por caracteres.
+        
+        Args:
+            texts: Lista de textos.
+            
+        Returns:
+            Array de enteros con el número de tokens.
+        """
+        if not texts:
+            return np.zeros(0, dtype=np.int64)
+        encoded = self._tokenize(texts)
+        special = self.tokenizer.num_special_tokens_to_add()
+        return np.fromiter(
+            (len(ids) + special for ids in encoded['input_ids']),
+            dtype=np.int64,
+            count=len(texts)
+        )
+    
+    def split_by_tokens(
+        self,
+        text: str,
+        max_tokens: Optional[int] = None,
+        overlap: int = 0
+    ) -> List[str]:
+        """
+        Divide un texto en fragmentos de como máximo max_tokens tokens.
+        
+        Args:
+            text: Texto a dividir.
+            max_tokens: Tokens por fragmento (por defecto el límite del modelo).
+            overlap: Tokens compartidos entre fragmentos consecutivos.
+            
+        Returns:
+            Lista de fragmentos de texto.
+        """
+        max_tokens = min(max_tokens or self.max_tokens, self.max_tokens)
+        if not text:
+            return []
+        offsets = self._tokenize([text], offsets=True)['offset_mapping'][0]
+        if len(offsets) <= max_tokens:
+            return [text]
+        return [w.strip() for w in self._windows(text, offsets, max_tokens, overlap)]
+    
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """
+        Recorta un texto a sus primeros max_tokens tokens (sin tokens
+        especiales). A diferencia de split_by_tokens no está limitado por
+        max_seq_length del modelo: sirve para presupuestos de prompt.
+        
+        Args:
+            text: Texto a recortar.
+            max_tokens: Tokens máximos del resultado.
+            
+        Returns:
+            Prefijo del texto que cabe en max_tokens.
+        """
+        if not text or max_tokens <= 0:
+            return ''
+        offsets = self._tokenize([text], offsets=True)['offset_mapping'][0]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]].strip()
+    
+    def overflow_stats(self) -> Dict:
+        """
+        Retorna cuántas entradas superaron el límite de tokens del modelo.
+        
+        Returns:
+            Diccionario con inputs, overflowed, tokens_dropped y max_tokens.
+        """
+        with self._overflow_lock:
+            return {**self.overflow, 'max_tokens': self.max_tokens, 'policy': self.overflow_policy}
     
     def similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
@@ -77,3 +493,80 @@ class EmbeddingService:
         """
         return float(np.dot(embedding1, embedding2) / 
                     (np.linalg.norm(embedding1) * np.linalg.norm(embedding2)))
+    
+    def similarity_matrix(
+        self,
+        embeddings1: np.ndarray,
+        embeddings2: Optional[np.ndarray] = None,
+        normalized: bool = False
+    ) -> np.ndarray:
+        """
+        Calcula la similitud coseno entre todos los pares de dos matrices.
+        
+        Args:
+            embeddings1: Matriz (n, d).
+            embeddings2: Matriz (m, d). Si es None se usa embeddings1.
+            normalized: Si las filas ya están normalizadas (ver encode(normalize=True)).
+            
+        Returns:
+            Matriz (n, m) de similitudes.
+        """
+        return sim.similarity_matrix(embeddings1, embeddings2, normalized=normalized)
+    
+    def top_k_similar(
+        self,
+        queries: np.ndarray,
+        corpus: np.ndarray,
+        k: int = 5,
+        normalized: bool = False,
+        chunk_size: int = 1024,
+        exclude_self: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Obtiene los k elementos del corpus más similares a cada consulta,
+        calculando por bloques para no materializar una matriz N×N.
+        
+        Args:
+            queries: Matriz (n, d) de consultas.
+            corpus: Matriz (m, d) de candidatos.
+            k: Número de vecinos por consulta.
+            normalized: Si las filas ya están normalizadas.
+            chunk_size: Consultas por bloque.
+            exclude_self: Ignorar la diagonal cuando queries es el corpus.
+            
+        Returns:
+            Tupla (índices, scores) de forma (n, k), de mayor a menor similitud.
+        """
+        return sim.top_k(
+            queries,
+            corpus,
+            k,
+            normalized=normalized,
+            chunk_size=chunk_size,
+            exclude_self=exclude_self
+        )
+    
+    def cache_stats(self) -> Optional[dict]:
+        """
+        Retorna las estadísticas de la caché de embeddings.
+        
+        Returns:
+            Diccionario de estadísticas o None si no hay caché.
+        """
+        return self.cache.stats() if self.cache is not None else None
+    
+    def query_cache_stats(self) -> Optional[dict]:
+        """
+        Retorna las estadísticas de la caché de consultas.
+        
+        Returns:
+            Diccionario de estadísticas o None si no hay caché.
+        """
+        return self.query_cache.stats() if self.query_cache is not None else None
+    
+    def close(self) -> None:
+        """
+        Detiene el hilo de inferencia si está en uso.
+        """
+        if self.scheduler is not None:
+            self.scheduler.stop()
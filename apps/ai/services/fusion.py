@@ -0,0 +1,38 @@
+"""
+Fusión de rankings de distintas vías de recuperación.
+"""
+from typing import Dict, List
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict]], k: int = 60) -> List[Dict]:
+    """
+    Combina varios rankings con Reciprocal Rank Fusion:
+    score(d) = Σ peso / (k + posición de d en cada ranking).
+
+    Solo usa posiciones, así que no hace falta calibrar entre sí las
+    similitudes coseno y los ranks de ts_rank_cd.
+
+    Args:
+        rankings: Nombre de la vía -> documentos ordenados. Cada documento
+                  necesita 'id' y puede traer 'weight' (por defecto 1.0).
+                  Si un documento aparece en varias vías se conservan los
+                  campos de la primera.
+        k: Constante de suavizado (60 en el artículo original).
+
+    Returns:
+        Documentos ordenados por 'rrf_score', con la posición en cada vía en
+        'ranks'.
+    """
+    fused: Dict[str, Dict] = {}
+    for source, docs in rankings.items():
+        for position, doc in enumerate(docs, start=1):
+            entry = fused.get(doc['id'])
+            if entry is None:
+                entry = {key: value for key, value in doc.items() if key != 'weight'}
+                entry['rrf_score'] = 0.0
+                entry['ranks'] = {}
+                fused[doc['id']] = entry
+            entry['rrf_score'] += doc.get('weight', 1.0) / (k + position)
+            entry['ranks'][source] = position
+
+    return sorted(fused.values(), key=lambda doc: doc['rrf_score'], reverse=True)
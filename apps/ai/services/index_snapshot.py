@@ -0,0 +1,276 @@
+"""
+Snapshots portables del vector store.
+
+Un snapshot es un tar (opcionalmente .tar.gz) que se escribe y se lee en
+streaming, sin cargar el índice completo en memoria:
+
+    header.json             Formato, versión, modelo de embeddings, dimensión y dtype.
+    part-00000.json         Conteo y SHA-256 de los dos ficheros siguientes.
+    part-00000.npy          Matriz (n, dimensión) float16 o float32.
+    part-00000.jsonl        Un registro {'id', 'document', 'metadata'} por línea.
+    ...
+    manifest.json           Total de registros, partes y SHA-256 encadenado.
+
+Permite arrancar o recuperar un nodo sin volver a extraer y vectorizar todo
+el corpus (ver export_vector_index / import_vector_index).
+"""
+import hashlib
+import io
+import json
+import tarfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+FORMAT = 'knowbot-vector-index'
+FORMAT_VERSION = 1
+DTYPES = ('float16', 'float32')
+
+
+class SnapshotError(Exception):
+    """El snapshot está corrupto o no es compatible."""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def embedding_signature(embedding_service) -> Dict:
+    """
+    Identifica el espacio vectorial de un servicio de embeddings: dos índices
+    solo son intercambiables si coinciden modelo, revisión y proyección.
+
+    Args:
+        embedding_service: Instancia de EmbeddingService.
+
+    Returns:
+        Diccionario con 'embedding_model', 'embedding_revision',
+        'projection' y 'dimension'.
+    """
+    projection = embedding_service.projection
+    return {
+        'embedding_model': embedding_service.model_name,
+        'embedding_revision': embedding_service.revision,
+        'projection': projection.version if projection is not None else None,
+        'dimension': embedding_service.dimension,
+    }
+
+
+def check_compatible(header: Dict, signature: Dict) -> None:
+    """
+    Verifica que un snapshot se generó con el mismo espacio vectorial.
+
+    Raises:
+        SnapshotError: Si difiere el modelo, la revisión, la proyección o
+                       la dimensión.
+    """
+    for key in ('embedding_model', 'embedding_revision', 'projection', 'dimension'):
+        if header.get('dimension') is None and key == 'dimension':
+            continue
+        if header.get(key) != signature[key]:
+            raise SnapshotError(
+                f"El snapshot no es compatible: {key}={header.get(key)!r}, "
+                f"configurado {signature[key]!r}"
+            )
+
+
+class SnapshotWriter:
+    """
+    Escribe un snapshot parte a parte.
+    """
+
+    def __init__(self, path: str, header: Dict, dtype: str = 'float32'):
+        """
+        Args:
+            path: Ruta del archivo (.tar o .tar.gz).
+            header: Metadatos del índice (modelo, revisión, proyección...).
+            dtype: Precisión de los vectores guardados: 'float16' o 'float32'.
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype no soportado: {dtype}")
+        self.path = str(path)
+        self.dtype = dtype
+        self.header = dict(header)
+        self.count = 0
+        self.parts = 0
+        self._chain = hashlib.sha256()
+        self._header_written = False
+        mode = 'w:gz' if self.path.endswith('.gz') else 'w'
+        self._tar = tarfile.open(self.path, mode)
+
+    def _add(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _write_header(self, dimension: Optional[int]) -> None:
+        header = {
+            **self.header,
+            'format': FORMAT,
+            'version': FORMAT_VERSION,
+            'dimension': dimension,
+            'dtype': self.dtype,
+        }
+        self._add('header.json', json.dumps(header, ensure_ascii=False).encode('utf-8'))
+        self.header = header
+        self._header_written = True
+
+    def write_batch(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict],
+        embeddings: np.ndarray
+    ) -> None:
+        """
+        Añade un lote de registros como una parte del snapshot.
+        """
+        if not ids:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not self._header_written:
+            self._write_header(int(embeddings.shape[1]))
+        elif embeddings.shape[1] != self.header['dimension']:
+            raise SnapshotError(
+                f"Dimensión {embeddings.shape[1]} distinta de la del snapshot ({self.header['dimension']})"
+            )
+
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings.astype(self.dtype), allow_pickle=False)
+        vectors = buffer.getvalue()
+        records = ''.join(
+            json.dumps({'id': id, 'document': document, 'metadata': metadata or {}}, ensure_ascii=False) + '\n'
+            for id, document, metadata in zip(ids, documents, metadatas)
+        ).encode('utf-8')
+
+        name = f"part-{self.parts:05d}"
+        meta = {
+            'count': len(ids),
+            'vectors_sha256': _sha256(vectors),
+            'records_sha256': _sha256(records),
+        }
+        self._add(f"{name}.json", json.dumps(meta).encode('utf-8'))
+        self._add(f"{name}.npy", vectors)
+        self._add(f"{name}.jsonl", records)
+
+        self._chain.update(meta['vectors_sha256'].encode())
+        self._chain.update(meta['records_sha256'].encode())
+        self.count += len(ids)
+        self.parts += 1
+
+    def close(self) -> Dict:
+        """
+        Escribe el manifiesto y cierra el archivo.
+
+        Returns:
+            Manifiesto escrito.
+        """
+        if not self._header_written:
+            self._write_header(None)
+        manifest = {'count': self.count, 'parts': self.parts, 'sha256': self._chain.hexdigest()}
+        self._add('manifest.json', json.dumps(manifest).encode('utf-8'))
+        self._tar.close()
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._tar.close()
+
+
+class SnapshotReader:
+    """
+    Lee un snapshot en streaming verificando cada parte antes de entregarla.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Ruta del archivo (.tar o .tar.gz).
+        """
+        self.path = str(path)
+        self._tar = tarfile.open(self.path, 'r|*')
+        self._members = iter(self._tar)
+        self.header = json.loads(self._read('header.json'))
+        if self.header.get('format') != FORMAT:
+            raise SnapshotError("El archivo no es un snapshot de vector store")
+        if self.header.get('version') != FORMAT_VERSION:
+            raise SnapshotError(
+                f"Versión de snapshot no soportada: {self.header.get('version')} "
+                f"(se esperaba {FORMAT_VERSION})"
+            )
+        self.manifest: Optional[Dict] = None
+
+    def _next_member(self) -> tarfile.TarInfo:
+        try:
+            return next(self._members)
+        except StopIteration:
+            raise SnapshotError("Snapshot truncado: falta el manifiesto")
+
+    def _read(self, expected_name: Optional[str] = None, member: Optional[tarfile.TarInfo] = None) -> bytes:
+        member = member or self._next_member()
+        if expected_name and member.name != expected_name:
+            raise SnapshotError(f"Se esperaba {expected_name} y se encontró {member.name}")
+        return self._tar.extractfile(member).read()
+
+    def iter_batches(self) -> Iterator[Dict]:
+        """
+        Recorre las partes del snapshot.
+
+        Yields:
+            Diccionarios con 'ids', 'documents', 'metadatas' y 'embeddings'
+            (matriz float32).
+        """
+        chain = hashlib.sha256()
+        count = 0
+        parts = 0
+        while True:
+            member = self._next_member()
+            if member.name == 'manifest.json':
+                self.manifest = json.loads(self._read(member=member))
+                break
+
+            name = member.name.rsplit('.', 1)[0]
+            meta = json.loads(self._read(f"{name}.json", member))
+            vectors = self._read(f"{name}.npy")
+            records = self._read(f"{name}.jsonl")
+            if _sha256(vectors) != meta['vectors_sha256'] or _sha256(records) != meta['records_sha256']:
+                raise SnapshotError(f"Checksum incorrecto en {name}")
+
+            embeddings = np.load(io.BytesIO(vectors), allow_pickle=False).astype(np.float32)
+            rows = [json.loads(line) for line in records.decode('utf-8').splitlines()]
+            if len(rows) != meta['count'] or embeddings.shape[0] != meta['count']:
+                raise SnapshotError(f"Conteo incorrecto en {name}")
+
+            chain.update(meta['vectors_sha256'].encode())
+            chain.update(meta['records_sha256'].encode())
+            count += len(rows)
+            parts += 1
+            yield {
+                'ids': [row['id'] for row in rows],
+                'documents': [row['document'] for row in rows],
+                'metadatas': [row['metadata'] for row in rows],
+                'embeddings': embeddings
+            }
+
+        if (
+            self.manifest.get('count') != count
+            or self.manifest.get('parts') != parts
+            or self.manifest.get('sha256') != chain.hexdigest()
+        ):
+            raise SnapshotError("El manifiesto no coincide con el contenido del snapshot")
+
+    def close(self) -> None:
+        self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
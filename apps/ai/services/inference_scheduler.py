@@ -0,0 +1,233 @@
+"""
+Planificador de inferencia con micro-batching y carriles de prioridad.
+
+Todas las llamadas al modelo de embeddings de un proceso pasan por un único
+hilo dedicado. Las consultas concurrentes del chat se agrupan en un solo
+forward pass dentro de una ventana corta, y siempre se atienden antes que los
+lotes de indexación, que se procesan por porciones de max_batch_size.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """Petición de embeddings pendiente dentro de un carril."""
+
+    __slots__ = ('texts', 'future', 'taken', 'done', 'parts')
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+        self.taken = 0
+        self.done = 0
+        self.parts: List[np.ndarray] = []
+
+    @property
+    def pending(self) -> int:
+        return len(self.texts) - self.taken
+
+
+class InferenceScheduler:
+    """
+    Ejecutor de inferencia dedicado con dos carriles: consultas (alta
+    prioridad) e ingesta (baja prioridad).
+    """
+
+    QUERY = 'query'
+    BULK = 'bulk'
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        batch_window_ms: float = 5.0,
+        num_threads: int = 0
+    ):
+        """
+        Inicializa el planificador.
+
+        Args:
+            encode_fn: Función que ejecuta el modelo sobre una lista de textos.
+            max_batch_size: Número máximo de textos por forward pass.
+            batch_window_ms: Ventana de espera para agrupar consultas.
+            num_threads: Hilos intra-op de torch (0 = no modificar).
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000.0
+        self.num_threads = num_threads
+        self._lanes: Dict[str, deque] = {self.QUERY: deque(), self.BULK: deque()}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.batches = 0
+        self.batched_texts = 0
+
+    def start(self) -> None:
+        """
+        Arranca el hilo de inferencia si no está en marcha.
+        """
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._configure_threads()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='embedding-inference',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Detiene el hilo tras completar las peticiones pendientes.
+
+        Args:
+            timeout: Segundos máximos de espera.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, texts: List[str], priority: str = BULK) -> Future:
+        """
+        Encola textos para vectorizar.
+
+        Args:
+            texts: Lista de textos.
+            priority: QUERY para el chat en vivo, BULK para indexación.
+
+        Returns:
+            Future que se resuelve con el array de embeddings en orden.
+        """
+        if priority not in self._lanes:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result(np.empty((0, 0), dtype=np.float32))
+            return request.future
+
+        if not self._running:
+            self.start()
+
+        with self._cond:
+            self._lanes[priority].append(request)
+            self._cond.notify_all()
+
+        return request.future
+
+    def encode(self, texts: List[str], priority: str = BULK) -> np.ndarray:
+        """
+        Versión bloqueante de submit().
+        """
+        return self.submit(texts, priority).result()
+
+    def stats(self) -> Dict:
+        """
+        Retorna contadores del planificador.
+        """
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'batched_texts': self.batched_texts,
+                'avg_batch_size': self.batched_texts / self.batches if self.batches else 0.0,
+                'pending_query': sum(r.pending for r in self._lanes[self.QUERY]),
+                'pending_bulk': sum(r.pending for r in self._lanes[self.BULK]),
+            }
+
+    def _configure_threads(self) -> None:
+        if not self.num_threads:
+            return
+        try:
+            import torch
+            torch.set_num_threads(self.num_threads)
+        except Exception as e:
+            logger.warning(f"No se pudo configurar los hilos de torch: {e}")
+
+    def _pending(self, lane: str) -> int:
+        return sum(r.pending for r in self._lanes[lane])
+
+    def _next_batch(self) -> Tuple[str, List[Tuple[_Request, int, int]]]:
+        """
+        Espera trabajo y forma el siguiente lote. Debe llamarse con el lock.
+        """
+        while self._running and not self._lanes[self.QUERY] and not self._lanes[self.BULK]:
+            self._cond.wait()
+
+        lane = self.QUERY if self._lanes[self.QUERY] else self.BULK
+        if not self._lanes[lane]:
+            return lane, []
+
+        # Dar una ventana corta para que lleguen más consultas concurrentes
+        if lane == self.QUERY and self.batch_window > 0:
+            deadline = time.monotonic() + self.batch_window
+            while self._running and self._pending(lane) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        batch = []
+        capacity = self.max_batch_size
+        queue = self._lanes[lane]
+        while queue and capacity > 0:
+            request = queue[0]
+            n = min(capacity, request.pending)
+            batch.append((request, request.taken, request.taken + n))
+            request.taken += n
+            capacity -= n
+            if request.pending == 0:
+                queue.popleft()
+
+        return lane, batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                lane, batch = self._next_batch()
+                if not batch:
+                    if not self._running:
+                        return
+                    continue
+
+            texts = [t for request, start, end in batch for t in request.texts[start:end]]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                logger.error(f"Error en inferencia de embeddings: {e}")
+                with self._cond:
+                    for request, _, _ in batch:
+                        if request in self._lanes[lane]:
+                            self._lanes[lane].remove(request)
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                continue
+
+            with self._cond:
+                self.batches += 1
+                self.batched_texts += len(texts)
+
+            offset = 0
+            for request, start, end in batch:
+                if request.future.done():
+                    offset += end - start
+                    continue
+                request.parts.append(embeddings[offset:offset + end - start])
+                request.done += end - start
+                offset += end - start
+                if request.done == len(request.texts):
+                    result = request.parts[0] if len(request.parts) == 1 else np.concatenate(request.parts)
+                    request.future.set_result(result)
@@ -0,0 +1,191 @@
+"""
+Índice léxico de chunks sobre la búsqueda de texto completo de PostgreSQL.
+
+Complementa la búsqueda vectorial en consultas con números de modelo,
+nombres de planes o códigos de error que el modelo de embeddings ordena mal.
+Los chunks se copian a document_chunks (colección '<colección>_lexical') con
+un tsvector en español indexado con GIN, sea cual sea el backend vectorial,
+de modo que la búsqueda léxica sigue respondiendo si el vector store falla.
+"""
+import re
+from typing import Dict, List, Optional
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Coalesce
+
+from .pgvector_store import PgVectorStore, uuid_or_none, where_to_q
+
+_TERM = re.compile(r'\w[\w\-./]*\w|\w', re.UNICODE)
+
+
+class LexicalIndex:
+    """
+    Búsqueda por palabras clave con ranking ts_rank_cd.
+    """
+
+    CONFIG = 'spanish'
+    MAX_TERMS = 16
+    DEFAULT_BATCH_SIZE = 1000
+
+    def __init__(self, collection_name: str = "knowbot_knowledge_lexical"):
+        """
+        Inicializa el índice.
+
+        Args:
+            collection_name: Colección de document_chunks donde se guardan
+                            las copias de texto.
+        """
+        from apps.vectors.models import DocumentChunk
+
+        self.model = DocumentChunk
+        self.name = collection_name
+
+    def _queryset(self):
+        return self.model.objects.filter(collection=self.name)
+
+    def index(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict]] = None
+    ) -> None:
+        """
+        Inserta o reemplaza chunks y recalcula su tsvector.
+
+        Args:
+            ids: IDs de los chunks (los mismos que en el vector store).
+            documents: Textos de los chunks.
+            metadatas: Metadatos de cada chunk. Si es None se conservan los
+                      de los chunks existentes.
+        """
+        update_fields = ['content', 'updated_at']
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+        else:
+            update_fields += ['document', 'knowledge_base', 'chunk_index', 'metadata']
+
+        with transaction.atomic():
+            for start in range(0, len(ids), self.DEFAULT_BATCH_SIZE):
+                end = start + self.DEFAULT_BATCH_SIZE
+                rows = [
+                    self.model(
+                        collection=self.name,
+                        vector_id=id,
+                        document_id=uuid_or_none(metadata.get('document_id')),
+                        knowledge_base_id=uuid_or_none(metadata.get('knowledge_base_id')),
+                        chunk_index=metadata.get('chunk_index'),
+                        content=document,
+                        metadata=metadata
+                    )
+                    for id, document, metadata in zip(
+                        ids[start:end], documents[start:end],
+                        (m or {} for m in metadatas[start:end])
+                    )
+                ]
+                self.model.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['collection', 'vector_id'],
+                    update_fields=update_fields
+                )
+                self._queryset().filter(vector_id__in=ids[start:end]).update(
+                    search_vector=SearchVector('content', config=self.CONFIG)
+                )
+
+    def _build_query(self, query: str) -> Optional[SearchQuery]:
+        """
+        Une los términos de la consulta con OR: en preguntas en lenguaje
+        natural exigir todos los términos (AND) casi nunca devuelve nada, y
+        ts_rank_cd ya premia los chunks que contienen más términos.
+        """
+        terms = list(dict.fromkeys(t.lower() for t in _TERM.findall(query)))[:self.MAX_TERMS]
+        if not terms:
+            return None
+        search_query = SearchQuery(terms[0], config=self.CONFIG, search_type='plain')
+        for term in terms[1:]:
+            search_query |= SearchQuery(term, config=self.CONFIG, search_type='plain')
+        return search_query
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        knowledge_base_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Busca chunks por palabras clave.
+
+        Args:
+            query: Consulta del usuario.
+            n_results: Número de resultados.
+            where: Filtros opcionales de metadatos.
+            knowledge_base_ids: Bases de conocimiento en las que buscar.
+
+        Returns:
+            Lista ordenada de chunks con 'id', 'content', 'metadata', 'rank'
+            y 'lexical_weight' (peso de su base de conocimiento).
+        """
+        search_query = self._build_query(query)
+        if search_query is None:
+            return []
+
+        queryset = (
+            self._queryset()
+            .filter(search_vector=search_query)
+            .filter(Q(document__isnull=True) | Q(document__is_active=True))
+            .filter(where_to_q(where or {}, PgVectorStore.COLUMNS))
+        )
+        if knowledge_base_ids is not None:
+            queryset = queryset.filter(knowledge_base_id__in=knowledge_base_ids)
+
+        rows = (
+            queryset
+            .annotate(
+                rank=SearchRank(F('search_vector'), search_query, cover_density=True, normalization=Value(32)),
+                lexical_weight=Coalesce(
+                    F('knowledge_base__lexical_weight'), Value(1.0), output_field=FloatField()
+                )
+            )
+            .order_by('-rank')
+            .values('vector_id', 'content', 'metadata', 'rank', 'lexical_weight')[:n_results]
+        )
+        return [
+            {
+                'id': row['vector_id'],
+                'content': row['content'],
+                'metadata': row['metadata'],
+                'rank': float(row['rank']),
+                'lexical_weight': float(row['lexical_weight']),
+            }
+            for row in rows
+        ]
+
+    def delete(self, ids: List[str]) -> None:
+        """
+        Elimina chunks del índice.
+
+        Args:
+            ids: IDs de los chunks.
+        """
+        self._queryset().filter(vector_id__in=ids).delete()
+
+    def delete_where(self, where: Dict) -> None:
+        """
+        Elimina los chunks que cumplen un filtro de metadatos.
+
+        Args:
+            where: Filtro de metadatos.
+        """
+        self._queryset().filter(where_to_q(where, PgVectorStore.COLUMNS)).delete()
+
+    def clear(self) -> None:
+        """
+        Vacía el índice.
+        """
+        self._queryset().delete()
+
+    def count(self) -> int:
+        return self._queryset().count()
@@ -0,0 +1,762 @@
+"""
+Vector store exacto en proceso sobre NumPy.
+
+Para bases de conocimiento pequeñas y medianas (hasta unos cientos de miles
+de chunks) una búsqueda exacta con un producto matriz-vector es más rápida
+que el índice HNSW de ChromaDB y no necesita SQLite. Los vectores se guardan
+normalizados en un .npy mapeado en memoria y los textos y metadatos en un
+log JSONL que se compacta periódicamente.
+
+Estructura en disco (<path>/<colección>/):
+    records.jsonl     Cabecera (con un log_id único) + operaciones 'put' /
+                      'delete' en orden.
+    vectors-<n>.npy   Matriz float32 (capacidad, dimensión) de la generación n.
+    .lock             Lock de escritura entre procesos.
+"""
+import json
+import operator as op
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class NumpyVectorStore:
+    """
+    Implementación de la interfaz de VectorStore con búsqueda exacta.
+    """
+
+    DEFAULT_BATCH_SIZE = 5000
+    WRITE_MODES = ('skip', 'upsert')
+    INITIAL_CAPACITY = 1024
+    LOG_NAME = 'records.jsonl'
+    RANGE_OPERATORS = {'$gt': op.gt, '$gte': op.ge, '$lt': op.lt, '$lte': op.le}
+
+    def __init__(
+        self,
+        collection_name: str = "knowbot_knowledge",
+        path: Optional[str] = None
+    ):
+        """
+        Inicializa el vector store.
+
+        Args:
+            collection_name: Nombre de la colección (subdirectorio).
+            path: Directorio raíz. Por defecto usa NUMPY_VECTOR_STORE_PATH.
+        """
+        root = path or getattr(settings, 'NUMPY_VECTOR_STORE_PATH', './numpy_vectors')
+        self.name = collection_name
+        self.directory = Path(root) / collection_name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._log_signature = None
+        self._log_offset = 0
+        self._reset_state()
+        with self._lock:
+            self._refresh()
+
+    def _reset_state(self) -> None:
+        self._vectors_file: Optional[str] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._dimension: Optional[int] = None
+        self._rows = 0
+        self._valid = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._free_rows: Set[int] = set()
+        self._postings: Dict[Tuple[str, str, Any], Set[int]] = {}
+        self._mask_cache: Dict[str, np.ndarray] = {}
+        self._log_records = 0
+        # Cambia con cada modificación del estado (ver search)
+        self._state_version = getattr(self, '_state_version', 0) + 1
+
+    @property
+    def _log_path(self) -> Path:
+        return self.directory / self.LOG_NAME
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.DEFAULT_BATCH_SIZE
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self._dimension
+
+    def _open_vectors(self, filename: str) -> None:
+        self._vectors_file = filename
+        self._vectors = np.load(self.directory / filename, mmap_mode='r+')
+        self._dimension = self._vectors.shape[1]
+        capacity = self._vectors.shape[0]
+        if len(self._valid) < capacity:
+            extra = capacity - len(self._valid)
+            self._valid = np.concatenate([self._valid, np.zeros(extra, dtype=bool)])
+            self._ids.extend([None] * extra)
+            self._documents.extend([None] * extra)
+            self._metadatas.extend([None] * extra)
+
+    def _apply(self, record: Dict) -> None:
+        """
+        Aplica una línea del log al estado en memoria.
+        """
+        op = record['op']
+        if op == 'header':
+            self._reset_state()
+            self._rows = record['rows']
+            self._open_vectors(record['vectors'])
+            return
+
+        self._log_records += 1
+        self._state_version += 1
+        if op == 'put':
+            row = record['row']
+            previous = self._id_to_row.get(record['id'])
+            if previous is not None and previous != row:
+                self._release_row(previous)
+            if self._valid[row]:
+                self._unindex(row)
+            self._ids[row] = record['id']
+            self._documents[row] = record['document']
+            self._metadatas[row] = record['metadata'] or {}
+            self._valid[row] = True
+            self._id_to_row[record['id']] = row
+            self._index(row)
+            self._rows = max(self._rows, row + 1)
+            self._free_rows.discard(row)
+        elif op == 'delete':
+            row = self._id_to_row.get(record['id'])
+            if row is not None:
+                self._release_row(row)
+
+    def _release_row(self, row: int) -> None:
+        self._unindex(row)
+        self._id_to_row.pop(self._ids[row], None)
+        self._valid[row] = False
+        self._ids[row] = None
+        self._documents[row] = None
+        self._metadatas[row] = None
+        self._free_rows.add(row)
+
+    @staticmethod
+    def _posting_key(key: str, value) -> Tuple[str, str, Any]:
+        """
+        Clave del índice invertido. Incluye el tipo del valor porque True, 1
+        y 1.0 son iguales en Python pero ChromaDB no los confunde.
+        """
+        return key, type(value).__name__, value
+
+    def _index(self, row: int) -> None:
+        for key, value in self._metadatas[row].items():
+            if isinstance(value, (str, int, float, bool)):
+                self._postings.setdefault(self._posting_key(key, value), set()).add(row)
+
+    def _unindex(self, row: int) -> None:
+        for key, value in (self._metadatas[row] or {}).items():
+            if not isinstance(value, (str, int, float, bool)):
+                continue
+            posting_key = self._posting_key(key, value)
+            rows = self._postings.get(posting_key)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._postings[posting_key]
+
+    def _refresh(self) -> None:
+        """
+        Relee el log si otro proceso lo modificó: solo la cola si creció, o
+        completo si es otro log (compactado, o vaciado y vuelto a crear). Cada
+        log se identifica por el log_id de su cabecera, no por el inodo, que
+        el sistema de archivos puede reutilizar.
+        """
+        try:
+            log = open(self._log_path, 'rb')
+        except FileNotFoundError:
+            if self._log_signature is not None:
+                self._reset_state()
+                self._log_signature = None
+                self._log_offset = 0
+            return
+
+        with log:
+            stat = os.fstat(log.fileno())
+            header = log.readline()
+            if not header.endswith(b'\n'):
+                return  # Cabecera a medio escribir
+            # Logs anteriores al log_id: el inodo, junto con la comprobación
+            # de tamaño
+            log_id = json.loads(header).get('log_id') or f"ino-{stat.st_ino}"
+
+            if log_id == self._log_signature and stat.st_size >= self._log_offset:
+                if stat.st_size == self._log_offset:
+                    return
+                start = self._log_offset
+            else:
+                self._reset_state()
+                start = 0
+
+            log.seek(start)
+            for line in log:
+                if not line.endswith(b'\n'):
+                    break  # Línea a medio escribir por otro proceso
+                self._apply(json.loads(line))
+                start += len(line)
+
+        self._log_offset = start
+        self._log_signature = log_id
+        self._mask_cache = {}
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Serializa escrituras entre hilos y procesos y sincroniza el estado
+        con el disco antes de modificarlo.
+        """
+        with self._lock:
+            with open(self.directory / '.lock', 'w') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_log(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        payload = ''.join(
+            json.dumps(record, ensure_ascii=False) + '\n' for record in records
+        ).encode('utf-8')
+        with open(self._log_path, 'ab') as log:
+            log.write(payload)
+            log.flush()
+            os.fsync(log.fileno())
+        self._log_offset += len(payload)
+        self._mask_cache = {}
+
+    def _rewrite(self, capacity: int, dimension: int) -> None:
+        """
+        Compacta filas vivas en una nueva generación de vectores y log.
+        Los lectores que tengan mapeada la generación anterior la conservan
+        hasta su siguiente _refresh().
+        """
+        live = np.flatnonzero(self._valid[:self._rows])
+        generation = 0
+        if self._vectors_file:
+            generation = int(self._vectors_file.split('-')[1].split('.')[0]) + 1
+        filename = f"vectors-{generation}.npy"
+
+        vectors = np.lib.format.open_memmap(
+            self.directory / filename, mode='w+', dtype=np.float32, shape=(capacity, dimension)
+        )
+        if len(live):
+            vectors[:len(live)] = self._vectors[live]
+        vectors.flush()
+        del vectors
+
+        records = [{
+            'op': 'header',
+            'vectors': filename,
+            'rows': int(len(live)),
+            'log_id': uuid.uuid4().hex,
+        }]
+        records.extend(
+            {
+                'op': 'put',
+                'id': self._ids[row],
+                'row': new_row,
+                'document': self._documents[row],
+                'metadata': self._metadatas[row],
+            }
+            for new_row, row in enumerate(live)
+        )
+        tmp_path = self._log_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as log:
+            for record in records:
+                log.write(json.dumps(record, ensure_ascii=False) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+
+        old_file = self._vectors_file
+        os.replace(tmp_path, self._log_path)
+        self._log_signature = None
+        self._refresh()
+        if old_file and old_file != filename:
+            try:
+                os.remove(self.directory / old_file)
+            except OSError:
+                pass
+
+    def _ensure_capacity(self, needed_rows: int, dimension: int) -> None:
+        if self._vectors is None:
+            self._rewrite(max(self.INITIAL_CAPACITY, needed_rows), dimension)
+            return
+        if dimension != self._dimension:
+            raise ValueError(
+                f"Dimensión {dimension} distinta de la del vector store ({self._dimension})"
+            )
+        if needed_rows > self._vectors.shape[0]:
+            capacity = self._vectors.shape[0]
+            while capacity < needed_rows:
+                capacity *= 2
+            self._rewrite(capacity, dimension)
+
+    def add_documents(
+        self,
+        documents: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip'
+    ) -> List[str]:
+        """
+        Agrega documentos a la base vectorial.
+
+        Args:
+            documents: Lista de documentos.
+            embeddings: Matriz NumPy o lista de embeddings.
+            metadatas: Metadatos opcionales.
+            ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
+
+        Returns:
+            Lista de IDs de los documentos agregados.
+        """
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        self.write_documents(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids,
+            mode=mode
+        )
+
+        return ids
+
+    def write_documents(
+        self,
+        documents: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip',
+        batch_size: Optional[int] = None
+    ) -> Dict:
+        """
+        Escribe documentos normalizando sus vectores.
+
+        Args:
+            documents: Lista de documentos.
+            embeddings: Matriz NumPy o lista de embeddings.
+            metadatas: Metadatos opcionales.
+            ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
+            batch_size: Se acepta por compatibilidad; la escritura es única.
+
+        Returns:
+            Diccionario con 'ids', totales 'inserted', 'updated', 'skipped'
+            y el detalle en 'batches'.
+        """
+        from .similarity import normalize_rows
+
+        if mode not in self.WRITE_MODES:
+            raise ValueError(f"Modo de escritura no soportado: {mode}")
+
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+
+        stats = {'ids': ids, 'inserted': 0, 'updated': 0, 'skipped': 0, 'batches': []}
+        if not ids:
+            return stats
+
+        vectors = normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+
+        with self._write_lock():
+            # Deduplicar dentro del lote: gana la última aparición
+            positions = {id: i for i, id in enumerate(ids)}
+            if mode == 'skip':
+                positions = {id: i for id, i in positions.items() if id not in self._id_to_row}
+            new_ids = [id for id in positions if id not in self._id_to_row]
+            stats['updated'] = len(positions) - len(new_ids)
+            stats['inserted'] = len(new_ids)
+            stats['skipped'] = len(ids) - len(positions)
+
+            reusable = len(self._free_rows)
+            self._ensure_capacity(self._rows + max(0, len(new_ids) - reusable), vectors.shape[1])
+
+            free_rows = list(self._free_rows)
+            next_row = self._rows
+            records = []
+            for id, i in positions.items():
+                row = self._id_to_row.get(id)
+                if row is None:
+                    if free_rows:
+                        row = free_rows.pop()
+                    else:
+                        row = next_row
+                        next_row += 1
+                self._vectors[row] = vectors[i]
+                records.append({
+                    'op': 'put',
+                    'id': id,
+                    'row': row,
+                    'document': documents[i],
+                    'metadata': metadatas[i] or {},
+                })
+            self._vectors.flush()
+
+            # Primero los vectores y después el log: un lector nunca ve un
+            # registro cuyo vector no esté escrito.
+            for record in records:
+                self._apply(record)
+            self._append_log(records)
+            self._maybe_compact()
+
+        stats['batches'].append({
+            'size': len(ids),
+            'inserted': stats['inserted'],
+            'updated': stats['updated'],
+            'skipped': stats['skipped'],
+        })
+        return stats
+
+    def _maybe_compact(self) -> None:
+        live = len(self._id_to_row)
+        if self._log_records > 2 * live + 1000:
+            self._rewrite(self._vectors.shape[0], self._dimension)
+
+    def _posting_mask(self, key: str, values: Iterable) -> np.ndarray:
+        mask = np.zeros(self._rows, dtype=bool)
+        for value in values:
+            rows = self._postings.get(self._posting_key(key, value))
+            if rows:
+                mask[np.fromiter(rows, dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def _range_mask(self, key: str, operator: str, value) -> np.ndarray:
+        compare = self.RANGE_OPERATORS[operator]
+        mask = np.zeros(self._rows, dtype=bool)
+        for (posting_key, _, posting_value), rows in self._postings.items():
+            if (
+                posting_key == key and rows
+                and isinstance(posting_value, (int, float)) and not isinstance(posting_value, bool)
+                and compare(posting_value, value)
+            ):
+                mask[np.fromiter(rows, dtype=np.int64, count=len(rows))] = True
+        return mask
+
+    def _where_mask(self, where: Dict) -> np.ndarray:
+        """
+        Traduce un filtro de metadatos al estilo de ChromaDB a una máscara
+        de filas. Soporta igualdad, $eq, $ne, $in, $nin, $gt, $gte, $lt,
+        $lte, $and y $or.
+        """
+        mask = self._valid[:self._rows].copy()
+        for key, condition in where.items():
+            if key == '$and':
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == '$or':
+                any_mask = np.zeros(self._rows, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._where_mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    if operator == '$eq':
+                        mask &= self._posting_mask(key, [value])
+                    elif operator == '$ne':
+                        mask &= ~self._posting_mask(key, [value])
+                    elif operator == '$in':
+                        mask &= self._posting_mask(key, value)
+                    elif operator == '$nin':
+                        mask &= ~self._posting_mask(key, value)
+                    elif operator in self.RANGE_OPERATORS:
+                        mask &= self._range_mask(key, operator, value)
+                    else:
+                        raise ValueError(f"Operador de filtro no soportado: {operator}")
+            else:
+                mask &= self._posting_mask(key, [condition])
+        return mask
+
+    def _cached_mask(self, where: Optional[Dict]) -> np.ndarray:
+        if not where:
+            return self._valid[:self._rows]
+        cache_key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(cache_key)
+        if mask is None:
+            mask = self._where_mask(where)
+            self._mask_cache[cache_key] = mask
+        return mask
+
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False
+    ) -> Dict:
+        """
+        Busca documentos similares a un embedding de consulta.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            n_results: Número de resultados a retornar.
+            where: Filtros opcionales de metadatos.
+            include_embeddings: Devolver también los embeddings de los
+                                resultados en 'embeddings'.
+
+        Returns:
+            Diccionario con documentos, distancias (coseno) y metadatos.
+        """
+        from .similarity import normalize_rows
+
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).ravel())
+        empty = {'documents': [], 'distances': [], 'metadatas': [], 'ids': []}
+
+        # Instantánea bajo el lock; el producto matriz-vector se calcula fuera
+        # para no serializar las búsquedas concurrentes
+        with self._lock:
+            self._refresh()
+            if include_embeddings:
+                empty['embeddings'] = np.empty((0, self._dimension or 0), dtype=np.float32)
+            if self._vectors is None or self._rows == 0:
+                return empty
+            vectors = self._vectors[:self._rows]
+            mask = self._cached_mask(where)
+            if not where:
+                mask = mask.copy()
+            version = self._state_version
+
+        top, scores = self._top_k(vectors, mask, query, n_results)
+
+        with self._lock:
+            if self._state_version != version:
+                # Hubo escrituras durante el cálculo: las filas pueden haber
+                # cambiado de documento, se repite con el estado actual
+                if self._vectors is None or self._rows == 0:
+                    return empty
+                top, scores = self._top_k(
+                    self._vectors[:self._rows], self._cached_mask(where), query, n_results
+                )
+            if not len(top):
+                return empty
+
+            found = {
+                'documents': [self._documents[row] for row in top],
+                'distances': [float(1.0 - scores[row]) for row in top],
+                'metadatas': [self._metadatas[row] for row in top],
+                'ids': [self._ids[row] for row in top]
+            }
+            if include_embeddings:
+                found['embeddings'] = np.array(self._vectors[top], dtype=np.float32)
+            return found
+
+    @staticmethod
+    def _top_k(
+        vectors: np.ndarray,
+        mask: np.ndarray,
+        query: np.ndarray,
+        n_results: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filas con mayor similitud entre las de la máscara, ordenadas.
+        """
+        k = min(n_results, int(mask.sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.where(mask, vectors @ query, -np.inf)
+        if k < len(scores):
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top])][:k], scores
+
+    def delete_documents(self, ids: List[str]) -> None:
+        """
+        Elimina documentos de la base vectorial.
+
+        Args:
+            ids: Lista de IDs de documentos a eliminar.
+        """
+        with self._write_lock():
+            records = [{'op': 'delete', 'id': id} for id in ids if id in self._id_to_row]
+            for record in records:
+                self._apply(record)
+            self._append_log(records)
+            self._maybe_compact()
+
+    def delete_where(self, where: Dict) -> None:
+        """
+        Elimina los documentos que cumplen un filtro de metadatos.
+
+        Args:
+            where: Filtro de metadatos (p. ej. {'knowledge_base_id': '...'}).
+        """
+        with self._write_lock():
+            rows = np.flatnonzero(self._where_mask(where))
+            records = [{'op': 'delete', 'id': self._ids[row]} for row in rows]
+            for record in records:
+                self._apply(record)
+            self._append_log(records)
+            self._maybe_compact()
+
+    def update_document(
+        self,
+        id: str,
+        document: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        metadata: Optional[Dict] = None
+    ) -> None:
+        """
+        Actualiza un documento en la base vectorial. Los metadatos se
+        combinan con los existentes, como en ChromaDB.
+
+        Args:
+            id: ID del documento a actualizar.
+            document: Nuevo texto del documento.
+            embedding: Nuevo embedding.
+            metadata: Nuevos metadatos.
+        """
+        from .similarity import normalize_rows
+
+        with self._write_lock():
+            row = self._id_to_row.get(id)
+            if row is None:
+                return
+            if embedding is not None:
+                self._vectors[row] = normalize_rows(np.asarray(embedding, dtype=np.float32).ravel())
+                self._vectors.flush()
+            record = {
+                'op': 'put',
+                'id': id,
+                'row': row,
+                'document': document if document else self._documents[row],
+                'metadata': {**self._metadatas[row], **(metadata or {})},
+            }
+            self._apply(record)
+            self._append_log([record])
+
+    def sample(self, limit: int = 1000) -> Dict:
+        """
+        Obtiene una muestra de documentos almacenados.
+
+        Args:
+            limit: Número máximo de documentos.
+
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas'.
+        """
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._valid[:self._rows])[:limit]
+            return {
+                'ids': [self._ids[row] for row in rows],
+                'documents': [self._documents[row] for row in rows],
+                'metadatas': [self._metadatas[row] for row in rows]
+            }
+
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> Dict:
+        """
+        Obtiene varios documentos por ID.
+
+        Args:
+            ids: IDs a buscar.
+            include_embeddings: Devolver también sus embeddings en
+                                'embeddings' (matriz float32).
+
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas' de los IDs
+            que existen.
+        """
+        with self._lock:
+            self._refresh()
+            rows = [self._id_to_row[id] for id in ids if id in self._id_to_row]
+            found = {
+                'ids': [self._ids[row] for row in rows],
+                'documents': [self._documents[row] for row in rows],
+                'metadatas': [self._metadatas[row] for row in rows]
+            }
+            if include_embeddings:
+                found['embeddings'] = (
+                    np.array(self._vectors[rows], dtype=np.float32) if rows
+                    else np.empty((0, self._dimension or 0), dtype=np.float32)
+                )
+            return found
+
+    def iter_records(self, batch_size: int = 1000, embeddings: bool = True):
+        """
+        Recorre todos los registros con sus embeddings, por lotes.
+
+        Args:
+            batch_size: Registros por lote.
+            embeddings: Si es False no se leen los vectores.
+
+        Yields:
+            Diccionarios con 'ids', 'documents', 'metadatas' y 'embeddings'
+            (matriz float32, o None si embeddings es False).
+        """
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._valid[:self._rows])
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = [row for row in rows[start:start + batch_size] if self._valid[row]]
+                records = {
+                    'ids': [self._ids[row] for row in batch],
+                    'documents': [self._documents[row] for row in batch],
+                    'metadatas': [self._metadatas[row] for row in batch],
+                    'embeddings': (
+                        np.array(self._vectors[batch], dtype=np.float32) if embeddings else None
+                    )
+                }
+            yield records
+
+    def count(self) -> int:
+        """
+        Retorna el número de documentos en la colección.
+
+        Returns:
+            Número de documentos.
+        """
+        with self._lock:
+            self._refresh()
+            return len(self._id_to_row)
+
+    def clear(self) -> None:
+        """
+        Elimina todos los documentos de la colección.
+        """
+        with self._write_lock():
+            old_file = self._vectors_file
+            try:
+                os.remove(self._log_path)
+            except FileNotFoundError:
+                pass
+            self._vectors = None
+            self._reset_state()
+            self._log_signature = None
+            self._log_offset = 0
+            if old_file:
+                try:
+                    os.remove(self.directory / old_file)
+                except OSError:
+                    pass
@@ -0,0 +1,216 @@
+"""
+Backend ONNX Runtime para EmbeddingService.
+
+Exporta el transformer de un SentenceTransformer a ONNX (opcionalmente
+cuantizado a int8 dinámico), lo ejecuta con ONNX Runtime y reproduce el
+pooling por media del modelo original.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Frases de control para verificar la paridad con la salida de torch
+PARITY_SAMPLES = [
+    "¿Por qué mi internet está lento?",
+    "El router no enciende después del corte de luz",
+    "Quiero cambiar mi plan a 300 megas",
+    "Error 651 al conectar por PPPoE",
+    "¿Cuál es el horario de atención al cliente?",
+    "La señal WiFi no llega al segundo piso de la casa",
+]
+
+
+class OnnxEncoder:
+    """
+    Ejecuta el transformer de un SentenceTransformer con ONNX Runtime.
+    """
+
+    def __init__(
+        self,
+        model,
+        export_dir: str,
+        quantize: bool = False,
+        num_threads: int = 0
+    ):
+        """
+        Exporta (si hace falta) y carga el grafo ONNX.
+
+        Args:
+            model: SentenceTransformer ya cargado, usado para exportar y tokenizar.
+            export_dir: Directorio donde se guardan los grafos exportados.
+            quantize: Si debe usar la versión cuantizada a int8.
+            num_threads: Hilos intra-op de ONNX Runtime (0 = por defecto).
+        """
+        if not ONNX_AVAILABLE:
+            raise ImportError("ONNX Runtime not installed. Run: pip install onnx onnxruntime")
+
+        pooling = model[1] if len(model) > 1 else None
+        mean_pooling = (
+            getattr(pooling, 'pooling_mode_mean_tokens', False)
+            or getattr(pooling, 'pooling_mode', None) == 'mean'
+        )
+        if not mean_pooling:
+            raise ValueError("El backend ONNX solo soporta modelos con pooling por media")
+
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self.normalize = any(type(module).__name__ == 'Normalize' for module in model)
+
+        export_dir = Path(export_dir)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        fp32_path = export_dir / 'model.onnx'
+        if not fp32_path.exists():
+            self._export(model, fp32_path)
+
+        path = fp32_path
+        if quantize:
+            path = export_dir / 'model-int8.onnx'
+            if not path.exists():
+                self._quantize(fp32_path, path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(path),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.path = path
+
+    def _export(self, model, path: Path) -> None:
+        import torch
+
+        transformer = model[0].auto_model
+        transformer.eval()
+
+        sample = self.tokenizer(
+            ["exportación onnx"],
+            padding=True,
+            truncation=True,
+            return_tensors='pt'
+        )
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+        class _Wrapper(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *args):
+                return self.inner(**dict(zip(input_names, args)))[0]
+
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+        tmp_path = path.with_suffix('.tmp')
+        with torch.no_grad():
+            torch.onnx.export(
+                _Wrapper(transformer),
+                tuple(sample[name] for name in input_names),
+                str(tmp_path),
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                do_constant_folding=True,
+                dynamo=False
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"Modelo de embeddings exportado a ONNX: {path}")
+
+    @staticmethod
+    def _quantize(source: Path, target: Path) -> None:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = target.with_suffix('.tmp')
+        quantize_dynamic(str(source), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, target)
+        logger.info(f"Modelo ONNX cuantizado a int8: {target}")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Genera embeddings con ONNX Runtime.
+
+        Args:
+            texts: Lista de textos.
+            batch_size: Textos por inferencia.
+
+        Returns:
+            Array float32 de embeddings.
+        """
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {
+                name: encoded[name].astype(np.int64)
+                for name in self.input_names
+                if name in encoded
+            }
+            hidden = self.session.run(['last_hidden_state'], feeds)[0]
+
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+
+        return np.concatenate(outputs) if outputs else np.empty((0, 0), dtype=np.float32)
+
+
+def check_parity(
+    reference: np.ndarray,
+    candidate: np.ndarray,
+    threshold: float
+) -> float:
+    """
+    Compara dos conjuntos de embeddings fila a fila.
+
+    Args:
+        reference: Embeddings de referencia (torch).
+        candidate: Embeddings del backend alternativo.
+        threshold: Similitud coseno mínima aceptada.
+
+    Returns:
+        Similitud coseno mínima observada.
+
+    Raises:
+        ValueError: Si alguna fila queda por debajo del umbral.
+    """
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(ref * cand, axis=1)
+    min_cosine = float(cosines.min())
+    if min_cosine < threshold:
+        raise ValueError(
+            f"Paridad ONNX insuficiente: coseno mínimo {min_cosine:.4f} < {threshold:.4f}"
+        )
+    return min_cosine
+
+
+def onnx_export_dir(base_dir: str, model_name: str, revision: Optional[str]) -> str:
+    """
+    Directorio versionado para los grafos de un modelo y revisión.
+    """
+    safe_name = model_name.replace('/', '__')
+    return str(Path(base_dir) / f"{safe_name}@{revision or 'main'}")
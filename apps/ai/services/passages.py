@@ -0,0 +1,212 @@
+"""
+Post-proceso de los chunks recuperados antes de pasarlos al prompt.
+
+Los chunks de chunk_text y split_by_tokens se solapan con sus vecinos, y un
+mismo documento puede estar indexado completo (señal de auto-indexado) y por
+chunks (index_knowledge). Sin este paso el top-k suele traer fragmentos casi
+idénticos que gastan tokens del prompt.
+
+También amplía los chunks recuperados con sus vecinos (small-to-big): se
+busca sobre chunks pequeños y precisos y se devuelve el pasaje contiguo.
+"""
+from collections import defaultdict
+from functools import reduce
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .similarity import normalize_rows
+
+# Solape máximo que se busca al unir dos chunks consecutivos
+MAX_OVERLAP = 400
+MIN_OVERLAP = 8
+
+
+def join_overlapping(first: str, second: str, max_overlap: int = MAX_OVERLAP) -> str:
+    """
+    Une dos chunks consecutivos sin repetir el texto que comparten (el
+    final de first es el principio de second).
+
+    Args:
+        first: Chunk anterior.
+        second: Chunk siguiente.
+        max_overlap: Longitud máxima de solape que se busca.
+
+    Returns:
+        Texto unido.
+    """
+    limit = min(len(first), len(second), max_overlap)
+    for size in range(limit, MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def chunk_id(document_id: str, chunk_index: int) -> str:
+    """
+    ID con el que index_knowledge guarda cada chunk de un documento.
+    """
+    return f"{document_id}-chunk-{chunk_index}"
+
+
+def _chunk_position(doc: Dict) -> Optional[tuple]:
+    metadata = doc.get('metadata') or {}
+    document_id = metadata.get('document_id')
+    chunk_index = metadata.get('chunk_index')
+    if document_id is None or not isinstance(chunk_index, int):
+        return None
+    return str(document_id), chunk_index
+
+
+def merge_adjacent_chunks(docs: List[Dict]) -> List[Dict]:
+    """
+    Fusiona los chunks consecutivos de un mismo documento en un único
+    pasaje y descarta los resultados cuyo texto ya está contenido en otro
+    mejor situado (p. ej. un chunk y el documento completo).
+
+    El pasaje ocupa la posición de su mejor chunk y conserva su 'id',
+    'metadata' y 'score'; 'merged_ids' lista los chunks que lo forman y su
+    'embedding' es la media normalizada de los de sus chunks que lo traen.
+
+    Args:
+        docs: Resultados ordenados por relevancia.
+
+    Returns:
+        Resultados fusionados, en el mismo orden.
+    """
+    runs_by_document = defaultdict(list)
+    for position, doc in enumerate(docs):
+        chunk = _chunk_position(doc)
+        if chunk is not None:
+            runs_by_document[chunk[0]].append((chunk[1], position))
+
+    # Posición del mejor chunk de cada racha -> posiciones de la racha en orden
+    merged_at: Dict[int, List[int]] = {}
+    absorbed = set()
+    for entries in runs_by_document.values():
+        entries.sort()
+        run = [entries[0]]
+        for entry in entries[1:] + [None]:
+            if entry is not None and entry[0] == run[-1][0] + 1:
+                run.append(entry)
+                continue
+            if len(run) > 1:
+                positions = [position for _, position in run]
+                merged_at[min(positions)] = positions
+                absorbed.update(positions)
+            if entry is not None:
+                run = [entry]
+
+    merged: List[Dict] = []
+    for position, doc in enumerate(docs):
+        if position in merged_at:
+            doc = _merge_run([docs[i] for i in merged_at[position]], docs[position])
+        elif position in absorbed:
+            continue
+        content = doc['content'].strip()
+        if any(content in kept['content'] for kept in merged):
+            continue
+        merged.append(doc)
+    return merged
+
+
+def _merge_run(run: List[Dict], best: Dict) -> Dict:
+    content = run[0]['content']
+    for doc in run[1:]:
+        content = join_overlapping(content, doc['content'])
+
+    passage = {
+        **best,
+        'content': content,
+        'merged_ids': [doc['id'] for doc in run],
+        'chunk_span': (run[0]['metadata']['chunk_index'], run[-1]['metadata']['chunk_index']),
+    }
+    for key in ('score', 'rrf_score'):
+        if key in best:
+            passage[key] = max(doc.get(key, best[key]) for doc in run)
+    embeddings = [doc['embedding'] for doc in run if doc.get('embedding') is not None]
+    if embeddings:
+        passage['embedding'] = mean_embedding(embeddings)
+    else:
+        passage.pop('embedding', None)
+    return passage
+
+
+def mean_embedding(embeddings) -> np.ndarray:
+    """
+    Vector de un pasaje formado por varios chunks: media normalizada de los
+    vectores de sus chunks.
+    """
+    return normalize_rows(np.mean(normalize_rows(np.stack(embeddings)), axis=0))
+
+
+def window_range(doc: Dict, window: int) -> Optional[range]:
+    """
+    Índices de los chunks del pasaje ampliado de un resultado: los que
+    cubre (uno, o varios si ya se fusionaron) más window a cada lado.
+
+    Args:
+        doc: Resultado de la búsqueda.
+        window: Chunks vecinos a cada lado.
+
+    Returns:
+        Rango de chunk_index, o None si el resultado no es un chunk.
+    """
+    chunk = _chunk_position(doc)
+    total = (doc.get('metadata') or {}).get('total_chunks')
+    if chunk is None or not isinstance(total, int):
+        return None
+    first, last = doc.get('chunk_span', (chunk[1], chunk[1]))
+    return range(max(0, first - window), min(total, last + window + 1))
+
+
+def expand_windows(docs: List[Dict], window: int, chunks: Dict[str, str]) -> List[Dict]:
+    """
+    Sustituye cada chunk por el pasaje contiguo formado con sus vecinos.
+    Los resultados del mismo documento cuyos pasajes se solapan o tocan se
+    unen en uno, en la posición del mejor.
+
+    Args:
+        docs: Resultados ordenados por relevancia.
+        window: Chunks vecinos a cada lado.
+        chunks: ID de chunk -> texto de los vecinos ya leídos del store.
+
+    Returns:
+        Resultados ampliados; 'window' indica los chunk_index que cubre
+        cada pasaje.
+    """
+    expanded: List[Dict] = []
+    spans = defaultdict(list)
+    for doc in docs:
+        span = window_range(doc, window)
+        if span is None:
+            expanded.append(doc)
+            continue
+        document_id = str(doc['metadata']['document_id'])
+        passage = next(
+            (p for p in spans[document_id] if p['start'] <= span.stop and span.start <= p['stop']),
+            None
+        )
+        if passage is None:
+            passage = {'start': span.start, 'stop': span.stop, 'doc': doc, 'position': len(expanded)}
+            spans[document_id].append(passage)
+            expanded.append(doc)
+        else:
+            passage['start'] = min(passage['start'], span.start)
+            passage['stop'] = max(passage['stop'], span.stop)
+
+    for document_id, passages in spans.items():
+        for passage in passages:
+            texts = [
+                chunks[chunk_id(document_id, index)]
+                for index in range(passage['start'], passage['stop'])
+                if chunk_id(document_id, index) in chunks
+            ]
+            if not texts:
+                continue
+            expanded[passage['position']] = {
+                **passage['doc'],
+                'content': reduce(join_overlapping, texts),
+                'window': (passage['start'], passage['stop'] - 1),
+            }
+    return expanded
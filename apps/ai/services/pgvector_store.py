@@ -0,0 +1,463 @@
+"""
+Vector store sobre PostgreSQL con la extensión pgvector.
+
+Guarda los chunks en la tabla document_chunks (modelo DocumentChunk), en la
+misma base de datos que los documentos: las copias de seguridad y la
+replicación son las de Postgres, borrar un Document borra sus chunks en
+cascada y la búsqueda es una única consulta SQL que filtra contra
+documents.
+"""
+import uuid
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Q
+
+
+class PgVectorStore:
+    """
+    Implementación de la interfaz de VectorStore sobre pgvector.
+    """
+
+    DEFAULT_BATCH_SIZE = 1000
+    WRITE_MODES = ('skip', 'upsert')
+    # El índice HNSW es común a todas las colecciones y los filtros se aplican
+    # sobre sus ef_search candidatos: se piden EF_SEARCH_FACTOR por resultado
+    # (entre el valor por defecto de pgvector y su máximo)
+    DEFAULT_EF_SEARCH = 40
+    MAX_EF_SEARCH = 1000
+    EF_SEARCH_FACTOR = 10
+    # Claves de metadatos que son columnas propias de la tabla
+    COLUMNS = {
+        'document_id': 'document_id',
+        'knowledge_base_id': 'knowledge_base_id',
+        'chunk_index': 'chunk_index',
+    }
+
+    def __init__(
+        self,
+        collection_name: str = "knowbot_knowledge",
+        ef_search: Optional[int] = None
+    ):
+        """
+        Inicializa el vector store.
+
+        Args:
+            collection_name: Nombre lógico de la colección.
+            ef_search: Valor de hnsw.ef_search para las búsquedas (None usa
+                       el de la base de datos).
+        """
+        from apps.vectors.models import DocumentChunk
+
+        self.model = DocumentChunk
+        self.name = collection_name
+        self.ef_search = ef_search
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.DEFAULT_BATCH_SIZE
+
+    def _queryset(self):
+        return self.model.objects.filter(collection=self.name)
+
+    def _row(self, id: str, document: str, embedding, metadata: Optional[Dict]):
+        metadata = metadata or {}
+        return self.model(
+            collection=self.name,
+            vector_id=id,
+            document_id=uuid_or_none(metadata.get('document_id')),
+            knowledge_base_id=uuid_or_none(metadata.get('knowledge_base_id')),
+            chunk_index=metadata.get('chunk_index'),
+            content=document,
+            metadata=metadata,
+            embedding=embedding
+        )
+
+    def add_documents(
+        self,
+        documents: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip'
+    ) -> List[str]:
+        """
+        Agrega documentos a la base vectorial.
+
+        Args:
+            documents: Lista de documentos.
+            embeddings: Matriz NumPy o lista de embeddings.
+            metadatas: Metadatos opcionales.
+            ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
+
+        Returns:
+            Lista de IDs de los documentos agregados.
+        """
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        self.write_documents(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids,
+            mode=mode
+        )
+
+        return ids
+
+    def write_documents(
+        self,
+        documents: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip',
+        batch_size: Optional[int] = None
+    ) -> Dict:
+        """
+        Escribe documentos con bulk_create en lotes, dentro de una transacción.
+
+        Args:
+            documents: Lista de documentos.
+            embeddings: Matriz NumPy o lista de embeddings.
+            metadatas: Metadatos opcionales.
+            ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
+            batch_size: Registros por lote (por defecto max_batch_size).
+
+        Returns:
+            Diccionario con 'ids', totales 'inserted', 'updated', 'skipped'
+            y el detalle por lote en 'batches'.
+        """
+        if mode not in self.WRITE_MODES:
+            raise ValueError(f"Modo de escritura no soportado: {mode}")
+
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        if metadatas is None:
+            metadatas = [{} for _ in documents]
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        batch_size = min(batch_size or self.max_batch_size, self.max_batch_size)
+        stats = {'ids': ids, 'inserted': 0, 'updated': 0, 'skipped': 0, 'batches': []}
+
+        with transaction.atomic():
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                batch_ids = ids[start:end]
+                existing_ids = set(
+                    self._queryset().filter(vector_id__in=batch_ids).values_list('vector_id', flat=True)
+                )
+
+                if mode == 'upsert':
+                    positions = list(range(len(batch_ids)))
+                else:
+                    positions = [i for i, id in enumerate(batch_ids) if id not in existing_ids]
+
+                rows = [
+                    self._row(batch_ids[i], documents[start + i], embeddings[start + i], metadatas[start + i])
+                    for i in positions
+                ]
+                if rows and mode == 'upsert':
+                    self.model.objects.bulk_create(
+                        rows,
+                        update_conflicts=True,
+                        unique_fields=['collection', 'vector_id'],
+                        update_fields=[
+                            'document', 'knowledge_base', 'chunk_index',
+                            'content', 'metadata', 'embedding', 'updated_at'
+                        ]
+                    )
+                elif rows:
+                    self.model.objects.bulk_create(rows, ignore_conflicts=True)
+
+                updated = len(existing_ids) if mode == 'upsert' else 0
+                batch_stats = {
+                    'size': len(batch_ids),
+                    'inserted': len(positions) - updated,
+                    'updated': updated,
+                    'skipped': len(batch_ids) - len(positions),
+                }
+                stats['batches'].append(batch_stats)
+                for key in ('inserted', 'updated', 'skipped'):
+                    stats[key] += batch_stats[key]
+
+        return stats
+
+    def _where_to_q(self, where: Dict) -> Q:
+        return where_to_q(where, self.COLUMNS)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False
+    ) -> Dict:
+        """
+        Busca documentos similares a un embedding de consulta.
+        Excluye los chunks de documentos desactivados.
+
+        Todas las colecciones comparten un índice HNSW y la colección, where
+        y el filtro de documentos activos se aplican sobre los candidatos del
+        índice, así que una búsqueda filtrada puede quedarse corta. Se amplía
+        hnsw.ef_search en proporción a n_results y, si aun así vuelven menos
+        de n_results filas, se repite la consulta con un recorrido exacto
+        (sin el índice HNSW).
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            n_results: Número de resultados a retornar.
+            where: Filtros opcionales de metadatos.
+            include_embeddings: Devolver también los embeddings de los
+                                resultados en 'embeddings'.
+
+        Returns:
+            Diccionario con documentos, distancias (coseno) y metadatos.
+        """
+        from pgvector.django import CosineDistance
+
+        queryset = (
+            self._queryset()
+            .filter(embedding__isnull=False)
+            .filter(Q(document__isnull=True) | Q(document__is_active=True))
+            .filter(self._where_to_q(where or {}))
+            .annotate(distance=CosineDistance('embedding', query_embedding))
+            .order_by('distance')
+            .values(
+                'vector_id', 'content', 'metadata', 'distance',
+                *(['embedding'] if include_embeddings else [])
+            )
+        )
+
+        ef_search = min(
+            self.MAX_EF_SEARCH,
+            max(self.ef_search or self.DEFAULT_EF_SEARCH, n_results * self.EF_SEARCH_FACTOR)
+        )
+        rows = self._fetch(queryset, n_results, ['SET LOCAL hnsw.ef_search = %s' % int(ef_search)])
+        if len(rows) < n_results:
+            rows = self._fetch(queryset, n_results, ['SET LOCAL enable_indexscan = off'])
+
+        found = {
+            'documents': [row['content'] for row in rows],
+            'distances': [float(row['distance']) for row in rows],
+            'metadatas': [row['metadata'] for row in rows],
+            'ids': [row['vector_id'] for row in rows]
+        }
+        if include_embeddings:
+            found['embeddings'] = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+        return found
+
+    @staticmethod
+    def _fetch(queryset, n_results: int, statements: List[str]) -> List[Dict]:
+        """
+        Ejecuta la búsqueda en una transacción con los SET LOCAL indicados.
+        """
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+            return list(queryset[:n_results])
+
+    def delete_documents(self, ids: List[str]) -> None:
+        """
+        Elimina documentos de la base vectorial.
+
+        Args:
+            ids: Lista de IDs de documentos a eliminar.
+        """
+        self._queryset().filter(vector_id__in=ids).delete()
+
+    def delete_where(self, where: Dict) -> None:
+        """
+        Elimina los documentos que cumplen un filtro de metadatos.
+
+        Args:
+            where: Filtro de metadatos (p. ej. {'knowledge_base_id': '...'}).
+        """
+        self._queryset().filter(self._where_to_q(where)).delete()
+
+    def update_document(
+        self,
+        id: str,
+        document: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        metadata: Optional[Dict] = None
+    ) -> None:
+        """
+        Actualiza un documento en la base vectorial. Los metadatos se
+        combinan con los existentes, como en ChromaDB.
+
+        Args:
+            id: ID del documento a actualizar.
+            document: Nuevo texto del documento.
+            embedding: Nuevo embedding.
+            metadata: Nuevos metadatos.
+        """
+        with transaction.atomic():
+            chunk = self._queryset().select_for_update().filter(vector_id=id).first()
+            if chunk is None:
+                return
+            if document:
+                chunk.content = document
+            if embedding is not None:
+                chunk.embedding = embedding
+            if metadata:
+                chunk.metadata = {**chunk.metadata, **metadata}
+                row = self._row(id, chunk.content, chunk.embedding, chunk.metadata)
+                chunk.document_id = row.document_id
+                chunk.knowledge_base_id = row.knowledge_base_id
+                chunk.chunk_index = row.chunk_index
+            chunk.save()
+
+    def sample(self, limit: int = 1000) -> Dict:
+        """
+        Obtiene una muestra de documentos almacenados.
+
+        Args:
+            limit: Número máximo de documentos.
+
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas'.
+        """
+        rows = list(self._queryset().values('vector_id', 'content', 'metadata')[:limit])
+        return {
+            'ids': [row['vector_id'] for row in rows],
+            'documents': [row['content'] for row in rows],
+            'metadatas': [row['metadata'] for row in rows]
+        }
+
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> Dict:
+        """
+        Obtiene varios documentos por ID en una sola consulta.
+
+        Args:
+            ids: IDs a buscar.
+            include_embeddings: Devolver también sus embeddings en
+                                'embeddings' (matriz float32).
+
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas' de los IDs
+            que existen.
+        """
+        fields = ['vector_id', 'content', 'metadata'] + (['embedding'] if include_embeddings else [])
+        rows = list(self._queryset().filter(vector_id__in=ids).values(*fields))
+        found = {
+            'ids': [row['vector_id'] for row in rows],
+            'documents': [row['content'] for row in rows],
+            'metadatas': [row['metadata'] for row in rows]
+        }
+        if include_embeddings:
+            found['embeddings'] = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+        return found
+
+    def iter_records(self, batch_size: int = 1000, embeddings: bool = True):
+        """
+        Recorre todos los registros con sus embeddings, por lotes
+        (paginación por clave primaria).
+
+        Args:
+            batch_size: Registros por lote.
+            embeddings: Si es False no se leen los vectores.
+
+        Yields:
+            Diccionarios con 'ids', 'documents', 'metadatas' y 'embeddings'
+            (matriz float32, o None si embeddings es False).
+        """
+        fields = ['pk', 'vector_id', 'content', 'metadata'] + (['embedding'] if embeddings else [])
+        last_pk = 0
+        while True:
+            rows = list(
+                self._queryset()
+                .filter(pk__gt=last_pk, embedding__isnull=False)
+                .order_by('pk')
+                .values(*fields)[:batch_size]
+            )
+            if not rows:
+                return
+            last_pk = rows[-1]['pk']
+            yield {
+                'ids': [row['vector_id'] for row in rows],
+                'documents': [row['content'] for row in rows],
+                'metadatas': [row['metadata'] for row in rows],
+                'embeddings': (
+                    np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+                    if embeddings else None
+                )
+            }
+
+    def count(self) -> int:
+        """
+        Retorna el número de documentos en la colección.
+
+        Returns:
+            Número de documentos.
+        """
+        return self._queryset().count()
+
+    def clear(self) -> None:
+        """
+        Elimina todos los documentos de la colección.
+        """
+        self._queryset().delete()
+
+
+def uuid_or_none(value) -> Optional[uuid.UUID]:
+    """
+    Convierte un ID de metadatos en UUID, o None si no es válido.
+    """
+    if not value:
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def where_to_q(where: Dict, columns: Dict[str, str]) -> Q:
+    """
+    Traduce un filtro de metadatos al estilo de ChromaDB a un Q del ORM.
+    Las claves con columna propia se filtran por columna (indexada) y el
+    resto sobre el JSON de metadatos.
+
+    Args:
+        where: Filtro de metadatos.
+        columns: Claves de metadatos que son columnas de la tabla.
+
+    Returns:
+        Objeto Q equivalente.
+    """
+    q = Q()
+    for key, condition in where.items():
+        if key == '$and':
+            for clause in condition:
+                q &= where_to_q(clause, columns)
+            continue
+        if key == '$or':
+            any_q = Q()
+            for clause in condition:
+                any_q |= where_to_q(clause, columns)
+            q &= any_q
+            continue
+
+        field = columns.get(key, f'metadata__{key}')
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, value in condition.items():
+            if operator == '$eq':
+                q &= Q(**{field: value})
+            elif operator == '$ne':
+                q &= ~Q(**{field: value})
+            elif operator == '$in':
+                q &= Q(**{f'{field}__in': value})
+            elif operator == '$nin':
+                q &= ~Q(**{f'{field}__in': value})
+            elif operator in ('$gt', '$gte', '$lt', '$lte'):
+                q &= Q(**{f'{field}__{operator[1:]}': value})
+            else:
+                raise ValueError(f"Operador de filtro no soportado: {operator}")
+    return q
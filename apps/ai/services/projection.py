@@ -0,0 +1,215 @@
+"""
+Proyección opcional de embeddings a menos dimensiones.
+
+Reduce la memoria del vector store (y del grafo HNSW) aplicando a documentos
+y consultas la misma proyección PCA o de truncamiento, ajustada sobre una
+muestra del corpus y guardada junto al modelo con una versión propia.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from .similarity import normalize_rows, top_k
+
+
+class EmbeddingProjection:
+    """
+    Proyección lineal x -> (x - mean) @ components.
+    """
+
+    METHODS = ('pca', 'truncate')
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        components: np.ndarray,
+        method: str,
+        model_name: str = '',
+        revision: str = 'main',
+        explained_variance: Optional[float] = None
+    ):
+        """
+        Args:
+            mean: Vector (d,) que se resta antes de proyectar.
+            components: Matriz (d, k) de proyección.
+            method: 'pca' o 'truncate'.
+            model_name: Modelo de embeddings sobre el que se ajustó.
+            revision: Revisión del modelo.
+            explained_variance: Fracción de varianza conservada (solo PCA).
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.method = method
+        self.model_name = model_name
+        self.revision = revision
+        self.explained_variance = explained_variance
+
+    @property
+    def source_dimension(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def version(self) -> str:
+        """Identificador estable derivado del método y de los pesos."""
+        digest = hashlib.sha256(self.components.tobytes() + self.mean.tobytes()).hexdigest()[:12]
+        return f"{self.method}{self.dimension}-{digest}"
+
+    @classmethod
+    def fit(
+        cls,
+        embeddings: np.ndarray,
+        n_components: int,
+        method: str = 'pca',
+        model_name: str = '',
+        revision: str = 'main'
+    ) -> 'EmbeddingProjection':
+        """
+        Ajusta una proyección sobre una muestra de embeddings.
+
+        Args:
+            embeddings: Matriz (n, d) de muestra.
+            n_components: Dimensiones de salida.
+            method: 'pca' (componentes principales) o 'truncate' (primeras k).
+            model_name: Modelo de embeddings.
+            revision: Revisión del modelo.
+
+        Returns:
+            Proyección ajustada.
+        """
+        if method not in cls.METHODS:
+            raise ValueError(f"Método de proyección no soportado: {method}")
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        d = embeddings.shape[1]
+        if not 0 < n_components <= d:
+            raise ValueError(f"n_components debe estar entre 1 y {d}")
+
+        if method == 'truncate':
+            return cls(
+                mean=np.zeros(d, dtype=np.float32),
+                components=np.eye(d, n_components, dtype=np.float32),
+                method=method,
+                model_name=model_name,
+                revision=revision
+            )
+
+        mean = embeddings.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        variance = singular_values ** 2
+        explained = float(variance[:n_components].sum() / variance.sum()) if variance.sum() else 1.0
+        return cls(
+            mean=mean,
+            components=vt[:n_components].T,
+            method=method,
+            model_name=model_name,
+            revision=revision,
+            explained_variance=explained
+        )
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Proyecta uno o varios embeddings.
+
+        Args:
+            embeddings: Vector (d,) o matriz (n, d).
+
+        Returns:
+            Embeddings proyectados (k,) o (n, k) en float32.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return (embeddings - self.mean) @ self.components
+
+    def save(self, directory: str) -> Path:
+        """
+        Guarda la proyección como <directory>/<version>.npz.
+
+        Returns:
+            Ruta del fichero guardado.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.version}.npz"
+        meta = {
+            'method': self.method,
+            'model_name': self.model_name,
+            'revision': self.revision,
+            'explained_variance': self.explained_variance,
+        }
+        np.savez(path, mean=self.mean, components=self.components, meta=json.dumps(meta))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'EmbeddingProjection':
+        """
+        Carga una proyección guardada con save().
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            return cls(
+                mean=data['mean'],
+                components=data['components'],
+                method=meta['method'],
+                model_name=meta.get('model_name', ''),
+                revision=meta.get('revision', 'main'),
+                explained_variance=meta.get('explained_variance')
+            )
+
+
+def projection_dir(base_dir: str, model_name: str, revision: Optional[str]) -> Path:
+    """
+    Directorio de proyecciones de un modelo y revisión.
+    """
+    safe_name = model_name.replace('/', '__')
+    return Path(base_dir) / f"{safe_name}@{revision or 'main'}"
+
+
+def recall_at_k(
+    full: np.ndarray,
+    reduced: np.ndarray,
+    n_queries: int,
+    k: int = 5,
+    seed: int = 0
+) -> Dict:
+    """
+    Mide cuánto del top-k exacto en dimensión completa se conserva tras proyectar.
+    Usa una parte de la muestra como consultas y el resto como corpus.
+
+    Args:
+        full: Embeddings originales (n, d).
+        reduced: Los mismos embeddings proyectados (n, k').
+        n_queries: Número de consultas a extraer de la muestra.
+        k: Vecinos a comparar.
+        seed: Semilla para elegir las consultas.
+
+    Returns:
+        Diccionario con recall@k medio y mínimo.
+    """
+    rng = np.random.default_rng(seed)
+    n = full.shape[0]
+    n_queries = min(n_queries, max(n - 1, 0))
+    query_idx = rng.choice(n, size=n_queries, replace=False)
+    corpus_mask = np.ones(n, dtype=bool)
+    corpus_mask[query_idx] = False
+
+    full_n = normalize_rows(full)
+    reduced_n = normalize_rows(reduced)
+    truth, _ = top_k(full_n[query_idx], full_n[corpus_mask], k)
+    approx, _ = top_k(reduced_n[query_idx], reduced_n[corpus_mask], k)
+
+    hits = np.array([
+        len(np.intersect1d(t, a, assume_unique=True)) / max(truth.shape[1], 1)
+        for t, a in zip(truth, approx)
+    ])
+    return {
+        'recall': float(hits.mean()) if len(hits) else 0.0,
+        'min_recall': float(hits.min()) if len(hits) else 0.0,
+        'queries': int(n_queries),
+        'k': int(truth.shape[1]),
+    }
@@ -0,0 +1,220 @@
+"""
+Montaje de prompts con presupuesto de tokens.
+
+Los tokens se cuentan con el tokenizer local del modelo de embeddings
+(MiniLM), no con el de Gemini: todas las cifras de este módulo son una
+aproximación de los tokens que facturará el LLM. Ambos tokenizers son subword
+y la proporción entre ellos es estable, así que basta para acotar el tamaño
+del prompt sin llamar a la API; deja margen en max_tokens si el límite real
+es estricto.
+"""
+from typing import Dict, List, Optional, Tuple
+
+SYSTEM_PROMPT = "Eres un asistente virtual experto para un proveedor de servicios de Internet (ISP)."
+NO_HISTORY = "Sin historial previo"
+
+
+def doc_relevance(doc: Dict) -> float:
+    """
+    Relevancia de un documento recuperado: la del cross-encoder si se
+    reordenó, la de RRF si viene de la búsqueda híbrida o la similitud.
+    """
+    for key in ('rerank_score', 'rrf_score', 'score'):
+        if doc.get(key) is not None:
+            return doc[key]
+    return 0.0
+
+
+class PromptAssembler:
+    """
+    Rellena una plantilla con la pregunta, el contexto recuperado y el
+    historial sin pasar de max_tokens. La plantilla y la pregunta siempre
+    entran; el contexto se empaqueta primero (hasta max_context_tokens, por
+    relevancia) y el historial ocupa lo que quede (hasta max_history_tokens,
+    de los mensajes más recientes hacia atrás).
+    """
+
+    def __init__(
+        self,
+        embedding_service=None,
+        max_tokens: int = 3000,
+        max_context_tokens: int = 2000,
+        max_history_tokens: int = 800,
+        min_fragment_tokens: int = 64
+    ):
+        """
+        Inicializa el ensamblador.
+
+        Args:
+            embedding_service: Servicio cuyo tokenizer se usa para contar.
+                              Por defecto usa la instancia compartida.
+            max_tokens: Tokens máximos del prompt completo.
+            max_context_tokens: Tope de tokens para el contexto.
+            max_history_tokens: Tope de tokens para el historial.
+            min_fragment_tokens: Si el documento más relevante que no cabe
+                                 dispone de al menos estos tokens, se incluye
+                                 recortado en lugar de descartarlo.
+        """
+        from .container import get_embedding_service
+
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.max_tokens = max_tokens
+        self.max_context_tokens = max_context_tokens
+        self.max_history_tokens = max_history_tokens
+        self.min_fragment_tokens = min_fragment_tokens
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Cuenta los tokens de cada texto. Incluye los tokens especiales del
+        tokenizer, lo que deja un pequeño margen por separadores.
+
+        Args:
+            texts: Textos a contar.
+
+        Returns:
+            Número de tokens de cada texto.
+        """
+        return self.embedding_service.token_lengths(texts).tolist()
+
+    def pack_context(
+        self,
+        context_docs: List[Dict],
+        budget: int,
+        line_format: str = "- {content}"
+    ) -> Tuple[List[Dict], List[str], int]:
+        """
+        Empaquetado voraz por relevancia: recorre los documentos de mayor a
+        menor relevancia y añade cada uno que quepa en el presupuesto. El
+        primero que no cabe se recorta a los tokens restantes si quedan al
+        menos min_fragment_tokens. Los tokens son del tokenizer de
+        embeddings y aproximan los de Gemini.
+
+        Args:
+            context_docs: Documentos recuperados.
+            budget: Tokens disponibles.
+            line_format: Formato de cada línea ({content} y {score}).
+
+        Returns:
+            Tupla (documentos incluidos, líneas, tokens usados).
+        """
+        ranked = sorted(context_docs, key=doc_relevance, reverse=True)
+        lines = [line_format.format(content=doc['content'], score=doc_relevance(doc)) for doc in ranked]
+        used_docs, used_lines, used = [], [], 0
+        truncated = False
+        for doc, line, tokens in zip(ranked, lines, self.count_tokens(lines)):
+            if used + tokens <= budget:
+                used_docs.append(doc)
+                used_lines.append(line)
+                used += tokens
+                continue
+            if truncated or budget - used < self.min_fragment_tokens:
+                continue
+            # Solo se recorta el primer documento que no cabe
+            truncated = True
+            overhead = self.count_tokens([line_format.format(content='', score=doc_relevance(doc))])[0]
+            fragment = self.embedding_service.truncate_to_tokens(
+                doc['content'], budget - used - overhead
+            )
+            line = line_format.format(content=fragment, score=doc_relevance(doc))
+            tokens = self.count_tokens([line])[0]
+            if fragment and used + tokens <= budget:
+                used_docs.append({**doc, 'content': fragment, 'truncated': True})
+                used_lines.append(line)
+                used += tokens
+        return used_docs, used_lines, used
+
+    def pack_history(
+        self,
+        messages: List[Tuple[str, str]],
+        budget: int
+    ) -> Tuple[List[str], int]:
+        """
+        Incluye los mensajes más recientes que quepan en el presupuesto, sin
+        huecos: el primero que no cabe corta el historial.
+
+        Args:
+            messages: Pares (rol, contenido) en orden cronológico.
+            budget: Tokens disponibles.
+
+        Returns:
+            Tupla (líneas en orden cronológico, tokens usados).
+        """
+        lines = [
+            f"{'Usuario' if role == 'user' else 'Asistente'}: {content}"
+            for role, content in messages
+        ]
+        kept, used = [], 0
+        for line, tokens in zip(reversed(lines), reversed(self.count_tokens(lines))):
+            if used + tokens > budget:
+                break
+            kept.append(line)
+            used += tokens
+        return list(reversed(kept)), used
+
+    def assemble(
+        self,
+        template: str,
+        question: str,
+        context_docs: Optional[List[Dict]] = None,
+        history: Optional[List[Tuple[str, str]]] = None,
+        context_format: str = "- {content}",
+        max_context_tokens: Optional[int] = None,
+        max_history_tokens: Optional[int] = None
+    ) -> Dict:
+        """
+        Construye el prompt dentro del presupuesto (tokens aproximados con
+        el tokenizer de embeddings, ver el docstring del módulo).
+
+        Args:
+            template: Plantilla con los campos {question}, {context} e
+                      {history} (los dos últimos opcionales).
+            question: Mensaje del usuario.
+            context_docs: Documentos recuperados (None si no hay RAG).
+            history: Pares (rol, contenido) en orden cronológico.
+            context_format: Formato de cada línea de contexto.
+            max_context_tokens: Tope del contexto (por defecto el del
+                                ensamblador).
+            max_history_tokens: Tope del historial (por defecto el del
+                                ensamblador).
+
+        Returns:
+            Diccionario con 'prompt', 'prompt_tokens', 'context_docs' (los
+            incluidos, por relevancia) y 'sections' (tokens por sección).
+        """
+        if max_context_tokens is None:
+            max_context_tokens = self.max_context_tokens
+        if max_history_tokens is None:
+            max_history_tokens = self.max_history_tokens
+
+        # Se mide la plantilla tal como se renderiza sin contexto ni historial
+        fixed = self.count_tokens([template.format(question=question, context='', history=NO_HISTORY)])[0]
+        available = max(0, self.max_tokens - fixed)
+
+        used_docs, context_lines, context_tokens = [], [], 0
+        if context_docs:
+            used_docs, context_lines, context_tokens = self.pack_context(
+                context_docs, min(max_context_tokens, available), context_format
+            )
+
+        history_lines, history_tokens = [], 0
+        if history:
+            history_lines, history_tokens = self.pack_history(
+                history, min(max_history_tokens, available - context_tokens)
+            )
+
+        prompt = template.format(
+            question=question,
+            context="\n".join(context_lines),
+            history="\n".join(history_lines) if history_lines else NO_HISTORY
+        )
+        return {
+            'prompt': prompt,
+            'prompt_tokens': self.count_tokens([prompt])[0],
+            'context_docs': used_docs,
+            'sections': {
+                'fixed': fixed,
+                'context': context_tokens,
+                'history': history_tokens,
+                'history_messages': len(history_lines),
+            },
+        }
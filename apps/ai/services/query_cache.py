@@ -0,0 +1,174 @@
+"""
+Caché LRU de embeddings de consultas frecuentes.
+
+El tráfico de soporte se concentra en unas pocas cientos de preguntas casi
+idénticas ("internet lento", "router no enciende"); esta caché evita pasar
+cada una por el transformer en RAGService.retrieve_context.
+"""
+import hashlib
+import logging
+import re
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = str.maketrans('', '', string.punctuation + '¿¡')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryEmbeddingCache:
+    """
+    LRU en memoria con TTL y respaldo opcional en Redis compartido entre workers.
+    """
+
+    KEY_PREFIX = 'qemb'
+
+    def __init__(
+        self,
+        namespace: str,
+        max_size: int = 1000,
+        ttl: int = 3600,
+        shared: bool = False,
+        cache_alias: str = 'default'
+    ):
+        """
+        Inicializa la caché.
+
+        Args:
+            namespace: Identificador del modelo (nombre y revisión).
+            max_size: Número máximo de consultas en memoria.
+            ttl: Tiempo de vida de cada entrada en segundos.
+            shared: Si debe usar Redis como segundo nivel compartido.
+            cache_alias: Alias de CACHES para el nivel compartido.
+        """
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self.cache_alias = cache_alias
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Normaliza una consulta: minúsculas, sin acentos, sin signos de
+        puntuación y con los espacios colapsados.
+
+        Args:
+            query: Consulta original.
+
+        Returns:
+            Consulta normalizada.
+        """
+        text = unicodedata.normalize('NFKD', query.lower())
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        text = text.translate(_PUNCTUATION)
+        return _WHITESPACE.sub(' ', text).strip()
+
+    def _key(self, query: str) -> str:
+        digest = hashlib.sha1(self.normalize(query).encode('utf-8')).hexdigest()
+        return f"{self.KEY_PREFIX}:{self.namespace}:{digest}"
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Busca el embedding de una consulta.
+
+        Args:
+            query: Consulta del usuario.
+
+        Returns:
+            Embedding cacheado o None.
+        """
+        key = self._key(query)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                embedding, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+
+        if self.shared:
+            try:
+                raw = caches[self.cache_alias].get(key)
+            except Exception as e:
+                logger.debug(f"Caché compartida de consultas no disponible: {e}")
+                raw = None
+            if raw is not None:
+                embedding = np.frombuffer(raw, dtype=np.float32)
+                self._store_local(key, embedding, now)
+                with self._lock:
+                    self.shared_hits += 1
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, query: str, embedding: np.ndarray) -> None:
+        """
+        Guarda el embedding de una consulta.
+
+        Args:
+            query: Consulta del usuario.
+            embedding: Embedding calculado.
+        """
+        key = self._key(query)
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        self._store_local(key, embedding, time.monotonic())
+
+        if self.shared:
+            try:
+                caches[self.cache_alias].set(key, embedding.tobytes(), timeout=self.ttl)
+            except Exception as e:
+                logger.debug(f"No se pudo escribir en la caché compartida: {e}")
+
+    def _store_local(self, key: str, embedding: np.ndarray, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (embedding, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Vacía el nivel en memoria.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """
+        Retorna las estadísticas de aciertos para dimensionar la caché.
+
+        Returns:
+            Diccionario con hits, shared_hits, misses, hit_rate y tamaño.
+        """
+        with self._lock:
+            total = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / total if total else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+            }
@@ -1,7 +1,37 @@
+import logging
+from collections import defaultdict
 from typing import List, Dict, Optional
+import numpy as np
+from django.db import close_old_connections
+from .answer_cache import IndexVersions
+from .async_vector_store import run_in_pool
 from .embedding_service import EmbeddingService
+from .fusion import reciprocal_rank_fusion
+from .inference_scheduler import InferenceScheduler
+from .passages import chunk_id, expand_windows, mean_embedding, merge_adjacent_chunks, window_range
+from .similarity import maximal_marginal_relevance
 from .vector_store import VectorStore
 
+logger = logging.getLogger(__name__)
+
+CONTEXT_PROMPT_TEMPLATE = """Contexto relevante:
+{context}
+
+Pregunta del usuario: {question}
+
+Por favor, responde la pregunta usando el contexto proporcionado. Si el contexto no contiene información suficiente, indícalo claramente."""
+
+
+def _run_in_worker(fn, *args):
+    """
+    Ejecuta fn en un hilo del pool de búsquedas y libera después su conexión
+    a la base de datos, que Django no cierra fuera del ciclo de petición.
+    """
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
 
 class RAGService:
     """
@@ -12,23 +42,132 @@ class RAGService:
     def __init__(
         self,
         embedding_service: Optional[EmbeddingService] = None,
-        vector_store: Optional[VectorStore] = None
+        vector_store: Optional[VectorStore] = None,
+        shard_by_knowledge_base: bool = False,
+        lexical_index=None,
+        hybrid_candidates: int = 20,
+        rrf_k: int = 60,
+        executor=None,
+        mmr_lambda: float = 1.0,
+        mmr_candidates: int = 20,
+        mmr_max_encode: int = 8,
+        merge_adjacent: bool = False,
+        reranker=None,
+        rerank_candidates: int = 20,
+        rerank_threshold: float = 0.0,
+        prompt_assembler=None,
+        index_versions: Optional[IndexVersions] = None,
+        window_size: int = 0
     ):
         """
         Inicializa el servicio RAG.
         
         Args:
-            embedding_service: Servicio de embeddings.
-            vector_store: Base de datos vectorial.
+            embedding_service: Servicio de embeddings. Por defecto usa la
+                              instancia compartida del proceso.
+            vector_store: Base de datos vectorial. Por defecto usa la
+                         instancia compartida del proceso.
+            shard_by_knowledge_base: Si cada base de conocimiento tiene su
+                                     propia colección.
+            lexical_index: Índice léxico para la recuperación híbrida. Si es
+                          None solo se usa la búsqueda vectorial.
+            hybrid_candidates: Candidatos por vía antes de fusionar.
+            rrf_k: Constante de Reciprocal Rank Fusion.
+            executor: Pool de hilos de aretrieve_context. Si es None usa el
+                     executor por defecto del event loop.
+            mmr_lambda: Equilibrio relevancia/diversidad de MMR por defecto
+                       (1.0 lo desactiva).
+            mmr_candidates: Candidatos recuperados antes de diversificar.
+            mmr_max_encode: Candidatos sin vector en el store que se
+                           codifican como mucho por consulta para MMR.
+            merge_adjacent: Si por defecto se fusionan los chunks contiguos
+                           de un mismo documento.
+            reranker: CrossEncoderReranker opcional para reordenar los
+                     candidatos.
+            rerank_candidates: Candidatos recuperados antes del reranking.
+            rerank_threshold: Puntuación mínima del reranker para que un
+                             documento llegue al prompt.
+            prompt_assembler: Ensamblador de prompts con presupuesto de
+                             tokens. Por defecto usa la instancia compartida.
+            index_versions: Versiones del índice por base de conocimiento,
+                           que cambian con cada indexación o borrado.
+            window_size: Chunks vecinos a cada lado con los que se amplía
+                        cada resultado (0 lo desactiva).
+        """
+        from .container import get_embedding_service, get_prompt_assembler, get_vector_store
+        
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.vector_store = vector_store or get_vector_store()
+        self.shard_by_knowledge_base = shard_by_knowledge_base
+        self.lexical_index = lexical_index
+        self.hybrid_candidates = hybrid_candidates
+        self.rrf_k = rrf_k
+        self.executor = executor
+        self.mmr_lambda = mmr_lambda
+        self.mmr_candidates = mmr_candidates
+        self.mmr_max_encode = mmr_max_encode
+        self.merge_adjacent = merge_adjacent
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.rerank_threshold = rerank_threshold
+        self.prompt_assembler = prompt_assembler or get_prompt_assembler()
+        self.index_versions = index_versions or IndexVersions()
+        self.window_size = window_size
+        # (versión global del índice, IDs de las bases activas)
+        self._active_shards = None
+    
+    def _store_for(self, knowledge_base_id: Optional[str] = None):
+        """
+        Retorna el vector store donde vive una base de conocimiento.
+        """
+        if not (self.shard_by_knowledge_base and knowledge_base_id):
+            return self.vector_store
+        from .container import get_vector_store, shard_collection_name
+        return get_vector_store(shard_collection_name(knowledge_base_id))
+    
+    def _index_lexical(
+        self,
+        ids: List[str],
+        contents: List[str],
+        metadatas: Optional[List[Dict]]
+    ) -> None:
+        """
+        Copia chunks al índice léxico. Un fallo aquí no invalida la
+        indexación vectorial.
+        """
+        if self.lexical_index is None:
+            return
+        try:
+            self.lexical_index.index(ids, contents, metadatas)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el índice léxico: {e}")
+    
+    def _active_knowledge_base_ids(self) -> List[str]:
+        """
+        IDs de las bases de conocimiento activas. La lista se guarda hasta que
+        cambia la versión global del índice, que se incrementa al indexar,
+        borrar o guardar una base de conocimiento (ver apps.knowledge.signals).
         """
-        self.embedding_service = embedding_service or EmbeddingService()
-        self.vector_store = vector_store or VectorStore()
+        from apps.knowledge.models import KnowledgeBase
+        
+        version = self.index_versions.version()
+        cached = self._active_shards
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        ids = [
+            str(kb_id) for kb_id in
+            KnowledgeBase.objects.filter(is_active=True).values_list('id', flat=True)
+        ]
+        self._active_shards = (version, ids)
+        return ids
     
     def index_document(
         self,
         document_id: str,
         content: str,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        mode: str = 'skip'
     ) -> str:
         """
         Indexa un documento en la base vectorial.
@@ -37,80 +176,421 @@ class RAGService:
             document_id: ID del documento.
             content: Contenido del documento.
             metadata: Metadatos adicionales.
+            mode: 'skip' si ya existe lo deja igual, 'upsert' lo reemplaza.
             
         Returns:
             ID del documento indexado.
         """
-        embedding = self.embedding_service.encode(content)
+        # encode_documents aplica la política de desbordamiento (recorte o
+        # ventanas) a los documentos que superan el límite del modelo
+        embedding = self.embedding_service.encode_documents([content])
         
-        self.vector_store.add_documents(
+        store = self._store_for((metadata or {}).get('knowledge_base_id'))
+        store.add_documents(
             documents=[content],
-            embeddings=[embedding.tolist()],
+            embeddings=embedding,
             metadatas=[metadata or {}],
-            ids=[document_id]
+            ids=[document_id],
+            mode=mode
         )
+        self._index_lexical([document_id], [content], [metadata or {}])
+        self.index_versions.bump([(metadata or {}).get('knowledge_base_id')])
         
         return document_id
     
     def index_documents_batch(
         self,
-        documents: List[Dict[str, any]]
+        documents: List[Dict[str, any]],
+        mode: str = 'skip'
     ) -> List[str]:
         """
         Indexa múltiples documentos en batch.
+        Los embeddings se generan y escriben por porciones, de modo que un
+        reindexado grande no mantiene todos los vectores en memoria.
         
         Args:
             documents: Lista de diccionarios con 'id', 'content' y 'metadata'.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
             
         Returns:
             Lista de IDs de documentos indexados.
         """
         contents = [doc['content'] for doc in documents]
-        embeddings = self.embedding_service.encode_documents(contents)
-        
         ids = [doc['id'] for doc in documents]
         metadatas = [doc.get('metadata', {}) for doc in documents]
         
-        self.vector_store.add_documents(
-            documents=contents,
-            embeddings=embeddings.tolist(),
-            metadatas=metadatas,
-            ids=ids
-        )
+        for start, embeddings in self.embedding_service.iter_encode_documents(contents):
+            end = start + len(embeddings)
+            # Agrupar la porción por shard de destino
+            groups = defaultdict(list)
+            for i in range(len(embeddings)):
+                groups[metadatas[start + i].get('knowledge_base_id')].append(i)
+            
+            for knowledge_base_id, positions in groups.items():
+                self._store_for(knowledge_base_id).add_documents(
+                    documents=[contents[start + i] for i in positions],
+                    embeddings=embeddings[positions],
+                    metadatas=[metadatas[start + i] for i in positions],
+                    ids=[ids[start + i] for i in positions],
+                    mode=mode
+                )
+            self._index_lexical(ids[start:end], contents[start:end], metadatas[start:end])
         
+        self.index_versions.bump({metadata.get('knowledge_base_id') for metadata in metadatas})
         return ids
     
     def retrieve_context(
         self,
         query: str,
         n_results: int = 5,
-        filters: Optional[Dict] = None
+        filters: Optional[Dict] = None,
+        knowledge_base_ids: Optional[List[str]] = None,
+        mmr_lambda: Optional[float] = None,
+        merge_adjacent: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        window: Optional[int] = None
     ) -> List[Dict]:
         """
         Recupera contexto relevante para una consulta.
+        Con índice léxico lanza la búsqueda por palabras clave en paralelo a
+        la vectorial y fusiona ambas con RRF; si el vector store falla
+        responde solo con la vía léxica.
+        
+        Si se diversifica o se reordena, recupera primero un conjunto mayor
+        de candidatos (mmr_candidates / rerank_candidates), fusiona los
+        chunks contiguos de un mismo documento, los reordena con el
+        cross-encoder descartando los que no llegan a rerank_threshold y
+        elige los n_results finales con Maximal Marginal Relevance.
+        
+        Con window > 0 cada chunk final se amplía con sus window vecinos a
+        cada lado (leídos en una sola consulta por store) y se devuelve el
+        pasaje contiguo.
         
         Args:
             query: Consulta del usuario.
             n_results: Número de documentos a recuperar.
             filters: Filtros opcionales de metadatos.
+            knowledge_base_ids: Bases de conocimiento en las que buscar
+                                (None busca en todas).
+            mmr_lambda: Equilibrio relevancia/diversidad (1.0 solo
+                       relevancia). None usa el valor del servicio.
+            merge_adjacent: Fusionar chunks contiguos. None usa el valor
+                           del servicio.
+            rerank: Reordenar con el cross-encoder (None lo usa si el
+                   servicio tiene reranker).
+            window: Chunks vecinos a cada lado. None usa el valor del
+                   servicio.
             
         Returns:
-            Lista de documentos relevantes con sus scores.
+            Lista de documentos relevantes con sus scores ('rerank_score'
+            si se reordenaron, 'window' si se ampliaron).
         """
-        # Ajustar n_results según documentos disponibles
-        try:
-            total_docs = self.vector_store.collection.count()
-            n_results = min(n_results, total_docs) if total_docs > 0 else n_results
-        except:
-            pass  # Si falla, usar n_results original
+        if knowledge_base_ids is not None and not knowledge_base_ids:
+            return []
+        
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        merge_adjacent = self.merge_adjacent if merge_adjacent is None else merge_adjacent
+        use_mmr = mmr_lambda < 1.0
+        use_rerank = self.reranker is not None and rerank is not False
+        pool = n_results
+        if use_mmr or merge_adjacent:
+            pool = max(pool, self.mmr_candidates)
+        if use_rerank:
+            pool = max(pool, self.rerank_candidates)
         
         query_embedding = self.embedding_service.encode_query(query)
+        docs = self._retrieve_candidates(
+            query, query_embedding, pool, filters, knowledge_base_ids, include_embeddings=use_mmr
+        )
+        
+        if merge_adjacent:
+            docs = merge_adjacent_chunks(docs)
+        if use_rerank:
+            docs = self._rerank(query, docs)
+        if use_mmr and len(docs) > n_results:
+            docs = self._select_mmr(query_embedding, docs, n_results, mmr_lambda)
         
-        results = self.vector_store.search(
-            query_embedding=query_embedding.tolist(),
-            n_results=n_results,
-            where=filters
+        docs = docs[:n_results]
+        window = self.window_size if window is None else window
+        if window > 0:
+            docs = self._expand_windows(docs, window)
+        for doc in docs:
+            doc.pop('embedding', None)
+        return docs
+    
+    def _expand_windows(self, docs: List[Dict], window: int) -> List[Dict]:
+        """
+        Lee los chunks vecinos de los resultados, agrupados por store, y
+        los cose en pasajes contiguos. Si la lectura falla se devuelven los
+        chunks sin ampliar.
+        """
+        ids_by_store = defaultdict(set)
+        for doc in docs:
+            span = window_range(doc, window)
+            if span is None:
+                continue
+            metadata = doc['metadata']
+            store_key = metadata.get('knowledge_base_id') if self.shard_by_knowledge_base else None
+            ids_by_store[store_key].update(
+                chunk_id(metadata['document_id'], index) for index in span
+            )
+        
+        chunks = {}
+        try:
+            for knowledge_base_id, ids in ids_by_store.items():
+                found = self._store_for(knowledge_base_id).get_documents(sorted(ids))
+                chunks.update(zip(found['ids'], found['documents']))
+        except Exception as e:
+            logger.warning(f"No se pudieron leer los chunks vecinos: {e}")
+            return docs
+        return expand_windows(docs, window, chunks)
+    
+    def _retrieve_candidates(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        n_results: int,
+        filters: Optional[Dict],
+        knowledge_base_ids: Optional[List[str]],
+        include_embeddings: bool = False
+    ) -> List[Dict]:
+        """
+        Búsqueda vectorial, o híbrida si hay índice léxico.
+        Con include_embeddings los documentos de la vía vectorial traen su
+        embedding en 'embedding'.
+        """
+        if self.lexical_index is None:
+            return self._vector_search(
+                query, n_results, filters, knowledge_base_ids,
+                query_embedding=query_embedding, include_embeddings=include_embeddings
+            )
+        
+        from .container import get_search_executor
+        
+        candidates = max(n_results, self.hybrid_candidates)
+        lexical_future = get_search_executor().submit(
+            _run_in_worker, self.lexical_index.search,
+            query, candidates, filters, knowledge_base_ids
+        )
+        
+        vector_error = None
+        try:
+            vector_docs = self._vector_search(
+                query, candidates, filters, knowledge_base_ids,
+                query_embedding=query_embedding, include_embeddings=include_embeddings
+            )
+        except Exception as e:
+            logger.warning(f"Búsqueda vectorial fallida, se usa solo la léxica: {e}")
+            vector_docs, vector_error = [], e
+        
+        try:
+            lexical_docs = lexical_future.result()
+        except Exception as e:
+            if vector_error is not None:
+                raise vector_error
+            logger.warning(f"Búsqueda léxica fallida: {e}")
+            lexical_docs = []
+        
+        fused = reciprocal_rank_fusion(
+            {
+                'vector': vector_docs,
+                'lexical': [
+                    {
+                        'content': doc['content'],
+                        'score': doc['rank'],
+                        'metadata': doc['metadata'],
+                        'id': doc['id'],
+                        'weight': doc['lexical_weight'],
+                    }
+                    for doc in lexical_docs
+                ],
+            },
+            k=self.rrf_k
+        )
+        return fused[:n_results]
+    
+    def _rerank(self, query: str, docs: List[Dict]) -> List[Dict]:
+        """
+        Reordena los candidatos con el cross-encoder. Si falla se conserva
+        el orden de la recuperación.
+        """
+        try:
+            return self.reranker.rerank(query, docs, threshold=self.rerank_threshold)
+        except Exception as e:
+            logger.warning(f"Reranking fallido, se usa el orden de la recuperación: {e}")
+            return docs
+    
+    def _select_mmr(
+        self,
+        query_embedding: np.ndarray,
+        docs: List[Dict],
+        n_results: int,
+        mmr_lambda: float
+    ) -> List[Dict]:
+        """
+        Elige n_results documentos con MMR. Si se reordenaron, la relevancia
+        es la puntuación del cross-encoder.
+        
+        Los que no traen embedding (solo encontrados por la vía léxica, o
+        pasajes cuyos chunks tampoco lo traían) leen sus vectores guardados
+        del store. Los que siguen sin vector se codifican en el carril de
+        consultas, como mucho mmr_max_encode; el resto queda fuera de la
+        selección y se registra en el log.
+        """
+        missing = [doc for doc in docs if doc.get('embedding') is None]
+        if missing:
+            self._load_embeddings(missing)
+            missing = [doc for doc in missing if doc.get('embedding') is None]
+        if missing:
+            to_encode = missing[:self.mmr_max_encode]
+            if to_encode:
+                encoded = self.embedding_service.encode(
+                    [doc['content'] for doc in to_encode],
+                    use_cache=True,
+                    priority=InferenceScheduler.QUERY
+                )
+                for doc, embedding in zip(to_encode, encoded):
+                    doc['embedding'] = embedding
+            dropped = len(missing) - len(to_encode)
+            if dropped:
+                logger.warning(
+                    f"MMR: {dropped} candidatos sin embedding superan mmr_max_encode "
+                    f"({self.mmr_max_encode}) y quedan fuera de la selección"
+                )
+            docs = [doc for doc in docs if doc.get('embedding') is not None]
+            if len(docs) <= n_results:
+                return docs
+        
+        selected = maximal_marginal_relevance(
+            query_embedding,
+            np.stack([doc['embedding'] for doc in docs]),
+            k=n_results,
+            lambda_mult=mmr_lambda,
+            relevance=(
+                [doc['rerank_score'] for doc in docs]
+                if all('rerank_score' in doc for doc in docs) else None
+            )
+        )
+        return [docs[i] for i in selected]
+    
+    def _load_embeddings(self, docs: List[Dict]) -> None:
+        """
+        Lee del store los vectores de documentos recuperados sin embedding,
+        con una consulta por store. El de un pasaje fusionado es la media de
+        los de sus chunks. Si la lectura falla se dejan sin vector.
+        """
+        ids_by_store = defaultdict(set)
+        for doc in docs:
+            metadata = doc.get('metadata') or {}
+            store_key = metadata.get('knowledge_base_id') if self.shard_by_knowledge_base else None
+            ids_by_store[store_key].update(doc.get('merged_ids') or [doc['id']])
+        
+        vectors = {}
+        try:
+            for knowledge_base_id, ids in ids_by_store.items():
+                found = self._store_for(knowledge_base_id).get_documents(
+                    sorted(ids), include_embeddings=True
+                )
+                vectors.update(zip(found['ids'], found['embeddings']))
+        except Exception as e:
+            logger.warning(f"No se pudieron leer los embeddings de los candidatos: {e}")
+            return
+        
+        for doc in docs:
+            embeddings = [vectors[id] for id in doc.get('merged_ids') or [doc['id']] if id in vectors]
+            if embeddings:
+                doc['embedding'] = mean_embedding(embeddings)
+    
+    async def aretrieve_context(
+        self,
+        query: str,
+        n_results: int = 5,
+        filters: Optional[Dict] = None,
+        knowledge_base_ids: Optional[List[str]] = None,
+        mmr_lambda: Optional[float] = None,
+        merge_adjacent: Optional[bool] = None,
+        rerank: Optional[bool] = None,
+        window: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Versión asíncrona de retrieve_context. Se ejecuta en el pool de
+        recuperación, de modo que el llamador puede solaparla con otra E/S y
+        cancelarla sin ocupar hilos del executor por defecto.
+        
+        Args:
+            query: Consulta del usuario.
+            n_results: Número de documentos a recuperar.
+            filters: Filtros opcionales de metadatos.
+            knowledge_base_ids: Bases de conocimiento en las que buscar
+                                (None busca en todas).
+            mmr_lambda: Equilibrio relevancia/diversidad (None usa el del
+                       servicio).
+            merge_adjacent: Fusionar chunks contiguos (None usa el valor
+                           del servicio).
+            rerank: Reordenar con el cross-encoder (None lo usa si el
+                   servicio tiene reranker).
+            window: Chunks vecinos a cada lado (None usa el valor del
+                   servicio).
+            
+        Returns:
+            Lista de documentos relevantes con sus scores.
+        """
+        return await run_in_pool(
+            self.executor, self.retrieve_context,
+            query, n_results, filters, knowledge_base_ids, mmr_lambda, merge_adjacent, rerank, window
         )
+    
+    def _vector_search(
+        self,
+        query: str,
+        n_results: int,
+        filters: Optional[Dict] = None,
+        knowledge_base_ids: Optional[List[str]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        include_embeddings: bool = False
+    ) -> List[Dict]:
+        """
+        Búsqueda semántica en el vector store (o en sus shards).
+        
+        Args:
+            query: Consulta del usuario.
+            n_results: Número de documentos a recuperar.
+            filters: Filtros opcionales de metadatos.
+            knowledge_base_ids: Bases de conocimiento en las que buscar.
+            query_embedding: Embedding de la consulta si ya se calculó.
+            include_embeddings: Añadir el embedding de cada documento en
+                                'embedding'.
+            
+        Returns:
+            Lista de documentos con su similitud coseno en 'score'.
+        """
+        if query_embedding is None:
+            query_embedding = self.embedding_service.encode_query(query)
+        query_embedding = query_embedding.tolist()
+        
+        if self.shard_by_knowledge_base:
+            if knowledge_base_ids is None:
+                # La colección global guarda entradas sin base de conocimiento
+                # o anteriores al sharding
+                knowledge_base_ids = [None] + self._active_knowledge_base_ids()
+            else:
+                # Solo los shards pedidos, sin repetir
+                knowledge_base_ids = list(dict.fromkeys(str(kb) for kb in knowledge_base_ids))
+            results = self._search_shards(
+                query_embedding, n_results, filters, knowledge_base_ids, include_embeddings
+            )
+        else:
+            # El vector store devuelve menos resultados si no hay suficientes
+            where = filters
+            if knowledge_base_ids is not None:
+                kb_filter = {'knowledge_base_id': {'$in': [str(kb) for kb in knowledge_base_ids]}}
+                where = {'$and': [filters, kb_filter]} if filters else kb_filter
+            results = self.vector_store.search(
+                query_embedding=query_embedding,
+                n_results=n_results,
+                where=where,
+                include_embeddings=include_embeddings
+            )
         
         context_docs = []
         for i, doc in enumerate(results['documents']):
@@ -120,55 +600,212 @@ class RAGService:
                 'metadata': results['metadatas'][i],
                 'id': results['ids'][i]
             })
+            if include_embeddings:
+                context_docs[-1]['embedding'] = results['embeddings'][i]
         
         return context_docs
     
+    def _search_shards(
+        self,
+        query_embedding: List[float],
+        n_results: int,
+        filters: Optional[Dict],
+        knowledge_base_ids: List[str],
+        include_embeddings: bool = False
+    ) -> Dict:
+        """
+        Busca en los shards de varias bases de conocimiento en paralelo y
+        mezcla los resultados por distancia.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            n_results: Número de resultados finales.
+            filters: Filtros opcionales de metadatos.
+            knowledge_base_ids: Bases de conocimiento a consultar (None
+                                consulta la colección global).
+            include_embeddings: Devolver también los embeddings.
+            
+        Returns:
+            Diccionario con el mismo formato que VectorStore.search().
+        """
+        from .container import get_search_executor
+        
+        def search(knowledge_base_id):
+            try:
+                return self._store_for(knowledge_base_id).search(
+                    query_embedding=query_embedding,
+                    n_results=n_results,
+                    where=filters,
+                    include_embeddings=include_embeddings
+                )
+            except Exception as e:
+                logger.warning(f"Búsqueda fallida en el shard {knowledge_base_id}: {e}")
+                return None
+        
+        if len(knowledge_base_ids) == 1:
+            shard_results = [search(knowledge_base_ids[0])]
+        else:
+            executor = get_search_executor()
+            shard_results = list(executor.map(
+                lambda knowledge_base_id: _run_in_worker(search, knowledge_base_id),
+                knowledge_base_ids
+            ))
+        
+        hits = [
+            (
+                result['distances'][i], result['documents'][i], result['metadatas'][i], result['ids'][i],
+                result['embeddings'][i] if include_embeddings else None
+            )
+            for result in shard_results if result
+            for i in range(len(result['ids']))
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        hits = hits[:n_results]
+        
+        merged = {
+            'documents': [hit[1] for hit in hits],
+            'distances': [hit[0] for hit in hits],
+            'metadatas': [hit[2] for hit in hits],
+            'ids': [hit[3] for hit in hits]
+        }
+        if include_embeddings:
+            merged['embeddings'] = [hit[4] for hit in hits]
+        return merged
+    
     def build_context_prompt(
         self,
         query: str,
         context_docs: List[Dict],
-        max_context_length: int = 2000
+        max_context_tokens: Optional[int] = None
     ) -> str:
         """
-        Construye un prompt con contexto para el LLM.
+        Construye un prompt con contexto para el LLM. Los documentos se
+        incluyen por relevancia hasta llenar el presupuesto de tokens.
         
         Args:
             query: Consulta del usuario.
             context_docs: Documentos de contexto recuperados.
-            max_context_length: Longitud máxima del contexto.
+            max_context_tokens: Tokens máximos del contexto (por defecto el
+                                tope del ensamblador de prompts).
             
         Returns:
             Prompt formateado con contexto.
         """
-        context_parts = []
-        current_length = 0
-        
-        for doc in context_docs:
-            content = doc['content']
-            if current_length + len(content) > max_context_length:
-                break
-            context_parts.append(f"- {content}")
-            current_length += len(content)
-        
-        context = "\n".join(context_parts)
-        
-        prompt = f"""Contexto relevante:
-{context}
-
-Pregunta del usuario: {query}
-
-Por favor, responde la pregunta usando el contexto proporcionado. Si el contexto no contiene información suficiente, indícalo claramente."""
-        
-        return prompt
+        return self.prompt_assembler.assemble(
+            CONTEXT_PROMPT_TEMPLATE,
+            question=query,
+            context_docs=context_docs,
+            max_context_tokens=max_context_tokens
+        )['prompt']
     
-    def delete_document(self, document_id: str) -> None:
+    def delete_document(
+        self,
+        document_id: str,
+        knowledge_base_id: Optional[str] = None
+    ) -> None:
         """
         Elimina un documento de la base vectorial.
         
         Args:
             document_id: ID del documento a eliminar.
+            knowledge_base_id: Base de conocimiento del documento (necesaria
+                               para localizar su shard).
+        """
+        self.delete_by_document(document_id, knowledge_base_id)
+    
+    def _stores_for_document(self, knowledge_base_id: Optional[str]) -> List:
+        """
+        Vector stores donde pueden estar los chunks de un documento. Con
+        sharding son todos (la colección global y cada shard), porque un
+        documento que cambió de base de conocimiento conserva sus chunks en
+        el shard anterior. El de knowledge_base_id va primero.
         """
-        self.vector_store.delete_documents([document_id])
+        if not self.shard_by_knowledge_base:
+            return [self.vector_store]
+        knowledge_base_ids = [None] + self._active_knowledge_base_ids()
+        if knowledge_base_id:
+            knowledge_base_ids = [str(knowledge_base_id)] + [
+                kb_id for kb_id in knowledge_base_ids if kb_id != str(knowledge_base_id)
+            ]
+        return [self._store_for(kb_id) for kb_id in knowledge_base_ids]
+    
+    def _bump_version(self, knowledge_base_id: Optional[str]) -> None:
+        """
+        Cambia la versión del índice tras modificar un documento. Si no se
+        conoce su base de conocimiento se invalidan todas.
+        """
+        if knowledge_base_id:
+            self.index_versions.bump([knowledge_base_id])
+        else:
+            self.index_versions.bump_all()
+    
+    def delete_by_document(
+        self,
+        document_id: str,
+        knowledge_base_id: Optional[str] = None
+    ) -> None:
+        """
+        Elimina todas las entradas de un documento: sus chunks (por el
+        metadato document_id) y la entrada de documento completo, cuyo ID es
+        el del propio documento.
+        
+        Args:
+            document_id: ID del documento.
+            knowledge_base_id: Base de conocimiento del documento.
+        """
+        document_id = str(document_id)
+        for store in self._stores_for_document(knowledge_base_id):
+            store.delete_where({'document_id': document_id})
+            store.delete_documents([document_id])
+        if self.lexical_index is not None:
+            self.lexical_index.delete_where({'document_id': document_id})
+            self.lexical_index.delete([document_id])
+        self._bump_version(knowledge_base_id)
+    
+    def delete_stale_chunks(
+        self,
+        document_id: str,
+        chunk_count: int,
+        knowledge_base_id: Optional[str] = None
+    ) -> None:
+        """
+        Elimina las entradas de un documento que sobran tras reindexarlo con
+        chunk_count chunks: los chunks con índice >= chunk_count y, según el
+        caso, la entrada de documento completo (si ahora va en chunks) o
+        todos los chunks (si ahora va completo).
+        
+        Con sharding y knowledge_base_id, en los demás shards (y en la
+        colección global) se borran todas sus entradas: son restos de una
+        base de conocimiento anterior.
+        
+        Args:
+            document_id: ID del documento.
+            chunk_count: Número de chunks de la indexación vigente (1 si se
+                        indexó como documento completo).
+            knowledge_base_id: Base de conocimiento del documento.
+        """
+        document_id = str(document_id)
+        stale = {'$and': [
+            {'document_id': document_id},
+            {'chunk_index': {'$gte': chunk_count if chunk_count > 1 else 0}}
+        ]}
+        stores = self._stores_for_document(knowledge_base_id)
+        if self.shard_by_knowledge_base and knowledge_base_id:
+            current, previous = stores[:1], stores[1:]
+        else:
+            current, previous = stores, []
+        for store in current:
+            store.delete_where(stale)
+            if chunk_count > 1:
+                store.delete_documents([document_id])
+        for store in previous:
+            store.delete_where({'document_id': document_id})
+            store.delete_documents([document_id])
+        if self.lexical_index is not None:
+            self.lexical_index.delete_where(stale)
+            if chunk_count > 1:
+                self.lexical_index.delete([document_id])
+        self._bump_version(knowledge_base_id)
     
     def update_document(
         self,
@@ -184,11 +821,56 @@ Por favor, responde la pregunta usando el contexto proporcionado. Si el contexto
             content: Nuevo contenido.
             metadata: Nuevos metadatos.
         """
-        embedding = self.embedding_service.encode(content)
+        embedding = self.embedding_service.encode_documents([content])[0]
         
-        self.vector_store.update_document(
+        self._store_for((metadata or {}).get('knowledge_base_id')).update_document(
             id=document_id,
             document=content,
             embedding=embedding.tolist(),
             metadata=metadata
         )
+        self._index_lexical([document_id], [content], [metadata] if metadata else None)
+        self._bump_version((metadata or {}).get('knowledge_base_id'))
+    
+    def count(self) -> int:
+        """
+        Cuenta los chunks indexados, sumando todos los shards.
+        
+        Returns:
+            Número de chunks.
+        """
+        total = self.vector_store.count()
+        if self.shard_by_knowledge_base:
+            total += sum(
+                self._store_for(knowledge_base_id).count()
+                for knowledge_base_id in self._active_knowledge_base_ids()
+            )
+        return total
+    
+    def drop_knowledge_base(self, knowledge_base_id: str) -> None:
+        """
+        Elimina todos los chunks de una base de conocimiento. Con sharding
+        solo se vacía su colección.
+        
+        Args:
+            knowledge_base_id: ID de la base de conocimiento.
+        """
+        if self.shard_by_knowledge_base:
+            self._store_for(knowledge_base_id).clear()
+        else:
+            self.vector_store.delete_where({'knowledge_base_id': str(knowledge_base_id)})
+        if self.lexical_index is not None:
+            self.lexical_index.delete_where({'knowledge_base_id': str(knowledge_base_id)})
+        self.index_versions.bump([knowledge_base_id])
+    
+    def clear(self) -> None:
+        """
+        Elimina todos los chunks, incluidos los de todos los shards.
+        """
+        self.vector_store.clear()
+        if self.shard_by_knowledge_base:
+            for knowledge_base_id in self._active_knowledge_base_ids():
+                self._store_for(knowledge_base_id).clear()
+        if self.lexical_index is not None:
+            self.lexical_index.clear()
+        self.index_versions.bump_all()
@@ -0,0 +1,177 @@
+"""
+Reranking de candidatos con un cross-encoder.
+
+El bi-encoder (MiniLM) compara vectores calculados por separado; el
+cross-encoder lee la consulta y el chunk juntos y ordena mucho mejor, a
+cambio de una inferencia por par. Por eso solo se aplica sobre un conjunto
+pequeño de candidatos y las puntuaciones se guardan en la caché de Django:
+las preguntas frecuentes no vuelven a pasar por el modelo.
+"""
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.core.cache import caches
+
+from .query_cache import QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Puntúa pares (consulta, chunk) con un cross-encoder de Sentence
+    Transformers, con caché de puntuaciones por
+    (hash de la consulta, ID del chunk, hash del contenido del chunk).
+
+    El hash del contenido hace de versión del chunk: si se reindexa con otro
+    texto la entrada antigua deja de usarse sin invalidarla explícitamente.
+    """
+
+    KEY_PREFIX = 'rerank'
+
+    def __init__(
+        self,
+        model_name: str = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1',
+        revision: Optional[str] = None,
+        max_batch_size: int = 32,
+        max_length: int = 512,
+        cache_alias: Optional[str] = 'default',
+        cache_timeout: Optional[int] = 60 * 60 * 24
+    ):
+        """
+        Inicializa el reranker.
+
+        Args:
+            model_name: Cross-encoder de Sentence Transformers. Por defecto
+                       uno multilingüe entrenado en mMARCO.
+            revision: Revisión del modelo en el Hub.
+            max_batch_size: Pares por forward pass.
+            max_length: Tokens máximos de cada par (se trunca el chunk).
+            cache_alias: Alias de CACHES para las puntuaciones (None
+                        desactiva la caché).
+            cache_timeout: Tiempo de vida de cada puntuación en segundos.
+        """
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.revision = revision or 'main'
+        self.model = CrossEncoder(model_name, max_length=max_length, revision=revision)
+        self.max_batch_size = max_batch_size
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout
+        self._namespace = f"{self.KEY_PREFIX}:{model_name}:{self.revision}"
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query_digest: str, doc: Dict) -> str:
+        content_digest = hashlib.sha256(doc['content'].encode('utf-8')).hexdigest()[:16]
+        return f"{self._namespace}:{query_digest}:{doc['id']}:{content_digest}"
+
+    def _cached(self, keys: List[str]) -> Dict[str, float]:
+        if self.cache_alias is None:
+            return {}
+        try:
+            return caches[self.cache_alias].get_many(keys)
+        except Exception as e:
+            logger.warning(f"Caché de reranking no disponible: {e}")
+            return {}
+
+    def _store(self, scores: Dict[str, float]) -> None:
+        if self.cache_alias is None or not scores:
+            return
+        try:
+            caches[self.cache_alias].set_many(scores, timeout=self.cache_timeout)
+        except Exception as e:
+            logger.warning(f"No se pudo escribir en la caché de reranking: {e}")
+
+    def score(self, query: str, docs: List[Dict]) -> np.ndarray:
+        """
+        Puntúa cada documento frente a la consulta. Los pares que no están
+        en caché se evalúan en un único lote.
+
+        Args:
+            query: Consulta del usuario.
+            docs: Documentos con 'id' y 'content'.
+
+        Returns:
+            Puntuaciones en [0, 1], en el orden de docs.
+        """
+        if not docs:
+            return np.empty(0, dtype=np.float32)
+
+        query_digest = hashlib.sha1(
+            QueryEmbeddingCache.normalize(query).encode('utf-8')
+        ).hexdigest()
+        keys = [self._key(query_digest, doc) for doc in docs]
+        cached = self._cached(keys)
+
+        scores = np.empty(len(docs), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                scores[i] = cached[key]
+            else:
+                missing.append(i)
+
+        with self._lock:
+            self.hits += len(docs) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            predicted = self.model.predict(
+                [(query, docs[i]['content']) for i in missing],
+                batch_size=self.max_batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+            scores[missing] = predicted
+            self._store({keys[i]: float(score) for i, score in zip(missing, predicted)})
+
+        return scores
+
+    def rerank(
+        self,
+        query: str,
+        docs: List[Dict],
+        top_k: Optional[int] = None,
+        threshold: float = 0.0
+    ) -> List[Dict]:
+        """
+        Reordena documentos por la puntuación del cross-encoder, que se
+        añade a cada uno en 'rerank_score'.
+
+        Args:
+            query: Consulta del usuario.
+            docs: Candidatos.
+            top_k: Número máximo de documentos a devolver.
+            threshold: Puntuación mínima para conservar un documento.
+
+        Returns:
+            Documentos con puntuación >= threshold, de mayor a menor.
+        """
+        scores = self.score(query, docs)
+        order = np.argsort(-scores, kind='stable')
+        reranked = [
+            {**docs[i], 'rerank_score': float(scores[i])}
+            for i in order if scores[i] >= threshold
+        ]
+        return reranked[:top_k] if top_k is not None else reranked
+
+    def stats(self) -> Dict:
+        """
+        Retorna los contadores de la caché de puntuaciones.
+
+        Returns:
+            Diccionario con hits, misses y hit_rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,162 @@
+"""
+Operaciones vectorizadas de similitud sobre matrices de embeddings.
+
+Trabajan con matrices float32 normalizadas por filas, de modo que la
+similitud coseno se reduce a un producto matricial.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Normaliza cada fila a norma L2 unitaria.
+
+    Args:
+        matrix: Vector (d,) o matriz (n, d).
+
+    Returns:
+        Matriz float32 normalizada con la misma forma.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, np.float32(1e-12))
+
+
+def similarity_matrix(
+    a: np.ndarray,
+    b: Optional[np.ndarray] = None,
+    normalized: bool = True
+) -> np.ndarray:
+    """
+    Calcula la matriz de similitud coseno entre dos conjuntos.
+
+    Args:
+        a: Matriz (n, d).
+        b: Matriz (m, d). Si es None se compara a consigo misma.
+        normalized: Si las filas ya tienen norma unitaria.
+
+    Returns:
+        Matriz (n, m) de similitudes.
+    """
+    a = np.atleast_2d(np.asarray(a, dtype=np.float32))
+    b = a if b is None else np.atleast_2d(np.asarray(b, dtype=np.float32))
+    if not normalized:
+        a = normalize_rows(a)
+        b = a if b is a else normalize_rows(b)
+    return a @ b.T
+
+
+def top_k(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    k: int,
+    normalized: bool = True,
+    chunk_size: int = 1024,
+    exclude_self: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Obtiene los k vecinos más similares de cada consulta.
+    Procesa las consultas por bloques para no materializar la matriz completa.
+
+    Args:
+        queries: Matriz (n, d) de consultas.
+        corpus: Matriz (m, d) de candidatos.
+        k: Número de vecinos por consulta.
+        normalized: Si las filas ya tienen norma unitaria.
+        chunk_size: Consultas por bloque.
+        exclude_self: Ignorar la diagonal (queries y corpus son el mismo conjunto).
+
+    Returns:
+        Tupla (índices, scores), ambas de forma (n, k) y ordenadas de mayor a menor.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    corpus = np.atleast_2d(np.asarray(corpus, dtype=np.float32))
+    if not normalized:
+        queries = normalize_rows(queries)
+        corpus = normalize_rows(corpus)
+
+    n, m = queries.shape[0], corpus.shape[0]
+    k = min(k, m - 1 if exclude_self else m)
+    indices = np.empty((n, max(k, 0)), dtype=np.int64)
+    scores = np.empty((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+
+    for start in range(0, n, chunk_size):
+        block = queries[start:start + chunk_size] @ corpus.T
+        rows = np.arange(block.shape[0])
+        if exclude_self:
+            block[rows, rows + start] = -np.inf
+
+        if k < m:
+            part = np.argpartition(block, -k, axis=1)[:, -k:]
+        else:
+            part = np.broadcast_to(np.arange(m), block.shape).copy()
+        part_scores = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+
+        indices[start:start + block.shape[0]] = np.take_along_axis(part, order, axis=1)
+        scores[start:start + block.shape[0]] = np.take_along_axis(part_scores, order, axis=1)
+
+    return indices, scores
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    normalized: bool = False,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Selecciona k candidatos con Maximal Marginal Relevance: en cada paso
+    elige el que maximiza
+    lambda * sim(consulta, d) - (1 - lambda) * max sim(d, ya elegidos).
+
+    Args:
+        query: Vector (d,) de la consulta.
+        candidates: Matriz (n, d) de candidatos.
+        k: Número de candidatos a seleccionar.
+        lambda_mult: 1.0 ordena solo por relevancia; valores menores
+                     penalizan más la redundancia.
+        normalized: Si los vectores ya tienen norma unitaria.
+        relevance: Relevancia (n,) de cada candidato si no se quiere usar
+                   la similitud coseno con la consulta (p. ej. la
+                   puntuación de un cross-encoder).
+
+    Returns:
+        Índices de los candidatos elegidos, en orden de selección.
+    """
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=np.float32))
+    n = candidates.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+    query = np.asarray(query, dtype=np.float32).ravel()
+    if not normalized:
+        query = normalize_rows(query)
+        candidates = normalize_rows(candidates)
+
+    if relevance is None:
+        relevance = candidates @ query
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    # Máxima similitud de cada candidato con los ya elegidos
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return selected
@@ -1,8 +1,14 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Union
+import logging
+import time
 import uuid
+import numpy as np
 from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
 
 # Importar configuración para silenciar warnings de ChromaDB
 try:
@@ -15,31 +21,126 @@ class VectorStore:
     Servicio para gestionar la base de datos vectorial usando ChromaDB.
     """
     
-    def __init__(self, collection_name: str = "knowbot_knowledge"):
+    # Tamaño de lote por defecto si el cliente no expone max_batch_size
+    DEFAULT_BATCH_SIZE = 5000
+    WRITE_MODES = ('skip', 'upsert')
+    # El conteo se comparte entre workers en la caché y se recalcula con
+    # collection.count() cuando expira la clave
+    COUNT_CACHE_TIMEOUT = 300
+    COUNT_LOCAL_TTL = 5.0
+    # Parámetros HNSW admitidos (valores por defecto de ChromaDB). search_ef
+    # se aplica al cargar la colección; M y construction_ef solo al construir
+    # el índice, así que cambiarlos exige vaciar la colección y reindexar
+    # (o export_vector_index / import_vector_index)
+    HNSW_PARAMS = {'M': 16, 'construction_ef': 100, 'search_ef': 10}
+    
+    def __init__(
+        self,
+        collection_name: str = "knowbot_knowledge",
+        client=None,
+        path: Optional[str] = None,
+        cache_alias: str = 'default',
+        hnsw: Optional[Dict[str, int]] = None
+    ):
         """
         Inicializa el vector store.
         
         Args:
             collection_name: Nombre de la colección en ChromaDB.
+            client: Cliente de ChromaDB compartido. Si no se indica se crea uno.
+            path: Directorio de persistencia. Por defecto usa CHROMA_DB_PATH.
+            cache_alias: Alias de CACHES donde se comparte el conteo.
+            hnsw: Parámetros HNSW de la colección ('M', 'construction_ef',
+                  'search_ef'). Los omitidos usan los valores de ChromaDB.
         """
-        # Usar la nueva API de ChromaDB con telemetría desactivada
-        from chromadb.config import Settings
-        self.client = chromadb.PersistentClient(
-            path="./chroma_db",
-            settings=Settings(anonymized_telemetry=False)
-        )
+        if client is None:
+            # Usar la nueva API de ChromaDB con telemetría desactivada
+            client = chromadb.PersistentClient(
+                path=str(path or getattr(settings, 'CHROMA_DB_PATH', './chroma_db')),
+                settings=Settings(anonymized_telemetry=False)
+            )
+        self.client = client
+        self.name = collection_name
+        self.collection_metadata = self.hnsw_metadata(hnsw)
         
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+            metadata=self._merge_hnsw_metadata(collection_name)
         )
+        self.cache_alias = cache_alias
+        self._count_key = f"vector_count:{collection_name}"
+        self._local_count = None
+    
+    @classmethod
+    def hnsw_metadata(cls, hnsw: Optional[Dict[str, int]] = None) -> Dict:
+        """
+        Construye los metadatos de colección de ChromaDB para unos
+        parámetros HNSW.
+        
+        Args:
+            hnsw: Parámetros 'M', 'construction_ef' y/o 'search_ef'.
+        
+        Returns:
+            Metadatos con 'hnsw:space' y los parámetros indicados.
+        """
+        metadata = {"hnsw:space": "cosine"}
+        for key, value in (hnsw or {}).items():
+            if key not in cls.HNSW_PARAMS:
+                raise ValueError(f"Parámetro HNSW no soportado: {key}")
+            if value:
+                metadata[f"hnsw:{key}"] = int(value)
+        return metadata
+    
+    def _merge_hnsw_metadata(self, collection_name: str) -> Dict:
+        """
+        Metadatos con los que abrir la colección. ChromaDB reemplaza los
+        metadatos de una colección existente, así que se conservan los suyos
+        y los parámetros con los que se construyó el índice (M y
+        construction_ef); solo search_ef se actualiza.
+        """
+        try:
+            existing = self.client.get_collection(name=collection_name).metadata or {}
+        except ValueError:
+            return self.collection_metadata
+
+        metadata = {**existing, **self.collection_metadata}
+        for key in ("hnsw:M", "hnsw:construction_ef"):
+            built = existing.get(key, self.HNSW_PARAMS[key[5:]])
+            if metadata.get(key, built) != built:
+                logger.warning(
+                    f"La colección {collection_name} se construyó con {key}={built} "
+                    f"(configurado {metadata[key]}); vacíala y reindexa para aplicarlo"
+                )
+            metadata.pop(key, None)
+            if key in existing:
+                metadata[key] = existing[key]
+        return metadata
+    
+    @property
+    def hnsw(self) -> Dict[str, int]:
+        """
+        Parámetros HNSW registrados en la colección.
+        """
+        metadata = self.collection.metadata or {}
+        return {
+            key: metadata.get(f"hnsw:{key}", default)
+            for key, default in self.HNSW_PARAMS.items()
+        }
+    
+    @property
+    def max_batch_size(self) -> int:
+        """
+        Número máximo de registros que ChromaDB acepta en una escritura.
+        """
+        return getattr(self.client, 'max_batch_size', None) or self.DEFAULT_BATCH_SIZE
     
     def add_documents(
         self,
         documents: List[str],
-        embeddings: List[List[float]],
+        embeddings: Union[np.ndarray, List[List[float]]],
         metadatas: Optional[List[Dict]] = None,
-        ids: Optional[List[str]] = None
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip'
     ) -> List[str]:
         """
         Agrega documentos a la base vectorial.
@@ -47,9 +148,10 @@ class VectorStore:
         
         Args:
             documents: Lista de documentos.
-            embeddings: Lista de embeddings.
+            embeddings: Matriz NumPy o lista de embeddings.
             metadatas: Metadatos opcionales.
             ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
             
         Returns:
             Lista de IDs de los documentos agregados.
@@ -57,69 +159,152 @@ class VectorStore:
         if ids is None:
             ids = [str(uuid.uuid4()) for _ in documents]
         
+        self.write_documents(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids,
+            mode=mode
+        )
+        
+        return ids
+    
+    def write_documents(
+        self,
+        documents: List[str],
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadatas: Optional[List[Dict]] = None,
+        ids: Optional[List[str]] = None,
+        mode: str = 'skip',
+        batch_size: Optional[int] = None
+    ) -> Dict:
+        """
+        Escribe documentos en lotes acotados por max_batch_size.
+        La comprobación de existencia solo recupera IDs, no documentos ni metadatos.
+        
+        Args:
+            documents: Lista de documentos.
+            embeddings: Matriz NumPy o lista de embeddings.
+            metadatas: Metadatos opcionales.
+            ids: IDs opcionales para los documentos.
+            mode: 'skip' omite los IDs existentes, 'upsert' los actualiza.
+            batch_size: Registros por lote (por defecto max_batch_size).
+            
+        Returns:
+            Diccionario con 'ids', totales 'inserted', 'updated', 'skipped'
+            y el detalle por lote en 'batches'.
+        """
+        if mode not in self.WRITE_MODES:
+            raise ValueError(f"Modo de escritura no soportado: {mode}")
+        
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+        
         if metadatas is None:
             metadatas = [{} for _ in documents]
         
-        # Verificar IDs existentes para evitar warnings
+        batch_size = min(batch_size or self.max_batch_size, self.max_batch_size)
+        stats = {'ids': ids, 'inserted': 0, 'updated': 0, 'skipped': 0, 'batches': []}
+        
         try:
-            existing = self.collection.get(ids=ids)
-            existing_ids = set(existing['ids']) if existing and 'ids' in existing else set()
-        except:
-            existing_ids = set()
-        
-        # Filtrar solo documentos nuevos
-        new_docs = []
-        new_embeddings = []
-        new_metadatas = []
-        new_ids = []
-        
-        for doc, emb, meta, id in zip(documents, embeddings, metadatas, ids):
-            if id not in existing_ids:
-                new_docs.append(doc)
-                new_embeddings.append(emb)
-                new_metadatas.append(meta)
-                new_ids.append(id)
-        
-        # Solo agregar si hay documentos nuevos
-        if new_ids:
-            self.collection.add(
-                documents=new_docs,
-                embeddings=new_embeddings,
-                metadatas=new_metadatas,
-                ids=new_ids
-            )
+            for start in range(0, len(ids), batch_size):
+                started = time.perf_counter()
+                end = start + batch_size
+                batch_ids = ids[start:end]
+                existing_ids = self._existing_ids(batch_ids)
+                
+                if mode == 'upsert':
+                    positions = list(range(len(batch_ids)))
+                else:
+                    positions = [i for i, id in enumerate(batch_ids) if id not in existing_ids]
+                
+                if positions:
+                    batch_embeddings = embeddings[start:end]
+                    if isinstance(batch_embeddings, np.ndarray):
+                        batch_embeddings = batch_embeddings[positions].tolist()
+                    else:
+                        batch_embeddings = [list(batch_embeddings[i]) for i in positions]
+                    
+                    write = self.collection.upsert if mode == 'upsert' else self.collection.add
+                    write(
+                        documents=[documents[start + i] for i in positions],
+                        embeddings=batch_embeddings,
+                        metadatas=[metadatas[start + i] for i in positions],
+                        ids=[batch_ids[i] for i in positions]
+                    )
+                
+                updated = len(existing_ids) if mode == 'upsert' else 0
+                batch_stats = {
+                    'size': len(batch_ids),
+                    'inserted': len(positions) - updated,
+                    'updated': updated,
+                    'skipped': len(batch_ids) - len(positions),
+                    'seconds': time.perf_counter() - started,
+                }
+                stats['batches'].append(batch_stats)
+                for key in ('inserted', 'updated', 'skipped'):
+                    stats[key] += batch_stats[key]
+        except Exception:
+            # Los lotes anteriores ya se escribieron: el conteo cacheado no es fiable
+            self._invalidate_count()
+            raise
         
-        return ids
+        self._adjust_count(stats['inserted'])
+        return stats
+    
+    def _existing_ids(self, ids: List[str]) -> Set[str]:
+        """
+        Retorna cuáles de los IDs ya existen, sin traer documentos ni metadatos.
+        Un fallo se propaga: suponer que no existe ninguno inflaría el conteo.
+        """
+        try:
+            existing = self.collection.get(ids=ids, include=[])
+        except Exception as e:
+            logger.error(f"No se pudieron consultar los IDs existentes: {e}")
+            raise
+        return set(existing['ids']) if existing and 'ids' in existing else set()
     
     def search(
         self,
         query_embedding: List[float],
         n_results: int = 5,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        include_embeddings: bool = False
     ) -> Dict:
         """
         Busca documentos similares a un embedding de consulta.
+        Si la colección tiene menos documentos que n_results, ChromaDB
+        ajusta n_results y devuelve los que haya (ninguno si está vacía).
         
         Args:
             query_embedding: Embedding de la consulta.
             n_results: Número de resultados a retornar.
             where: Filtros opcionales de metadatos.
+            include_embeddings: Devolver también los embeddings de los
+                                resultados en 'embeddings'.
             
         Returns:
             Diccionario con documentos, distancias y metadatos.
         """
+        include = ['documents', 'distances', 'metadatas'] + (['embeddings'] if include_embeddings else [])
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=n_results,
-            where=where
+            where=where,
+            include=include
         )
         
-        return {
+        found = {
             'documents': results['documents'][0] if results['documents'] else [],
             'distances': results['distances'][0] if results['distances'] else [],
             'metadatas': results['metadatas'][0] if results['metadatas'] else [],
             'ids': results['ids'][0] if results['ids'] else []
         }
+        if include_embeddings:
+            found['embeddings'] = np.asarray(
+                results['embeddings'][0] if results['embeddings'] else [], dtype=np.float32
+            )
+        return found
     
     def delete_documents(self, ids: List[str]) -> None:
         """
@@ -128,7 +313,19 @@ class VectorStore:
         Args:
             ids: Lista de IDs de documentos a eliminar.
         """
+        existing_ids = self._existing_ids(ids)
         self.collection.delete(ids=ids)
+        self._adjust_count(-len(existing_ids))
+    
+    def delete_where(self, where: Dict) -> None:
+        """
+        Elimina los documentos que cumplen un filtro de metadatos.
+        
+        Args:
+            where: Filtro de metadatos (p. ej. {'knowledge_base_id': '...'}).
+        """
+        self.collection.delete(where=where)
+        self._invalidate_count()
     
     def update_document(
         self,
@@ -153,14 +350,133 @@ class VectorStore:
             metadatas=[metadata] if metadata else None
         )
     
+    def sample(self, limit: int = 1000) -> Dict:
+        """
+        Obtiene una muestra de documentos almacenados.
+        
+        Args:
+            limit: Número máximo de documentos.
+            
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas'.
+        """
+        results = self.collection.get(limit=limit, include=['documents', 'metadatas'])
+        return {
+            'ids': results['ids'],
+            'documents': results['documents'],
+            'metadatas': results['metadatas']
+        }
+    
+    def get_documents(self, ids: List[str], include_embeddings: bool = False) -> Dict:
+        """
+        Obtiene varios documentos por ID en una sola consulta.
+        
+        Args:
+            ids: IDs a buscar.
+            include_embeddings: Devolver también sus embeddings en
+                                'embeddings' (matriz float32).
+            
+        Returns:
+            Diccionario con 'ids', 'documents' y 'metadatas' de los IDs
+            que existen.
+        """
+        if not ids:
+            empty = {'ids': [], 'documents': [], 'metadatas': []}
+            if include_embeddings:
+                empty['embeddings'] = np.empty((0, 0), dtype=np.float32)
+            return empty
+        include = ['documents', 'metadatas'] + (['embeddings'] if include_embeddings else [])
+        results = self.collection.get(ids=ids, include=include)
+        found = {
+            'ids': results['ids'],
+            'documents': results['documents'],
+            'metadatas': results['metadatas']
+        }
+        if include_embeddings:
+            found['embeddings'] = np.asarray(results['embeddings'] or [], dtype=np.float32)
+        return found
+    
+    def iter_records(self, batch_size: int = 1000, embeddings: bool = True):
+        """
+        Recorre todos los registros con sus embeddings, por lotes.
+        
+        Args:
+            batch_size: Registros por lote.
+            embeddings: Si es False no se leen los vectores.
+            
+        Yields:
+            Diccionarios con 'ids', 'documents', 'metadatas' y 'embeddings'
+            (matriz float32, o None si embeddings es False).
+        """
+        include = ['documents', 'metadatas'] + (['embeddings'] if embeddings else [])
+        offset = 0
+        while True:
+            results = self.collection.get(limit=batch_size, offset=offset, include=include)
+            if not results['ids']:
+                return
+            yield {
+                'ids': results['ids'],
+                'documents': results['documents'],
+                'metadatas': results['metadatas'],
+                'embeddings': (
+                    np.asarray(results['embeddings'], dtype=np.float32) if embeddings else None
+                )
+            }
+            offset += len(results['ids'])
+    
     def count(self) -> int:
         """
         Retorna el número de documentos en la colección.
+        Usa el conteo mantenido en memoria y en la caché compartida; solo
+        consulta a ChromaDB cuando ninguno de los dos lo tiene.
         
         Returns:
             Número de documentos.
         """
-        return self.collection.count()
+        now = time.monotonic()
+        if self._local_count is not None and self._local_count[1] > now:
+            return self._local_count[0]
+        
+        count = None
+        try:
+            count = caches[self.cache_alias].get(self._count_key)
+        except Exception as e:
+            logger.debug(f"Caché de conteo no disponible: {e}")
+        
+        if count is None:
+            count = self.collection.count()
+            try:
+                caches[self.cache_alias].set(self._count_key, count, timeout=self.COUNT_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.debug(f"No se pudo guardar el conteo: {e}")
+        
+        self._local_count = (count, now + self.COUNT_LOCAL_TTL)
+        return count
+    
+    def _adjust_count(self, delta: int) -> None:
+        """
+        Actualiza el conteo compartido tras una escritura.
+        """
+        if not delta:
+            return
+        try:
+            count = caches[self.cache_alias].incr(self._count_key, delta)
+        except ValueError:
+            # La clave expiró: la siguiente lectura la recalcula
+            self._local_count = None
+            return
+        except Exception as e:
+            logger.debug(f"No se pudo actualizar el conteo: {e}")
+            self._local_count = None
+            return
+        self._local_count = (count, time.monotonic() + self.COUNT_LOCAL_TTL)
+    
+    def _invalidate_count(self) -> None:
+        self._local_count = None
+        try:
+            caches[self.cache_alias].delete(self._count_key)
+        except Exception as e:
+            logger.debug(f"No se pudo invalidar el conteo: {e}")
     
     def clear(self) -> None:
         """
@@ -169,5 +485,6 @@ class VectorStore:
         self.client.delete_collection(self.collection.name)
         self.collection = self.client.get_or_create_collection(
             name=self.collection.name,
-            metadata={"hnsw:space": "cosine"}
+            metadata=self.collection_metadata
         )
+        self._invalidate_count()
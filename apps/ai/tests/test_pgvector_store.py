@@ -0,0 +1,60 @@
+"""
+Búsquedas filtradas del backend pgvector. Requieren PostgreSQL con la
+extensión pgvector y la app apps.vectors instalada.
+"""
+from unittest import skipUnless
+
+import numpy as np
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase
+
+PGVECTOR_AVAILABLE = connection.vendor == 'postgresql' and apps.is_installed('apps.vectors')
+
+
+@skipUnless(PGVECTOR_AVAILABLE, 'Requiere PostgreSQL con pgvector (VECTOR_STORE_BACKEND=pgvector)')
+class PgVectorFilteredSearchTests(TestCase):
+    DIMENSION = 384
+
+    def setUp(self):
+        from apps.ai.services.pgvector_store import PgVectorStore
+
+        rng = np.random.default_rng(0)
+        self.query = np.zeros(self.DIMENSION, dtype=np.float32)
+        self.query[0] = 1.0
+
+        # Otra colección con muchos vectores casi idénticos a la consulta:
+        # ocupan todos los candidatos del índice HNSW compartido
+        crowd = np.tile(self.query, (2000, 1)) + rng.normal(scale=0.01, size=(2000, self.DIMENSION))
+        PgVectorStore('test_crowd').add_documents(
+            documents=[f'crowd {i}' for i in range(len(crowd))],
+            embeddings=crowd,
+            ids=[f'crowd-{i}' for i in range(len(crowd))]
+        )
+
+        self.store = PgVectorStore('test_target')
+        target = rng.normal(size=(50, self.DIMENSION))
+        self.store.add_documents(
+            documents=[f'target {i}' for i in range(len(target))],
+            embeddings=target,
+            metadatas=[{'group': 'even' if i % 2 == 0 else 'odd'} for i in range(len(target))],
+            ids=[f'target-{i}' for i in range(len(target))]
+        )
+
+    def test_collection_filter_returns_k_rows(self):
+        results = self.store.search(self.query.tolist(), n_results=10)
+
+        self.assertEqual(len(results['ids']), 10)
+        self.assertTrue(all(id.startswith('target-') for id in results['ids']))
+        self.assertEqual(results['distances'], sorted(results['distances']))
+
+    def test_metadata_filter_returns_k_rows(self):
+        results = self.store.search(self.query.tolist(), n_results=10, where={'group': 'odd'})
+
+        self.assertEqual(len(results['ids']), 10)
+        self.assertTrue(all(metadata['group'] == 'odd' for metadata in results['metadatas']))
+
+    def test_fewer_matches_than_k(self):
+        results = self.store.search(self.query.tolist(), n_results=100)
+
+        self.assertEqual(len(results['ids']), 50)
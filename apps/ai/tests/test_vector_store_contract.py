@@ -0,0 +1,217 @@
+"""
+Contrato común de los vector stores: el backend NumPy debe comportarse como
+el de ChromaDB en escritura, búsqueda, filtros y borrado.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from apps.ai.services.numpy_vector_store import NumpyVectorStore
+
+try:
+    from apps.ai.services.vector_store import VectorStore
+    CHROMA_AVAILABLE = True
+except ImportError:
+    CHROMA_AVAILABLE = False
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _clear_and_rewrite(path: str, collection_name: str) -> None:
+    """
+    Otro proceso vacía la colección y vuelve a crear el log.
+    """
+    store = NumpyVectorStore(collection_name, path=path)
+    store.clear()
+    store.add_documents(
+        documents=['fresh'],
+        embeddings=np.array([[0.0, 0.0, 0.0, 1.0]]),
+        metadatas=[{'group': 'new'}],
+        ids=['fresh']
+    )
+
+
+class VectorStoreContract:
+    """
+    Pruebas que cada backend ejecuta contra su propio store.
+    """
+
+    COLLECTION = 'contract_tests'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        self.store = self.make_store()
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def add_sample(self):
+        self.store.add_documents(
+            documents=['uno', 'dos', 'tres'],
+            embeddings=np.eye(3, 4),
+            metadatas=[
+                {'group': 'a', 'n': 1},
+                {'group': 'b', 'n': 2},
+                {'group': 'a', 'n': 3},
+            ],
+            ids=['d1', 'd2', 'd3']
+        )
+
+    def test_write_skip_and_upsert(self):
+        self.add_sample()
+
+        skipped = self.store.write_documents(
+            documents=['uno bis', 'cuatro'],
+            embeddings=np.eye(2, 4),
+            metadatas=[{'group': 'a'}, {'group': 'c'}],
+            ids=['d1', 'd4'],
+            mode='skip'
+        )
+        self.assertEqual((skipped['inserted'], skipped['updated'], skipped['skipped']), (1, 0, 1))
+        self.assertEqual(self.store.get_documents(['d1'])['documents'], ['uno'])
+
+        upserted = self.store.write_documents(
+            documents=['uno bis'],
+            embeddings=np.eye(1, 4),
+            metadatas=[{'group': 'a'}],
+            ids=['d1'],
+            mode='upsert'
+        )
+        self.assertEqual((upserted['inserted'], upserted['updated']), (0, 1))
+        self.assertEqual(self.store.get_documents(['d1'])['documents'], ['uno bis'])
+        self.assertEqual(self.store.count(), 4)
+
+    def test_search_orders_by_distance(self):
+        self.add_sample()
+
+        results = self.store.search([1.0, 0.1, 0.0, 0.0], n_results=2)
+
+        self.assertEqual(results['ids'], ['d1', 'd2'])
+        self.assertEqual(results['documents'], ['uno', 'dos'])
+        self.assertEqual(results['distances'], sorted(results['distances']))
+        self.assertAlmostEqual(results['distances'][0], 1 - 1 / np.sqrt(1.01), places=4)
+
+    def test_search_more_results_than_documents(self):
+        self.add_sample()
+
+        self.assertEqual(len(self.store.search([1.0, 0.0, 0.0, 0.0], n_results=10)['ids']), 3)
+
+    def test_search_empty_collection(self):
+        results = self.store.search([1.0, 0.0, 0.0, 0.0], n_results=5)
+
+        self.assertEqual(results['ids'], [])
+        self.assertEqual(results['documents'], [])
+
+    def test_search_include_embeddings(self):
+        self.add_sample()
+
+        results = self.store.search([0.0, 1.0, 0.0, 0.0], n_results=1, include_embeddings=True)
+
+        np.testing.assert_allclose(results['embeddings'][0], [0.0, 1.0, 0.0, 0.0], atol=1e-6)
+
+    def test_search_where(self):
+        self.add_sample()
+        query = [1.0, 1.0, 1.0, 0.0]
+
+        self.assertEqual(
+            sorted(self.store.search(query, 10, where={'group': 'a'})['ids']), ['d1', 'd3']
+        )
+        self.assertEqual(
+            sorted(self.store.search(query, 10, where={'n': {'$in': [2, 3]}})['ids']), ['d2', 'd3']
+        )
+        self.assertEqual(
+            self.store.search(query, 10, where={'$and': [{'group': 'a'}, {'n': {'$gt': 1}}]})['ids'],
+            ['d3']
+        )
+        self.assertEqual(self.store.search(query, 10, where={'group': 'z'})['ids'], [])
+
+    def test_where_is_type_strict(self):
+        self.store.add_documents(
+            documents=['bool', 'int', 'float'],
+            embeddings=np.eye(3, 4),
+            metadatas=[{'flag': True}, {'flag': 1}, {'flag': 1.0}],
+            ids=['b', 'i', 'f']
+        )
+        query = [1.0, 1.0, 1.0, 0.0]
+
+        self.assertEqual(self.store.search(query, 10, where={'flag': True})['ids'], ['b'])
+        self.assertEqual(self.store.search(query, 10, where={'flag': 1})['ids'], ['i'])
+        self.assertEqual(self.store.search(query, 10, where={'flag': 1.0})['ids'], ['f'])
+
+    def test_delete_documents_and_where(self):
+        self.add_sample()
+
+        self.store.delete_documents(['d2'])
+        self.assertEqual(self.store.count(), 2)
+
+        self.store.delete_where({'group': 'a'})
+        self.assertEqual(self.store.count(), 0)
+        self.assertEqual(self.store.search([1.0, 0.0, 0.0, 0.0], 5)['ids'], [])
+
+    def test_get_documents(self):
+        self.add_sample()
+
+        found = self.store.get_documents(['d3', 'missing'], include_embeddings=True)
+
+        self.assertEqual(found['ids'], ['d3'])
+        self.assertEqual(found['metadatas'][0]['group'], 'a')
+        np.testing.assert_allclose(found['embeddings'][0], [0.0, 0.0, 1.0, 0.0], atol=1e-6)
+
+    def test_clear(self):
+        self.add_sample()
+
+        self.store.clear()
+
+        self.assertEqual(self.store.count(), 0)
+        self.add_sample()
+        self.assertEqual(self.store.count(), 3)
+
+
+class NumpyVectorStoreContractTests(VectorStoreContract, SimpleTestCase):
+
+    def make_store(self):
+        return NumpyVectorStore(self.COLLECTION, path=self.path)
+
+    def test_sees_writes_from_another_instance(self):
+        reader = self.make_store()
+        self.add_sample()
+
+        self.assertEqual(reader.count(), 3)
+        self.assertEqual(reader.search([0.0, 0.0, 1.0, 0.0], 1)['ids'], ['d3'])
+
+    @skipUnless(hasattr(os, 'fork'), 'Requiere fork')
+    def test_refresh_after_clear_in_another_process(self):
+        self.add_sample()
+        self.assertEqual(self.store.count(), 3)
+
+        process = multiprocessing.get_context('fork').Process(
+            target=_clear_and_rewrite, args=(self.path, self.COLLECTION)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(self.store.search([0.0, 0.0, 0.0, 1.0], 5)['ids'], ['fresh'])
+        self.assertEqual(self.store.search([0.0, 0.0, 0.0, 1.0], 5, where={'group': 'a'})['ids'], [])
+
+
+@skipUnless(CHROMA_AVAILABLE, 'Requiere chromadb')
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChromaVectorStoreContractTests(VectorStoreContract, SimpleTestCase):
+
+    def setUp(self):
+        # El conteo se cachea por nombre de colección y sobreviviría al
+        # directorio temporal de la prueba anterior
+        caches['default'].clear()
+        super().setUp()
+
+    def make_store(self):
+        return VectorStore(self.COLLECTION, path=self.path)
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.ai.services import get_answer_cache
+import json
+
+
+class Command(BaseCommand):
+    help = 'Muestra las métricas de la caché semántica de respuestas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Imprimir las métricas en JSON (para monitorización)'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Poner a cero las métricas después de mostrarlas'
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Eliminar las respuestas caducadas (índice modificado o TTL vencido)'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Eliminar todas las respuestas guardadas'
+        )
+
+    def handle(self, *args, **options):
+        answer_cache = get_answer_cache()
+        if answer_cache is None:
+            raise CommandError('La caché de respuestas está desactivada (ANSWER_CACHE_ENABLED=False)')
+
+        stats = answer_cache.stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+        else:
+            lookups = stats['hits'] + stats['misses']
+            self.stdout.write('\n' + '='*50)
+            self.stdout.write(self.style.SUCCESS('CACHÉ SEMÁNTICA DE RESPUESTAS'))
+            self.stdout.write('='*50)
+            self.stdout.write(f'Respuestas guardadas: {stats["entries"]}')
+            self.stdout.write(f'Consultas: {lookups}')
+            self.stdout.write(f'  Aciertos: {stats["hits"]} ({stats["hit_rate"]:.1%})')
+            self.stdout.write(f'  Fallos: {stats["misses"]}')
+            self.stdout.write(f'Respuestas caducadas eliminadas: {stats["stale"]}')
+            self.stdout.write(f'Respuestas añadidas: {stats["stores"]}')
+            saved = stats['saved_ms'] / 1000
+            per_hit = stats['saved_ms'] / stats['hits'] if stats['hits'] else 0
+            self.stdout.write(f'Tiempo ahorrado: {saved:.1f}s ({per_hit:.0f} ms por acierto)')
+            self.stdout.write('='*50)
+
+        if options['reset']:
+            answer_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('✓ Métricas reiniciadas'))
+        if options['purge']:
+            removed = answer_cache.purge()
+            self.stdout.write(self.style.SUCCESS(f'✓ Respuestas caducadas eliminadas: {removed}'))
+        if options['clear']:
+            answer_cache.clear()
+            self.stdout.write(self.style.SUCCESS('✓ Respuestas eliminadas'))
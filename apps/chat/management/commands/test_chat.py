@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from apps.ai.services import ChatOrchestrator
+from apps.ai.services import get_chat_orchestrator
 from apps.users.models import User
 from apps.chat.models import Conversation
 
@@ -26,7 +26,7 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        orchestrator = ChatOrchestrator()
+        orchestrator = get_chat_orchestrator()
 
         # Obtener o crear usuario de prueba
         if options['user_id']:
@@ -2,7 +2,7 @@ import asyncio
 from typing import Dict, Optional
 from django.utils import timezone
 try:
-    from apps.ai.services import ChatOrchestrator
+    from apps.ai.services import get_chat_orchestrator
     AI_AVAILABLE = True
 except ImportError:
     AI_AVAILABLE = False
@@ -21,7 +21,7 @@ class MessageHandler:
     """
     
     def __init__(self):
-        self.chat_orchestrator = ChatOrchestrator()
+        self.chat_orchestrator = get_chat_orchestrator() if AI_AVAILABLE else None
     
     async def handle_whatsapp_message(
         self,
@@ -164,47 +164,47 @@ class MessageHandler:
         Returns:
             Diccionario con la respuesta y metadata
         """
+        if AI_AVAILABLE:
+            # ChatOrchestrator ya guarda los mensajes internamente; la
+            # recuperación corre en su propio pool, no en el executor por defecto
+            return await self.chat_orchestrator.aprocess_message(
+                conversation_id=conversation_id,
+                user_message=user_message,
+                use_rag=True,
+                n_context_docs=5
+            )
+        
         loop = asyncio.get_event_loop()
         
         def _process():
-            # ChatOrchestrator ya guarda los mensajes internamente
-            if AI_AVAILABLE:
-                result = self.chat_orchestrator.process_message(
-                    conversation_id=conversation_id,
-                    user_message=user_message,
-                    use_rag=True,
-                    n_context_docs=5
-                )
-                return result
-            else:
-                # Fallback: guardar manualmente y usar Gemini
-                from apps.chat.models import Conversation, Message
-                conversation = Conversation.objects.get(id=conversation_id)
-                
-                # Guardar mensaje del usuario
-                Message.objects.create(
-                    conversation=conversation,
-                    content=user_message,
-                    role='user'
-                )
-                
-                # Generar respuesta con Gemini
-                response_text = asyncio.run(
-                    self._generate_response_with_gemini_only(user_message)
-                )
-                
-                # Guardar respuesta del bot
-                bot_msg = Message.objects.create(
-                    conversation=conversation,
-                    content=response_text,
-                    role='assistant'
-                )
-                
-                return {
-                    'content': response_text,
-                    'message_id': str(bot_msg.id),
-                    'conversation_id': conversation_id
-                }
+            # Fallback: guardar manualmente y usar Gemini
+            from apps.chat.models import Conversation, Message
+            conversation = Conversation.objects.get(id=conversation_id)
+            
+            # Guardar mensaje del usuario
+            Message.objects.create(
+                conversation=conversation,
+                content=user_message,
+                role='user'
+            )
+            
+            # Generar respuesta con Gemini
+            response_text = asyncio.run(
+                self._generate_response_with_gemini_only(user_message)
+            )
+            
+            # Guardar respuesta del bot
+            bot_msg = Message.objects.create(
+                conversation=conversation,
+                content=response_text,
+                role='assistant'
+            )
+            
+            return {
+                'content': response_text,
+                'message_id': str(bot_msg.id),
+                'conversation_id': conversation_id
+            }
         
         return await loop.run_in_executor(None, _process)
     
@@ -242,7 +242,7 @@ Asistente:"""
         """
         try:
             if AI_AVAILABLE:
-                orchestrator = ChatOrchestrator()
+                orchestrator = get_chat_orchestrator()
                 response = await orchestrator.process_message(
                     message=message,
                     conversation_id=conversation_id,
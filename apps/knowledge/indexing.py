@@ -0,0 +1,142 @@
+"""
+Troceado y vectorización de documentos para index_knowledge.
+
+Este módulo se importa en los procesos hijos (spawn) antes de django.setup(),
+así que no importa modelos ni servicios a nivel de módulo: se importan dentro
+de las funciones, cuando Django ya está inicializado.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+
+def build_chunks(
+    document_id: str,
+    content: str,
+    base_metadata: Dict,
+    chunk_size: int,
+    overlap: int,
+    chunk_tokens: Optional[int] = None,
+    embedding_service=None
+) -> List[Dict]:
+    """
+    Divide un documento en chunks listos para indexar. Con chunk_tokens se
+    trocea por tokens del modelo de embeddings en lugar de por caracteres
+    (y overlap se interpreta en tokens).
+
+    Args:
+        document_id: ID del documento.
+        content: Texto del documento.
+        base_metadata: Metadata común a todos sus chunks.
+        chunk_size: Tamaño de los chunks en caracteres.
+        overlap: Solape entre chunks.
+        chunk_tokens: Tamaño de los chunks en tokens (opcional).
+        embedding_service: Servicio cuyo tokenizer se usa con chunk_tokens.
+
+    Returns:
+        Lista de diccionarios con 'id', 'content' y 'metadata'.
+    """
+    from apps.ai.services import DocumentProcessor
+    from apps.ai.services.passages import chunk_id
+
+    if chunk_tokens:
+        chunks = embedding_service.split_by_tokens(content, chunk_tokens, overlap)
+    elif len(content) > chunk_size:
+        chunks = DocumentProcessor.chunk_text(content, chunk_size=chunk_size, overlap=overlap)
+    else:
+        chunks = [content]
+
+    if len(chunks) == 1:
+        # Indexar documento completo
+        return [{'id': str(document_id), 'content': content, 'metadata': base_metadata}]
+
+    return [
+        {
+            'id': chunk_id(document_id, i),
+            'content': chunk,
+            'metadata': {**base_metadata, 'chunk_index': i, 'total_chunks': len(chunks)},
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def embed_documents(
+    document_ids: List[str],
+    chunk_size: int,
+    overlap: int,
+    chunk_tokens: Optional[int] = None
+) -> Dict:
+    """
+    Trocea y vectoriza un grupo de documentos. No escribe en el vector store:
+    el proceso principal hace todas las escrituras para evitar contención.
+
+    Returns:
+        Diccionario con los resultados por documento y estadísticas del worker.
+    """
+    from apps.ai.services import get_embedding_service
+    from apps.knowledge.models import Document
+
+    embedding_service = get_embedding_service()
+    documents = Document.objects.filter(id__in=document_ids).values(
+        'id', 'title', 'content', 'file_url', 'knowledge_base_id',
+        'knowledge_base__title', 'knowledge_base__category'
+    )
+
+    results = []
+    encode_seconds = 0.0
+    for doc in documents:
+        if doc['file_url']:
+            # TODO: Descargar archivo desde URL
+            results.append({'title': doc['title'], 'status': 'skipped',
+                            'message': f'Archivo externo no soportado aún: {doc["file_url"]}'})
+            continue
+        if not doc['content'] or len(doc['content'].strip()) == 0:
+            results.append({'title': doc['title'], 'status': 'skipped',
+                            'message': 'Documento sin contenido, omitiendo'})
+            continue
+
+        try:
+            base_metadata = {
+                'document_id': str(doc['id']),
+                'document_title': doc['title'],
+                'knowledge_base_id': str(doc['knowledge_base_id']),
+                'knowledge_base_title': doc['knowledge_base__title'],
+                'category': doc['knowledge_base__category'],
+            }
+            chunks = build_chunks(
+                str(doc['id']), doc['content'], base_metadata,
+                chunk_size, overlap, chunk_tokens, embedding_service
+            )
+            started = time.perf_counter()
+            embeddings = embedding_service.encode_documents([c['content'] for c in chunks])
+            encode_seconds += time.perf_counter() - started
+            results.append({
+                'document_id': str(doc['id']),
+                'title': doc['title'],
+                'status': 'ok',
+                'chunks': chunks,
+                'embeddings': embeddings,
+            })
+        except Exception as e:
+            results.append({'title': doc['title'], 'status': 'error', 'message': str(e)})
+
+    return {
+        'pid': os.getpid(),
+        'results': results,
+        'encode_seconds': encode_seconds,
+        'overflow': embedding_service.overflow_stats(),
+    }
+
+
+def init_worker(num_threads: int):
+    """
+    Inicializa Django en los procesos hijos (spawn) y reparte los núcleos
+    entre workers para que torch no los sobresuscriba.
+    """
+    import django
+    django.setup()
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
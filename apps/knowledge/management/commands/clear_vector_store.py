@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from apps.ai.services import RAGService
+from apps.ai.services import get_rag_service
 
 
 class Command(BaseCommand):
@@ -11,6 +11,11 @@ class Command(BaseCommand):
             action='store_true',
             help='Confirmar la eliminación sin preguntar'
         )
+        parser.add_argument(
+            '--knowledge-base',
+            type=str,
+            help='Limpiar solo los chunks de esta base de conocimiento'
+        )
 
     def handle(self, *args, **options):
         if not options['confirm']:
@@ -23,24 +28,27 @@ class Command(BaseCommand):
                 return
 
         try:
-            rag_service = RAGService()
+            rag_service = get_rag_service()
             
             # Obtener conteo antes de limpiar
-            count_before = rag_service.vector_store.count()
+            count_before = rag_service.count()
             
             self.stdout.write(f'Documentos en vector store: {count_before}')
             self.stdout.write('Limpiando vector store...')
             
             # Limpiar
-            rag_service.vector_store.clear()
+            if options['knowledge_base']:
+                rag_service.drop_knowledge_base(options['knowledge_base'])
+            else:
+                rag_service.clear()
             
             # Verificar
-            count_after = rag_service.vector_store.count()
+            count_after = rag_service.count()
             
             self.stdout.write(
                 self.style.SUCCESS(
                     f'✓ Vector store limpiado. '
-                    f'Eliminados {count_before} documentos'
+                    f'Eliminados {count_before - count_after} documentos'
                 )
             )
             self.stdout.write(f'Documentos restantes: {count_after}')
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.utils import timezone
+from apps.knowledge.models import KnowledgeBase
+from apps.ai.services import get_embedding_service, get_vector_store, get_vector_store_for
+from apps.ai.services.index_snapshot import DTYPES, SnapshotWriter, embedding_signature
+import time
+
+
+class Command(BaseCommand):
+    help = 'Exporta el vector store a un snapshot (tar con vectores, textos y metadatos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=str,
+            help='Ruta del snapshot (.tar o .tar.gz)'
+        )
+        parser.add_argument(
+            '--dtype',
+            choices=DTYPES,
+            default='float32',
+            help='Precisión de los vectores exportados (default: float32)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Registros por parte del snapshot (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        embedding_service = get_embedding_service()
+        header = {
+            **embedding_signature(embedding_service),
+            'created_at': timezone.now().isoformat(),
+            'backend': settings.VECTOR_STORE_BACKEND,
+            'sharding': settings.VECTOR_STORE_SHARDING,
+        }
+
+        # Colección global y, con sharding, la de cada base de conocimiento
+        stores = [get_vector_store()]
+        if settings.VECTOR_STORE_SHARDING == 'knowledge_base':
+            for knowledge_base_id in KnowledgeBase.objects.values_list('id', flat=True):
+                stores.append(get_vector_store_for(str(knowledge_base_id)))
+
+        started = time.perf_counter()
+        try:
+            with SnapshotWriter(options['output'], header, options['dtype']) as writer:
+                for vector_store in stores:
+                    for batch in vector_store.iter_records(batch_size=options['batch_size']):
+                        writer.write_batch(
+                            ids=batch['ids'],
+                            documents=batch['documents'],
+                            metadatas=batch['metadatas'],
+                            embeddings=batch['embeddings']
+                        )
+                    self.stdout.write(f'  {vector_store.name}: {writer.count} registros acumulados')
+        except Exception as e:
+            raise CommandError(f'Error al exportar el vector store: {str(e)}')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Exportados {writer.count} registros en {writer.parts} partes '
+            f'({options["dtype"]}, {elapsed:.1f}s) a {options["output"]}'
+        ))
@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from apps.ai.services import get_embedding_service, get_vector_store
+from apps.ai.services.projection import EmbeddingProjection, projection_dir, recall_at_k
+
+
+class Command(BaseCommand):
+    help = (
+        'Ajusta una proyección de dimensionalidad sobre una muestra del corpus '
+        'y reporta recall@k frente a la búsqueda en dimensión completa'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--components',
+            type=int,
+            nargs='+',
+            default=[128],
+            help='Dimensiones de salida a evaluar (default: 128)'
+        )
+        parser.add_argument(
+            '--method',
+            choices=EmbeddingProjection.METHODS,
+            default='pca',
+            help='Método de proyección (default: pca)'
+        )
+        parser.add_argument(
+            '--sample',
+            type=int,
+            default=5000,
+            help='Número de chunks del vector store a usar como muestra (default: 5000)'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Chunks de la muestra usados como consultas para medir recall (default: 200)'
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=5,
+            help='k para recall@k (default: 5)'
+        )
+        parser.add_argument(
+            '--save',
+            action='store_true',
+            help='Guardar cada proyección evaluada junto al modelo'
+        )
+
+    def handle(self, *args, **options):
+        embedding_service = get_embedding_service()
+        vector_store = get_vector_store()
+
+        sample = vector_store.sample(limit=options['sample'])
+        texts = [text for text in sample['documents'] if text]
+        if len(texts) <= options['queries']:
+            raise CommandError(
+                f'La muestra ({len(texts)} chunks) debe ser mayor que --queries '
+                f'({options["queries"]}). Indexa documentos primero.'
+            )
+
+        self.stdout.write(f'Vectorizando muestra de {len(texts)} chunks...')
+        full = embedding_service.encode(texts, project=False)
+        revision = embedding_service.revision
+        bytes_full = full.shape[1] * 4
+
+        self.stdout.write('\n' + '='*70)
+        self.stdout.write(
+            f'{"Dimensiones":>12} {"Varianza":>10} {"Recall@" + str(options["k"]):>10} '
+            f'{"Mínimo":>8} {"Bytes/vector":>13}  Versión'
+        )
+        self.stdout.write(
+            f'{full.shape[1]:>12} {"100.0%":>10} {"1.000":>10} {"1.000":>8} {bytes_full:>13}  (base)'
+        )
+
+        for n_components in options['components']:
+            projection = EmbeddingProjection.fit(
+                full,
+                n_components,
+                method=options['method'],
+                model_name=embedding_service.model_name,
+                revision=revision
+            )
+            metrics = recall_at_k(full, projection.transform(full), options['queries'], options['k'])
+            variance = (
+                f'{projection.explained_variance:.1%}'
+                if projection.explained_variance is not None else '-'
+            )
+            self.stdout.write(
+                f'{n_components:>12} {variance:>10} {metrics["recall"]:>10.3f} '
+                f'{metrics["min_recall"]:>8.3f} {n_components * 4:>13}  {projection.version}'
+            )
+
+            if options['save']:
+                path = projection.save(
+                    projection_dir(settings.EMBEDDING_PROJECTION_DIR, embedding_service.model_name, revision)
+                )
+                self.stdout.write(self.style.SUCCESS(f'{"":>12} Guardada en {path}'))
+
+        self.stdout.write('='*70)
+        if options['save']:
+            self.stdout.write(
+                '\nPara activarla define EMBEDDING_PROJECTION=<versión> y reindexa:\n'
+                '   python manage.py index_knowledge --clear'
+            )
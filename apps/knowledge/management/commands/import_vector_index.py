@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.ai.services import (
+    get_embedding_service, get_lexical_index, get_rag_service, get_vector_store_for
+)
+from apps.ai.services.index_snapshot import (
+    SnapshotError, SnapshotReader, check_compatible, embedding_signature
+)
+from collections import defaultdict
+import time
+
+
+class Command(BaseCommand):
+    help = 'Importa un snapshot del vector store en el backend configurado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'archive',
+            type=str,
+            help='Ruta del snapshot (.tar o .tar.gz)'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=('skip', 'upsert'),
+            default='upsert',
+            help='Qué hacer con los IDs ya indexados (default: upsert)'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Limpiar el vector store antes de importar'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            reader = SnapshotReader(options['archive'])
+        except (OSError, SnapshotError) as e:
+            raise CommandError(f'No se pudo abrir el snapshot: {str(e)}')
+
+        with reader:
+            header = reader.header
+            self.stdout.write(
+                f'Snapshot del {header.get("created_at")}: {header.get("embedding_model")} '
+                f'({header.get("dimension")} dims, {header.get("dtype")}, backend {header.get("backend")})'
+            )
+            try:
+                check_compatible(header, embedding_signature(get_embedding_service()))
+            except SnapshotError as e:
+                raise CommandError(str(e))
+
+            rag_service = get_rag_service()
+            if options['clear']:
+                self.stdout.write(self.style.WARNING('Limpiando vector store...'))
+                rag_service.clear()
+
+            lexical_index = get_lexical_index()
+            counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+            touched = set()
+            started = time.perf_counter()
+            try:
+                for batch in reader.iter_batches():
+                    # Cada registro va al shard de su base de conocimiento
+                    groups = defaultdict(list)
+                    for position, metadata in enumerate(batch['metadatas']):
+                        groups[(metadata or {}).get('knowledge_base_id')].append(position)
+
+                    for knowledge_base_id, positions in groups.items():
+                        touched.add(knowledge_base_id)
+                        written = get_vector_store_for(knowledge_base_id).write_documents(
+                            documents=[batch['documents'][i] for i in positions],
+                            embeddings=batch['embeddings'][positions],
+                            metadatas=[batch['metadatas'][i] for i in positions],
+                            ids=[batch['ids'][i] for i in positions],
+                            mode=options['mode']
+                        )
+                        for key in counts:
+                            counts[key] += written[key]
+
+                    if lexical_index is not None:
+                        lexical_index.index(
+                            ids=batch['ids'],
+                            documents=batch['documents'],
+                            metadatas=batch['metadatas']
+                        )
+                    self.stdout.write(f'  {sum(counts.values())} registros procesados')
+            except SnapshotError as e:
+                raise CommandError(
+                    f'Snapshot inválido: {str(e)}. Los lotes anteriores ya se importaron; '
+                    f'repite la importación con un archivo correcto'
+                )
+            finally:
+                # Las respuestas cacheadas de estas bases ya no son válidas
+                rag_service.index_versions.bump(touched)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Importados {reader.manifest["count"]} registros en {elapsed:.1f}s: '
+            f'{counts["inserted"]} nuevos, {counts["updated"]} actualizados, '
+            f'{counts["skipped"]} ya existentes omitidos'
+        ))
+        self.stdout.write(f'Chunks en vector store: {rag_service.count()}')
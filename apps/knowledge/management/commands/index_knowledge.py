@@ -1,8 +1,66 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from apps.knowledge.models import Document, KnowledgeBase
-from apps.ai.services import RAGService, FileProcessor
-from typing import Optional
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from apps.knowledge.models import Document
+from apps.ai.services import get_answer_cache, get_lexical_index, get_rag_service, get_vector_store_for
+from apps.knowledge.indexing import embed_documents, init_worker
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple
+import hashlib
+import multiprocessing
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Documentos que procesa cada tarea de un worker
+TASK_SIZE = 16
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Interpreta un shard con formato 'i/N' (0 <= i < N).
+    """
+    try:
+        index, total = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise CommandError(f"Shard inválido '{value}', usa el formato i/N (ej. 0/4)")
+    if total < 1 or not 0 <= index < total:
+        raise CommandError(f"Shard fuera de rango: {value}")
+    return index, total
+
+
+def in_shard(document_id, index: int, total: int) -> bool:
+    """
+    Partición determinista por ID de documento, estable entre nodos.
+    """
+    digest = hashlib.md5(str(document_id).encode('utf-8')).hexdigest()
+    return int(digest, 16) % total == index
+
+
+@contextmanager
+def vector_store_write_lock():
+    """
+    Lock de fichero para serializar escrituras de varios procesos
+    (p. ej. varios shards en la misma máquina) sobre el mismo vector store.
+    Vive en INDEX_LOCK_PATH, fuera del directorio de cualquier backend.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = Path(settings.INDEX_LOCK_PATH)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 class Command(BaseCommand):
@@ -22,7 +80,12 @@ class Command(BaseCommand):
         parser.add_argument(
             '--clear',
             action='store_true',
-            help='Limpiar el vector store antes de indexar'
+            help='Limpiar el vector store completo antes de indexar (también con --knowledge-base)'
+        )
+        parser.add_argument(
+            '--drop-knowledge-base',
+            action='store_true',
+            help='Borrar solo los chunks de --knowledge-base antes de indexarla'
         )
         parser.add_argument(
             '--chunk-size',
@@ -36,16 +99,48 @@ class Command(BaseCommand):
             default=50,
             help='Overlap entre chunks (default: 50)'
         )
+        parser.add_argument(
+            '--chunk-tokens',
+            type=int,
+            help='Trocear por tokens del modelo en lugar de caracteres (overlap en tokens)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Procesos que vectorizan en paralelo, cada uno con su modelo (default: 1)'
+        )
+        parser.add_argument(
+            '--shard',
+            type=str,
+            help='Procesar solo el shard i/N de los documentos (ej. 0/4), para repartir entre nodos'
+        )
+        parser.add_argument(
+            '--upsert',
+            action='store_true',
+            help='Reemplazar los chunks ya indexados en lugar de omitirlos'
+        )
 
     def handle(self, *args, **options):
-        rag_service = RAGService()
-        file_processor = FileProcessor()
+        shard = parse_shard(options['shard']) if options['shard'] else None
+        workers = max(1, options['workers'])
+
+        if options['clear'] and shard:
+            raise CommandError('--clear no puede combinarse con --shard: borraría el trabajo de otros shards')
+        if options['drop_knowledge_base'] and not options['knowledge_base']:
+            raise CommandError('--drop-knowledge-base requiere --knowledge-base')
 
         # Limpiar vector store si se solicita
         if options['clear']:
             self.stdout.write(self.style.WARNING('Limpiando vector store...'))
-            rag_service.vector_store.clear()
+            get_rag_service().clear()
             self.stdout.write(self.style.SUCCESS('Vector store limpiado'))
+        elif options['drop_knowledge_base']:
+            self.stdout.write(self.style.WARNING(
+                f'Eliminando los chunks de la base de conocimiento {options["knowledge_base"]}...'
+            ))
+            get_rag_service().drop_knowledge_base(options['knowledge_base'])
+            self.stdout.write(self.style.SUCCESS('Base de conocimiento limpiada'))
 
         # Filtrar documentos según opciones
         if options['document']:
@@ -61,107 +156,162 @@ class Command(BaseCommand):
         else:
             documents = Document.objects.filter(is_active=True)
 
-        total_docs = documents.count()
-        self.stdout.write(f'Encontrados {total_docs} documentos para indexar')
+        document_ids = [str(doc_id) for doc_id in documents.order_by('id').values_list('id', flat=True)]
+        if shard:
+            document_ids = [doc_id for doc_id in document_ids if in_shard(doc_id, *shard)]
+            self.stdout.write(f'Shard {shard[0]}/{shard[1]}')
 
-        indexed_count = 0
-        error_count = 0
-        total_chunks = 0
+        total_docs = len(document_ids)
+        self.stdout.write(f'Encontrados {total_docs} documentos para indexar ({workers} workers)')
 
-        for doc in documents:
-            try:
-                self.stdout.write(f'\nProcesando: {doc.title}')
-
-                # Determinar si es archivo o texto plano
-                if doc.file_url:
-                    # TODO: Descargar archivo desde URL
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'  Archivo externo no soportado aún: {doc.file_url}'
-                        )
-                    )
-                    continue
-
-                # Procesar contenido de texto
-                content = doc.content
-                
-                if not content or len(content.strip()) == 0:
-                    self.stdout.write(
-                        self.style.WARNING('  Documento sin contenido, omitiendo')
-                    )
-                    continue
-
-                # Dividir en chunks si es necesario
-                if len(content) > options['chunk_size']:
-                    chunks = file_processor.document_processor.chunk_text(
-                        content,
-                        chunk_size=options['chunk_size'],
-                        overlap=options['overlap']
+        tasks = [document_ids[i:i + TASK_SIZE] for i in range(0, total_docs, TASK_SIZE)]
+        self.indexed_count = 0
+        self.error_count = 0
+        self.total_chunks = 0
+        self.write_seconds = 0.0
+        self.write_mode = 'upsert' if options['upsert'] else 'skip'
+        self.write_counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        worker_stats: Dict[int, Dict] = {}
+        started = time.perf_counter()
+
+        if workers == 1:
+            for task in tasks:
+                batch = embed_documents(
+                    task, options['chunk_size'], options['overlap'], options['chunk_tokens']
+                )
+                self._store_batch(batch, worker_stats)
+        else:
+            context = multiprocessing.get_context('spawn')
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(threads_per_worker,)
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        embed_documents, task,
+                        options['chunk_size'], options['overlap'], options['chunk_tokens']
                     )
-                    
-                    # Indexar cada chunk
-                    for i, chunk in enumerate(chunks):
-                        chunk_id = f"{doc.id}-chunk-{i}"
-                        metadata = {
-                            'document_id': str(doc.id),
-                            'document_title': doc.title,
-                            'knowledge_base_id': str(doc.knowledge_base_id),
-                            'knowledge_base_title': doc.knowledge_base.title,
-                            'category': doc.knowledge_base.category,
-                            'chunk_index': i,
-                            'total_chunks': len(chunks)
-                        }
-                        
-                        rag_service.index_document(
-                            document_id=chunk_id,
-                            content=chunk,
-                            metadata=metadata
-                        )
-                        total_chunks += 1
-                    
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  ✓ Indexado en {len(chunks)} chunks'
-                        )
+                    for task in tasks
+                ]
+                for future in as_completed(futures):
+                    try:
+                        batch = future.result()
+                    except Exception as e:
+                        self.error_count += 1
+                        self.stdout.write(self.style.ERROR(f'  ✗ Error en worker: {str(e)}'))
+                        continue
+                    self._store_batch(batch, worker_stats)
+
+        elapsed = time.perf_counter() - started
+
+        # Resumen final
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS(f'Indexación completada'))
+        self.stdout.write(f'Documentos procesados: {self.indexed_count}/{total_docs}')
+        self.stdout.write(f'Total de chunks creados: {self.total_chunks}')
+        self.stdout.write(
+            f'Tiempo total: {elapsed:.1f}s '
+            f'({self.total_chunks / elapsed if elapsed else 0:.1f} chunks/s, '
+            f'escritura: {self.write_seconds:.1f}s)'
+        )
+        self.stdout.write(
+            f'Chunks escritos: {self.write_counts["inserted"]} nuevos, '
+            f'{self.write_counts["updated"]} actualizados, '
+            f'{self.write_counts["skipped"]} ya existentes omitidos'
+        )
+        for pid, stats in sorted(worker_stats.items()):
+            rate = stats['chunks'] / stats['encode_seconds'] if stats['encode_seconds'] else 0
+            self.stdout.write(
+                f'  Worker {pid}: {stats["documents"]} documentos, {stats["chunks"]} chunks, '
+                f'{stats["encode_seconds"]:.1f}s vectorizando ({rate:.1f} chunks/s)'
+            )
+            overflow = stats.get('overflow')
+            if overflow and overflow['overflowed']:
+                self.stdout.write(self.style.WARNING(
+                    f'    {overflow["overflowed"]} chunks superaron {overflow["max_tokens"]} tokens '
+                    f'({overflow["policy"]}, {overflow["tokens_dropped"]} tokens descartados). '
+                    f'Considera --chunk-tokens'
+                ))
+        if self.error_count > 0:
+            self.stdout.write(self.style.ERROR(f'Errores: {self.error_count}'))
+        # La indexación ha cambiado la versión de las bases tocadas: sus
+        # respuestas en caché ya no se pueden servir
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            self.stdout.write(f'Respuestas en caché caducadas eliminadas: {answer_cache.purge()}')
+        self.stdout.write('='*50)
+
+    def _store_batch(self, batch: Dict, worker_stats: Dict[int, Dict]) -> None:
+        """
+        Escribe en el vector store los resultados de una tarea. Cada
+        documento va al shard de su base de conocimiento.
+        """
+        stats = worker_stats.setdefault(
+            batch['pid'],
+            {'documents': 0, 'chunks': 0, 'encode_seconds': 0.0}
+        )
+        stats['encode_seconds'] += batch['encode_seconds']
+        stats['overflow'] = batch['overflow']
+
+        for result in batch['results']:
+            self.stdout.write(f'\nProcesando: {result["title"]}')
+
+            if result['status'] == 'skipped':
+                self.stdout.write(self.style.WARNING(f'  {result["message"]}'))
+                continue
+            if result['status'] == 'error':
+                self.error_count += 1
+                self.stdout.write(self.style.ERROR(f'  ✗ Error: {result["message"]}'))
+                continue
+
+            chunks = result['chunks']
+            try:
+                started = time.perf_counter()
+                vector_store = get_vector_store_for(chunks[0]['metadata']['knowledge_base_id'])
+                with vector_store_write_lock():
+                    written = vector_store.write_documents(
+                        documents=[c['content'] for c in chunks],
+                        embeddings=result['embeddings'],
+                        metadatas=[c['metadata'] for c in chunks],
+                        ids=[c['id'] for c in chunks],
+                        mode=self.write_mode
                     )
-                else:
-                    # Indexar documento completo
-                    metadata = {
-                        'document_id': str(doc.id),
-                        'document_title': doc.title,
-                        'knowledge_base_id': str(doc.knowledge_base_id),
-                        'knowledge_base_title': doc.knowledge_base.title,
-                        'category': doc.knowledge_base.category,
-                    }
-                    
-                    rag_service.index_document(
-                        document_id=str(doc.id),
-                        content=content,
-                        metadata=metadata
+                    # Quitar chunks que sobran si el documento encogió, o la
+                    # entrada duplicada de documento completo
+                    get_rag_service().delete_stale_chunks(
+                        result['document_id'], len(chunks),
+                        chunks[0]['metadata']['knowledge_base_id']
                     )
-                    total_chunks += 1
-                    
-                    self.stdout.write(
-                        self.style.SUCCESS('  ✓ Indexado como documento único')
+                for key in self.write_counts:
+                    self.write_counts[key] += written[key]
+
+                lexical_index = get_lexical_index()
+                if lexical_index is not None:
+                    lexical_index.index(
+                        ids=[c['id'] for c in chunks],
+                        documents=[c['content'] for c in chunks],
+                        metadatas=[c['metadata'] for c in chunks]
                     )
+                self.write_seconds += time.perf_counter() - started
 
                 # Actualizar embedding en el modelo
-                doc.embedding = {'indexed': True, 'chunks': total_chunks}
-                doc.save(update_fields=['embedding'])
-                
-                indexed_count += 1
-
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Error: {str(e)}')
+                Document.objects.filter(id=result['document_id']).update(
+                    embedding={'indexed': True, 'chunks': len(chunks)}
                 )
+            except Exception as e:
+                self.error_count += 1
+                self.stdout.write(self.style.ERROR(f'  ✗ Error: {str(e)}'))
+                continue
 
-        # Resumen final
-        self.stdout.write('\n' + '='*50)
-        self.stdout.write(self.style.SUCCESS(f'Indexación completada'))
-        self.stdout.write(f'Documentos procesados: {indexed_count}/{total_docs}')
-        self.stdout.write(f'Total de chunks creados: {total_chunks}')
-        if error_count > 0:
-            self.stdout.write(self.style.ERROR(f'Errores: {error_count}'))
-        self.stdout.write('='*50)
+            if len(chunks) > 1:
+                self.stdout.write(self.style.SUCCESS(f'  ✓ Indexado en {len(chunks)} chunks'))
+            else:
+                self.stdout.write(self.style.SUCCESS('  ✓ Indexado como documento único'))
+
+            self.indexed_count += 1
+            self.total_chunks += len(chunks)
+            stats['documents'] += 1
+            stats['chunks'] += len(chunks)
@@ -0,0 +1,185 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from apps.knowledge.models import Document, KnowledgeBase
+from apps.ai.services import get_lexical_index, get_rag_service, get_vector_store, get_vector_store_for
+from apps.ai.services.pgvector_store import uuid_or_none
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import re
+import time
+
+
+CHUNK_ID = re.compile(r'^(?P<document_id>.+)-chunk-(?P<chunk_index>\d+)$')
+CATEGORIES = ('orphan', 'stale_chunk', 'duplicate_whole', 'misplaced')
+
+
+def parse_entry(id: str, metadata: Optional[Dict]) -> Tuple[str, Optional[int]]:
+    """
+    Documento y número de chunk de una entrada del vector store. Usa los
+    metadatos y, si faltan (entradas antiguas), el formato del ID:
+    '<document_id>-chunk-<i>' para chunks y '<document_id>' para el
+    documento completo.
+    """
+    metadata = metadata or {}
+    document_id = metadata.get('document_id')
+    chunk_index = metadata.get('chunk_index')
+    match = CHUNK_ID.match(id)
+    if match:
+        document_id = document_id or match['document_id']
+        if chunk_index is None:
+            chunk_index = int(match['chunk_index'])
+    return str(document_id or id), chunk_index
+
+
+def classify(entries: Dict, expected_chunks: Optional[int]) -> Dict[str, List[str]]:
+    """
+    Decide qué entradas de un documento activo sobran. Nunca elimina todas:
+    si solo queda una forma de indexación (completa o por chunks) se conserva.
+
+    Args:
+        entries: {'whole': [ids], 'chunks': [(id, chunk_index, total_chunks)]}.
+        expected_chunks: Chunks de la indexación vigente (Document.embedding),
+                         o None si no consta.
+
+    Returns:
+        IDs a eliminar por categoría.
+    """
+    whole, chunks = entries['whole'], entries['chunks']
+    if expected_chunks is None:
+        # El chunk 0 se reescribe en cada indexación: su total es el vigente
+        expected_chunks = next((total for _, index, total in chunks if index == 0 and total), None)
+
+    remove = defaultdict(list)
+    if expected_chunks == 1:
+        if whole:
+            remove['stale_chunk'] = [id for id, _, _ in chunks]
+    elif expected_chunks:
+        current = [id for id, index, _ in chunks if index < expected_chunks]
+        if current:
+            remove['stale_chunk'] = [id for id, index, _ in chunks if index >= expected_chunks]
+            remove['duplicate_whole'] = list(whole)
+    elif whole and chunks:
+        remove['duplicate_whole'] = list(whole)
+    return remove
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el vector store con los documentos activos y elimina chunks '
+        'huérfanos, chunks sobrantes y entradas duplicadas de documento completo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Registros leídos y eliminados por lote (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar, sin eliminar nada'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        # Documentos activos: base de conocimiento y chunks de la indexación vigente
+        active = {
+            str(doc_id): (str(kb_id), (embedding or {}).get('chunks'))
+            for doc_id, kb_id, embedding in
+            Document.objects.filter(is_active=True).values_list('id', 'knowledge_base_id', 'embedding')
+        }
+
+        stores = [(None, get_vector_store())]
+        if settings.VECTOR_STORE_SHARDING == 'knowledge_base':
+            stores += [
+                (str(kb_id), get_vector_store_for(str(kb_id)))
+                for kb_id in KnowledgeBase.objects.values_list('id', flat=True)
+            ]
+
+        lexical_index = get_lexical_index()
+        totals = {category: 0 for category in CATEGORIES}
+        scanned = 0
+        orphan_documents = set()
+
+        for shard_kb_id, vector_store in stores:
+            # Primero se lee todo (solo IDs y metadatos) y después se borra:
+            # paginar por offset mientras se elimina se saltaría registros
+            by_document = defaultdict(lambda: {'whole': [], 'chunks': []})
+            store_scanned = 0
+            for batch in vector_store.iter_records(batch_size=batch_size, embeddings=False):
+                store_scanned += len(batch['ids'])
+                for id, metadata in zip(batch['ids'], batch['metadatas']):
+                    document_id, chunk_index = parse_entry(id, metadata)
+                    if chunk_index is None:
+                        by_document[document_id]['whole'].append(id)
+                    else:
+                        total = (metadata or {}).get('total_chunks')
+                        by_document[document_id]['chunks'].append((id, chunk_index, total))
+
+            remove = defaultdict(list)
+            for document_id, entries in by_document.items():
+                ids = entries['whole'] + [id for id, _, _ in entries['chunks']]
+                if document_id not in active:
+                    remove['orphan'] += ids
+                    orphan_documents.add(document_id)
+                    continue
+                kb_id, expected_chunks = active[document_id]
+                if shard_kb_id is not None and kb_id != shard_kb_id:
+                    remove['misplaced'] += ids
+                    continue
+                for category, category_ids in classify(entries, expected_chunks).items():
+                    remove[category] += category_ids
+
+            doomed = [id for category in CATEGORIES for id in remove[category]]
+            if doomed:
+                self.stdout.write(
+                    f'{vector_store.name}: {store_scanned} entradas, {len(doomed)} a eliminar ('
+                    + ', '.join(f'{category}: {len(remove[category])}' for category in CATEGORIES)
+                    + ')'
+                )
+            scanned += store_scanned
+            for category in CATEGORIES:
+                totals[category] += len(remove[category])
+
+            if options['dry_run']:
+                continue
+            for start in range(0, len(doomed), batch_size):
+                ids = doomed[start:start + batch_size]
+                vector_store.delete_documents(ids)
+                if lexical_index is not None:
+                    lexical_index.delete(ids)
+
+        if any(totals.values()) and not options['dry_run']:
+            # Invalida las respuestas cacheadas construidas con estos chunks
+            get_rag_service().index_versions.bump_all()
+
+        # Los documentos desactivados deben volver a indexarse si se reactivan
+        if orphan_documents and not options['dry_run']:
+            Document.objects.filter(
+                id__in=[doc_id for doc_id in orphan_documents if uuid_or_none(doc_id)],
+                is_indexed=True
+            ).update(is_indexed=False, embedding={})
+
+        elapsed = time.perf_counter() - started
+        reclaimed = sum(totals.values())
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(f'Entradas revisadas: {scanned}')
+        self.stdout.write(f'  Huérfanas (documento borrado o inactivo): {totals["orphan"]}')
+        self.stdout.write(f'  Chunks sobrantes de indexaciones anteriores: {totals["stale_chunk"]}')
+        self.stdout.write(f'  Duplicados de documento completo: {totals["duplicate_whole"]}')
+        self.stdout.write(f'  En el shard de otra base de conocimiento: {totals["misplaced"]}')
+        pct = reclaimed / scanned * 100 if scanned else 0
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Dry run: se eliminarían {reclaimed} entradas ({pct:.1f}%) en {elapsed:.1f}s'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Eliminadas {reclaimed} entradas ({pct:.1f}%) en {elapsed:.1f}s'
+            ))
+        self.stdout.write('='*50)
+
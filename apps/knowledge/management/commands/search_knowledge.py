@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from apps.ai.services import RAGService
+from apps.ai.services import get_rag_service
 
 
 class Command(BaseCommand):
@@ -22,9 +22,15 @@ class Command(BaseCommand):
             type=str,
             help='Filtrar por categoría'
         )
+        parser.add_argument(
+            '--knowledge-base',
+            type=str,
+            nargs='+',
+            help='Buscar solo en estas bases de conocimiento'
+        )
 
     def handle(self, *args, **options):
-        rag_service = RAGService()
+        rag_service = get_rag_service()
         query = options['query']
         n_results = options['n_results']
 
@@ -41,7 +47,8 @@ class Command(BaseCommand):
             results = rag_service.retrieve_context(
                 query=query,
                 n_results=n_results,
-                filters=filters
+                filters=filters,
+                knowledge_base_ids=options['knowledge_base']
             )
 
             if not results:
@@ -0,0 +1,234 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from apps.knowledge.models import KnowledgeBase
+from apps.ai.services import get_vector_store, get_vector_store_for
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Tuple
+import csv
+import tempfile
+import time
+
+import numpy as np
+
+
+def directory_size(path: str) -> int:
+    """
+    Tamaño en bytes de todos los ficheros bajo un directorio.
+    """
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Vecinos exactos por similitud coseno (vectores ya normalizados).
+
+    Returns:
+        Matriz (consultas, k) con los índices de los k vecinos más cercanos.
+    """
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Barre combinaciones de parámetros HNSW de ChromaDB y mide recall@k '
+        'frente a búsqueda exacta, latencia, tiempo de construcción y tamaño'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sample',
+            type=int,
+            default=5000,
+            help='Chunks indexados en cada índice de prueba (default: 5000)'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Chunks reservados como consultas, fuera del índice (default: 200)'
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=10,
+            help='Resultados por consulta para recall@k (default: 10)'
+        )
+        parser.add_argument(
+            '--m',
+            type=int,
+            nargs='+',
+            default=[8, 16, 32],
+            help='Valores de M a probar (default: 8 16 32)'
+        )
+        parser.add_argument(
+            '--construction-ef',
+            type=int,
+            nargs='+',
+            default=[100, 200],
+            help='Valores de construction_ef a probar (default: 100 200)'
+        )
+        parser.add_argument(
+            '--search-ef',
+            type=int,
+            nargs='+',
+            default=[10, 50, 100],
+            help='Valores de search_ef a probar (default: 10 50 100)'
+        )
+        parser.add_argument(
+            '--knowledge-base',
+            type=str,
+            help='Tomar la muestra solo de esta base de conocimiento'
+        )
+        parser.add_argument(
+            '--csv',
+            type=str,
+            help='Guardar los resultados en un CSV'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Semilla de la muestra aleatoria (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import chromadb
+            from chromadb.config import Settings
+            from apps.ai.services.vector_store import VectorStore
+        except ImportError:
+            raise CommandError('tune_hnsw necesita chromadb instalado')
+
+        k = options['k']
+        ids, embeddings = self._load_sample(options)
+        if len(ids) <= options['queries'] + k:
+            raise CommandError(
+                f'Muestra insuficiente: {len(ids)} chunks para {options["queries"]} consultas y k={k}'
+            )
+
+        rng = np.random.default_rng(options['seed'])
+        order = rng.permutation(len(ids))
+        query_rows = order[:options['queries']]
+        corpus_rows = order[options['queries']:options['queries'] + options['sample']]
+        corpus = embeddings[corpus_rows]
+        queries = embeddings[query_rows]
+        corpus_ids = [ids[i] for i in corpus_rows]
+
+        started = time.perf_counter()
+        truth = exact_top_k(corpus, queries, k)
+        truth_sets = [{corpus_ids[i] for i in row} for row in truth]
+        self.stdout.write(
+            f'Muestra: {len(corpus_ids)} chunks, {len(queries)} consultas, '
+            f'{corpus.shape[1]} dims. Ground truth exacto en {time.perf_counter() - started:.2f}s'
+        )
+
+        rows = []
+        combinations = list(product(options['m'], options['construction_ef'], options['search_ef']))
+        for m, construction_ef, search_ef in combinations:
+            hnsw = {'M': m, 'construction_ef': construction_ef, 'search_ef': search_ef}
+            with tempfile.TemporaryDirectory(prefix='tune_hnsw_') as path:
+                client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+                store = VectorStore(collection_name='tune_hnsw', client=client, hnsw=hnsw)
+
+                started = time.perf_counter()
+                store.write_documents(
+                    documents=['' for _ in corpus_ids],
+                    embeddings=corpus,
+                    metadatas=[{'sample': True} for _ in corpus_ids],
+                    ids=corpus_ids
+                )
+                build_seconds = time.perf_counter() - started
+
+                recall, latencies = self._run_queries(store, queries, truth_sets, k)
+                rows.append({
+                    'M': m,
+                    'construction_ef': construction_ef,
+                    'search_ef': search_ef,
+                    f'recall@{k}': round(recall, 4),
+                    'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                    'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                    'build_s': round(build_seconds, 2),
+                    'size_mb': round(directory_size(path) / (1024 * 1024), 2),
+                })
+                # Liberar el sistema de ChromaDB asociado al directorio temporal
+                clear_cache = getattr(client, 'clear_system_cache', None)
+                if clear_cache:
+                    clear_cache()
+            self.stdout.write(f'  M={m} construction_ef={construction_ef} search_ef={search_ef}: ok')
+
+        self._print_table(rows)
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            self.stdout.write(self.style.SUCCESS(f'✓ Resultados guardados en {options["csv"]}'))
+
+    def _load_sample(self, options) -> Tuple[List[str], np.ndarray]:
+        """
+        Lee del vector store configurado los chunks necesarios para la
+        muestra y las consultas, normalizados.
+        """
+        wanted = options['sample'] + options['queries']
+        if options['knowledge_base']:
+            stores = [get_vector_store_for(options['knowledge_base'])]
+        else:
+            stores = [get_vector_store()]
+            if settings.VECTOR_STORE_SHARDING == 'knowledge_base':
+                stores += [
+                    get_vector_store_for(str(knowledge_base_id))
+                    for knowledge_base_id in KnowledgeBase.objects.values_list('id', flat=True)
+                ]
+
+        ids: List[str] = []
+        batches: List[np.ndarray] = []
+        for vector_store in stores:
+            for batch in vector_store.iter_records():
+                ids.extend(batch['ids'])
+                batches.append(batch['embeddings'])
+                if len(ids) >= wanted:
+                    break
+            if len(ids) >= wanted:
+                break
+        if not batches:
+            return [], np.empty((0, 0), dtype=np.float32)
+
+        embeddings = np.concatenate(batches)[:wanted]
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return ids[:wanted], embeddings / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _run_queries(store, queries: np.ndarray, truth_sets: List[set], k: int) -> Tuple[float, List[float]]:
+        """
+        Lanza las consultas una a una contra la colección.
+
+        Returns:
+            recall@k medio y latencias en milisegundos.
+        """
+        # Primera consulta fuera de la medición: carga el índice en memoria
+        store.collection.query(query_embeddings=[queries[0].tolist()], n_results=k, include=['distances'])
+
+        hits = 0
+        latencies = []
+        for query, truth in zip(queries, truth_sets):
+            started = time.perf_counter()
+            result = store.collection.query(
+                query_embeddings=[query.tolist()],
+                n_results=k,
+                include=['distances']
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(truth.intersection(result['ids'][0]))
+        return hits / (k * len(truth_sets)), latencies
+
+    def _print_table(self, rows: List[Dict]) -> None:
+        columns = list(rows[0])
+        widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+        self.stdout.write('\n' + '  '.join(c.rjust(widths[c]) for c in columns))
+        self.stdout.write('  '.join('-' * widths[c] for c in columns))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[c]).rjust(widths[c]) for c in columns))
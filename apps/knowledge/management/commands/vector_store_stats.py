@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from apps.ai.services import RAGService
+from apps.ai.services import get_rag_service
 from apps.knowledge.models import Document
 
 
@@ -7,7 +7,7 @@ class Command(BaseCommand):
     help = 'Muestra estadísticas del vector store y la base de conocimiento'
 
     def handle(self, *args, **options):
-        rag_service = RAGService()
+        rag_service = get_rag_service()
 
         self.stdout.write('\n' + '='*50)
         self.stdout.write(self.style.SUCCESS('ESTADÍSTICAS DEL SISTEMA'))
@@ -15,7 +15,7 @@ class Command(BaseCommand):
 
         # Estadísticas del vector store
         try:
-            vector_count = rag_service.vector_store.count()
+            vector_count = rag_service.count()
             self.stdout.write(f'\n📊 Vector Store:')
             self.stdout.write(f'   Documentos indexados: {vector_count}')
         except Exception as e:
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0003_document_file_document_file_type_document_indexed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='knowledgebase',
+            name='lexical_weight',
+            field=models.FloatField(default=1.0),
+        ),
+    ]
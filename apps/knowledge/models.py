@@ -8,6 +8,8 @@ class KnowledgeBase(BaseModel):
     description = models.TextField(blank=True, null=True)
     category = models.CharField(max_length=100)
     is_public = models.BooleanField(default=True)
+    # Peso de la búsqueda léxica frente a la vectorial en la fusión híbrida
+    lexical_weight = models.FloatField(default=1.0)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
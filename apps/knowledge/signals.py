@@ -1,9 +1,10 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 import logging
 
-from .models import Document
+from .models import Document, KnowledgeBase
 
 logger = logging.getLogger(__name__)
 
@@ -16,13 +17,14 @@ def auto_index_document(sender, instance, created, **kwargs):
     # Solo indexar si tiene contenido y no está indexado
     if instance.content and not instance.is_indexed:
         try:
-            from apps.ai.services import RAGService
+            from apps.ai.services import get_rag_service
             
-            rag = RAGService()
+            rag = get_rag_service()
             
             # Preparar metadata
             metadata = instance.metadata.copy() if instance.metadata else {}
             metadata.update({
+                'document_id': str(instance.id),
                 'title': instance.title,
                 'knowledge_base_id': str(instance.knowledge_base_id),
                 'file_type': instance.file_type or 'text',
@@ -36,13 +38,29 @@ def auto_index_document(sender, instance, created, **kwargs):
                 metadata=metadata
             )
             
+            # Quitar los chunks de una indexación anterior por trozos
+            rag.delete_stale_chunks(str(instance.id), 1, str(instance.knowledge_base_id))
+            
             # Marcar como indexado
             Document.objects.filter(id=instance.id).update(
                 is_indexed=True,
-                indexed_at=timezone.now()
+                indexed_at=timezone.now(),
+                embedding={'indexed': True, 'chunks': 1}
             )
             
             logger.info(f"Documento '{instance.title}' indexado exitosamente en ChromaDB")
             
         except Exception as e:
             logger.error(f"Error al indexar documento '{instance.title}': {e}")
+
+
+@receiver(post_save, sender=KnowledgeBase)
+@receiver(post_delete, sender=KnowledgeBase)
+def bump_knowledge_base_version(sender, instance, **kwargs):
+    """
+    Signal para invalidar la lista de shards activos y las respuestas en
+    caché de una base de conocimiento cuando se guarda o se borra.
+    """
+    from apps.ai.services.answer_cache import IndexVersions
+
+    IndexVersions(cache_alias=settings.EMBEDDING_CACHE_ALIAS).bump([str(instance.id)])
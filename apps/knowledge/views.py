@@ -141,28 +141,34 @@ class DocumentViewSet(viewsets.ModelViewSet):
         document = self.get_object()
         
         try:
-            from apps.ai.services import RAGService
+            from apps.ai.services import get_rag_service
             
-            rag = RAGService()
+            rag = get_rag_service()
             
             # Preparar metadata
             metadata = document.metadata.copy() if document.metadata else {}
             metadata.update({
+                'document_id': str(document.id),
                 'title': document.title,
                 'knowledge_base_id': str(document.knowledge_base_id),
                 'file_type': document.file_type or 'text',
             })
             
-            # Re-indexar
+            # Re-indexar (reemplaza el vector existente)
             rag.index_document(
                 document_id=str(document.id),
                 content=document.content,
-                metadata=metadata
+                metadata=metadata,
+                mode='upsert'
             )
             
+            # Quitar los chunks de una indexación anterior por trozos
+            rag.delete_stale_chunks(str(document.id), 1, str(document.knowledge_base_id))
+            
             # Actualizar estado
             document.is_indexed = True
             document.indexed_at = timezone.now()
+            document.embedding = {'indexed': True, 'chunks': 1}
             document.save()
             
             return Response({
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+import pgvector.django
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('knowledge', '0004_knowledgebase_lexical_weight'),
+    ]
+
+    operations = [
+        pgvector.django.VectorExtension(),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(db_index=True, max_length=255)),
+                ('vector_id', models.CharField(max_length=255)),
+                ('chunk_index', models.IntegerField(blank=True, null=True)),
+                ('content', models.TextField()),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('embedding', pgvector.django.VectorField(blank=True, dimensions=384, null=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='knowledge.document')),
+                ('knowledge_base', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='knowledge.knowledgebase')),
+            ],
+            options={
+                'verbose_name': 'Chunk de Documento',
+                'verbose_name_plural': 'Chunks de Documentos',
+                'db_table': 'document_chunks',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='documentchunk',
+            constraint=models.UniqueConstraint(fields=('collection', 'vector_id'), name='document_chunks_collection_vector_id'),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=pgvector.django.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='document_chunks_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='document_chunks_search_gin'),
+        ),
+    ]
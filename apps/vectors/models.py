@@ -0,0 +1,66 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+from pgvector.django import HnswIndex, VectorField
+
+# Dimensión de la columna vector, fija en la migración 0001. Debe coincidir
+# con el modelo (o la proyección) de embeddings; cambiarla requiere una
+# migración nueva que altere la columna y reindexar.
+EMBEDDING_DIMENSIONS = 384
+
+
+class DocumentChunk(models.Model):
+    """
+    Chunk de un documento. Guarda el vector (backend 'pgvector' del vector
+    store) y/o el texto para la búsqueda léxica de la recuperación híbrida.
+    """
+    collection = models.CharField(max_length=255, db_index=True)
+    vector_id = models.CharField(max_length=255)
+    document = models.ForeignKey(
+        'knowledge.Document',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='chunks'
+    )
+    knowledge_base = models.ForeignKey(
+        'knowledge.KnowledgeBase',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='chunks'
+    )
+    chunk_index = models.IntegerField(null=True, blank=True)
+    content = models.TextField()
+    metadata = models.JSONField(default=dict, blank=True)
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS, null=True, blank=True)
+    search_vector = SearchVectorField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'document_chunks'
+        verbose_name = 'Chunk de Documento'
+        verbose_name_plural = 'Chunks de Documentos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['collection', 'vector_id'],
+                name='document_chunks_collection_vector_id'
+            ),
+        ]
+        indexes = [
+            HnswIndex(
+                name='document_chunks_embedding_hnsw',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_cosine_ops']
+            ),
+            GinIndex(
+                name='document_chunks_search_gin',
+                fields=['search_vector']
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.collection}:{self.vector_id}"
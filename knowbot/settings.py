@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import json
 from pathlib import Path
 from decouple import config
 
@@ -231,6 +232,132 @@ CELERY_TIMEZONE = TIME_ZONE
 
 # AI Services
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+GEMINI_MODEL_NAME = config('GEMINI_MODEL_NAME', default='gemini-2.5-flash')
+EMBEDDING_MODEL_NAME = config('EMBEDDING_MODEL_NAME', default='paraphrase-multilingual-MiniLM-L12-v2')
+EMBEDDING_MODEL_REVISION = config('EMBEDDING_MODEL_REVISION', default=None)
+
+# Backend de inferencia: 'torch', 'onnx' u 'onnx-int8' (ONNX Runtime)
+EMBEDDING_BACKEND = config('EMBEDDING_BACKEND', default='torch')
+EMBEDDING_ONNX_DIR = config('EMBEDDING_ONNX_DIR', default=str(BASE_DIR / 'onnx_models'))
+EMBEDDING_ONNX_PARITY_THRESHOLD = config('EMBEDDING_ONNX_PARITY_THRESHOLD', default=0.98, cast=float)
+
+# Proyección opcional a menos dimensiones (ver fit_embedding_projection).
+# Cambiarla requiere reindexar con: python manage.py index_knowledge --clear
+EMBEDDING_PROJECTION_DIR = config('EMBEDDING_PROJECTION_DIR', default=str(BASE_DIR / 'embedding_projections'))
+EMBEDDING_PROJECTION = config('EMBEDDING_PROJECTION', default='')
+
+# Inferencia de embeddings: hilo dedicado con micro-batching y prioridades
+# (desactivado por defecto: se codifica en el hilo que hace la petición)
+EMBEDDING_SCHEDULER_ENABLED = config('EMBEDDING_SCHEDULER_ENABLED', default=False, cast=bool)
+EMBEDDING_MAX_BATCH_SIZE = config('EMBEDDING_MAX_BATCH_SIZE', default=32, cast=int)
+EMBEDDING_BATCH_WINDOW_MS = config('EMBEDDING_BATCH_WINDOW_MS', default=5.0, cast=float)
+EMBEDDING_TORCH_THREADS = config('EMBEDDING_TORCH_THREADS', default=0, cast=int)
+EMBEDDING_DOCUMENT_SLICE_SIZE = config('EMBEDDING_DOCUMENT_SLICE_SIZE', default=2048, cast=int)
+# Documentos que superan max_seq_length: 'truncate' (recortar y reportar) o 'split'
+EMBEDDING_OVERFLOW_POLICY = config('EMBEDDING_OVERFLOW_POLICY', default='truncate')
+
+# Caché persistente de embeddings (vectores float32 en EMBEDDING_CACHE_ALIAS).
+# El desalojo LRU por EMBEDDING_CACHE_MAX_ENTRIES requiere django-redis; con
+# otros backends solo aplican EMBEDDING_CACHE_TIMEOUT y los límites del backend
+EMBEDDING_CACHE_ENABLED = config('EMBEDDING_CACHE_ENABLED', default=False, cast=bool)
+EMBEDDING_CACHE_ALIAS = config('EMBEDDING_CACHE_ALIAS', default='default')
+EMBEDDING_CACHE_MAX_ENTRIES = config('EMBEDDING_CACHE_MAX_ENTRIES', default=200000, cast=int)
+EMBEDDING_CACHE_TIMEOUT = config('EMBEDDING_CACHE_TIMEOUT', default=60 * 60 * 24 * 30, cast=int)
+
+# Caché LRU de embeddings de consultas frecuentes
+QUERY_CACHE_ENABLED = config('QUERY_CACHE_ENABLED', default=False, cast=bool)
+QUERY_CACHE_MAX_SIZE = config('QUERY_CACHE_MAX_SIZE', default=1000, cast=int)
+QUERY_CACHE_TTL = config('QUERY_CACHE_TTL', default=60 * 60, cast=int)
+QUERY_CACHE_SHARED = config('QUERY_CACHE_SHARED', default=False, cast=bool)
+
+# Vector Store: 'chroma' (HNSW persistente), 'numpy' (búsqueda exacta en memoria,
+# recomendado hasta unos cientos de miles de chunks) o 'pgvector' (tabla
+# document_chunks en la base de datos principal)
+VECTOR_STORE_BACKEND = config('VECTOR_STORE_BACKEND', default='chroma')
+CHROMA_DB_PATH = config('CHROMA_DB_PATH', default=str(BASE_DIR / 'chroma_db'))
+CHROMA_COLLECTION_NAME = config('CHROMA_COLLECTION_NAME', default='knowbot_knowledge')
+# Parámetros HNSW de ChromaDB (0 = valor por defecto de ChromaDB). Más M y
+# construction_ef mejoran el recall a costa de memoria y tiempo de indexación;
+# más search_ef mejora el recall a costa de latencia. CHROMA_HNSW_COLLECTIONS
+# los sobrescribe por colección, p. ej. {"knowbot_knowledge_kb_<id>": {"search_ef": 64}}.
+# Mide combinaciones con: python manage.py tune_hnsw
+CHROMA_HNSW_M = config('CHROMA_HNSW_M', default=0, cast=int)
+CHROMA_HNSW_CONSTRUCTION_EF = config('CHROMA_HNSW_CONSTRUCTION_EF', default=0, cast=int)
+CHROMA_HNSW_SEARCH_EF = config('CHROMA_HNSW_SEARCH_EF', default=0, cast=int)
+CHROMA_HNSW_COLLECTIONS = config('CHROMA_HNSW_COLLECTIONS', default='{}', cast=json.loads)
+NUMPY_VECTOR_STORE_PATH = config('NUMPY_VECTOR_STORE_PATH', default=str(BASE_DIR / 'numpy_vectors'))
+# Sharding: 'none' (una colección global) o 'knowledge_base' (una colección por
+# base de conocimiento, búsquedas en paralelo). Cambiarlo requiere reindexar.
+VECTOR_STORE_SHARDING = config('VECTOR_STORE_SHARDING', default='none')
+VECTOR_STORE_SEARCH_WORKERS = config('VECTOR_STORE_SEARCH_WORKERS', default=8, cast=int)
+# Hilos de la API asíncrona de recuperación (aretrieve_context), separados del
+# executor por defecto del event loop
+VECTOR_STORE_ASYNC_WORKERS = config('VECTOR_STORE_ASYNC_WORKERS', default=4, cast=int)
+# Fichero de lock con el que index_knowledge serializa las escrituras de varios
+# procesos en la misma máquina (independiente del backend)
+INDEX_LOCK_PATH = config('INDEX_LOCK_PATH', default=str(BASE_DIR / '.index_knowledge.lock'))
+
+# Recuperación híbrida: búsqueda léxica (full-text de Postgres en español) y
+# vectorial en paralelo, fusionadas con Reciprocal Rank Fusion. El peso léxico
+# se ajusta por base de conocimiento (KnowledgeBase.lexical_weight).
+# Desactivada por defecto: guarda una copia del texto de cada chunk y su
+# tsvector en document_chunks (app apps.vectors, requiere la extensión pgvector)
+# y exige reindexar con index_knowledge para poblar el índice léxico.
+HYBRID_SEARCH_ENABLED = config('HYBRID_SEARCH_ENABLED', default=False, cast=bool)
+HYBRID_CANDIDATES = config('HYBRID_CANDIDATES', default=20, cast=int)
+HYBRID_RRF_K = config('HYBRID_RRF_K', default=60, cast=int)
+# Diversificación del contexto: se recuperan RAG_MMR_CANDIDATES candidatos, se
+# fusionan los chunks contiguos de un mismo documento y se eligen los finales con
+# Maximal Marginal Relevance (1.0 = solo relevancia, menos = más diversidad).
+# Desactivada por defecto (1.0 y sin fusión) porque cambia el orden de los
+# resultados; prueba por ejemplo RAG_MMR_LAMBDA=0.7 y RAG_MERGE_ADJACENT_CHUNKS=True.
+# Coste extra por consulta: MMR necesita el vector de cada candidato. Los de la vía
+# vectorial lo traen en la búsqueda; los que solo encontró la léxica se leen del
+# store (una consulta más por store) y, si no están, se codifican en el carril de
+# consultas, como mucho RAG_MMR_MAX_ENCODE por consulta (el resto queda fuera y
+# se registra en el log).
+RAG_MMR_LAMBDA = config('RAG_MMR_LAMBDA', default=1.0, cast=float)
+RAG_MMR_CANDIDATES = config('RAG_MMR_CANDIDATES', default=20, cast=int)
+RAG_MMR_MAX_ENCODE = config('RAG_MMR_MAX_ENCODE', default=8, cast=int)
+RAG_MERGE_ADJACENT_CHUNKS = config('RAG_MERGE_ADJACENT_CHUNKS', default=False, cast=bool)
+# Small-to-big: cada chunk recuperado se amplía con RAG_WINDOW_SIZE chunks vecinos a
+# cada lado (0 = desactivado). Permite indexar chunks pequeños y precisos sin
+# perder contexto en la respuesta.
+RAG_WINDOW_SIZE = config('RAG_WINDOW_SIZE', default=0, cast=int)
+# Reranking con cross-encoder: se puntúan RAG_RERANK_CANDIDATES candidatos y solo
+# pasan al prompt los que superan RAG_RERANK_THRESHOLD (puntuación en [0, 1]).
+# Las puntuaciones se cachean en EMBEDDING_CACHE_ALIAS.
+RAG_RERANK_ENABLED = config('RAG_RERANK_ENABLED', default=False, cast=bool)
+RAG_RERANK_MODEL = config('RAG_RERANK_MODEL', default='cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+RAG_RERANK_MODEL_REVISION = config('RAG_RERANK_MODEL_REVISION', default='')
+RAG_RERANK_CANDIDATES = config('RAG_RERANK_CANDIDATES', default=20, cast=int)
+RAG_RERANK_THRESHOLD = config('RAG_RERANK_THRESHOLD', default=0.1, cast=float)
+RAG_RERANK_BATCH_SIZE = config('RAG_RERANK_BATCH_SIZE', default=32, cast=int)
+RAG_RERANK_CACHE_TIMEOUT = config('RAG_RERANK_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+
+# Presupuesto de tokens del prompt (contados con el tokenizer del modelo de
+# embeddings). El contexto se llena primero, por relevancia; el historial usa
+# lo que quede hasta su tope.
+PROMPT_MAX_TOKENS = config('PROMPT_MAX_TOKENS', default=3000, cast=int)
+PROMPT_MAX_CONTEXT_TOKENS = config('PROMPT_MAX_CONTEXT_TOKENS', default=2000, cast=int)
+PROMPT_MAX_HISTORY_TOKENS = config('PROMPT_MAX_HISTORY_TOKENS', default=800, cast=int)
+
+# Caché semántica de respuestas: una pregunta con similitud >= ANSWER_CACHE_THRESHOLD
+# con otra ya respondida (mismas bases de conocimiento, misma versión del índice)
+# recibe la respuesta guardada. Ignora el historial de la conversación, por eso el
+# umbral es alto y está desactivada por defecto.
+ANSWER_CACHE_ENABLED = config('ANSWER_CACHE_ENABLED', default=False, cast=bool)
+ANSWER_CACHE_THRESHOLD = config('ANSWER_CACHE_THRESHOLD', default=0.95, cast=float)
+ANSWER_CACHE_TTL = config('ANSWER_CACHE_TTL', default=60 * 60 * 24, cast=int)
+ANSWER_CACHE_COLLECTION = config('ANSWER_CACHE_COLLECTION', default=f'{CHROMA_COLLECTION_NAME}_answers')
+# La dimensión de la columna vector es fija (384, apps.vectors.models.EMBEDDING_DIMENSIONS)
+PGVECTOR_EF_SEARCH = config('PGVECTOR_EF_SEARCH', default=0, cast=int)
+
+# La tabla document_chunks (y la extensión pgvector) solo se instala con el
+# backend 'pgvector' o con la búsqueda híbrida; con Chroma o NumPy sobre un
+# PostgreSQL sin pgvector las migraciones no cambian.
+if VECTOR_STORE_BACKEND == 'pgvector' or HYBRID_SEARCH_ENABLED:
+    INSTALLED_APPS.append('apps.vectors')
 
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'